@@ -31,10 +31,43 @@ class AppSettings(BaseSettings) :
     QDRANT_DATABASE_PORT:int = 6333
     USE_QDRANT_CLOUD:bool = False
     QDRANT_API_KEY:str | None = None
+    # gRPC transport (QDRANT_GRPC_PORT) for the searches and uploads, lower latency than REST
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    # Connection pool of the process wide client : open connections (REST), kept alive between requests
+    QDRANT_MAX_CONNECTIONS: int = 32
+    QDRANT_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    # Per request timeout
+    QDRANT_TIMEOUT_SECONDS: int = 10
+    # in-process Qdrant eg: ":memory:" or a local path, for tests and benchmarks. Takes precedence over host / cloud
+    QDRANT_LOCATION: str | None = None
+    # HNSW index of the vector collections : m (links per node), ef_construct (build time beam), payload_m (links per
+    # node of the per author graphs, built along the tenant payload index) and hnsw_ef (search time beam)
+    QDRANT_HNSW_CONFIG: dict[str, dict[str, int]] = {
+        "vector_posts": {"m": 16, "ef_construct": 100, "payload_m": 16, "hnsw_ef": 128},
+        "vector_articles": {"m": 16, "ef_construct": 100, "payload_m": 16, "hnsw_ef": 128},
+        "vector_repositories": {"m": 16, "ef_construct": 200, "payload_m": 16, "hnsw_ef": 128},
+    }
+    # Vector storage of the vector collections : quantization, "scalar" (int8, 4x less RAM), "binary" (1 bit per
+    # dimension, 32x less RAM, for large models) or None (float32 only), on_disk (original vectors on disk, only the
+    # quantized ones in RAM) and oversampling (limit x oversampling candidates are found with the quantized vectors,
+    # then rescored with the original ones)
+    QDRANT_VECTOR_STORAGE_CONFIG: dict[str, dict] = {
+        "vector_posts": {"quantization": None, "on_disk": False, "oversampling": 2.0},
+        "vector_articles": {"quantization": None, "on_disk": False, "oversampling": 2.0},
+        "vector_repositories": {"quantization": None, "on_disk": False, "oversampling": 2.0},
+    }
 
     # OpenAI config
     OPENAI_MODEL_ID: str = "gpt-4o-mini"
     OPENAI_API_KEY: SecretStr | None = None
+    # OpenAI compatible endpoint eg: a proxy or a local mock server. None = api.openai.com
+    OPENAI_BASE_URL: str | None = None
+    # Per request timeout of the LLM calls of retrieval (query expansion, self query). On timeout, retrieval goes on
+    # with the raw query / without author filter
+    RETRIEVER_LLM_TIMEOUT_SECONDS: float = 5
+    # Fusion of the hits of the expanded queries before reranking : "rrf" (Reciprocal Rank Fusion) or "max" (best score)
+    RETRIEVER_HIT_FUSION: str = "rrf"
 
     # CometML config
     COMET_API_KEY: str | None = None
@@ -67,10 +100,27 @@ class AppSettings(BaseSettings) :
     EMBEDDING_MODEL_FOR_CODE_ID: str = "BAAI/bge-large-en-v1.5"
     EMBEDDING_MODEL_FOR_CODE_VECTOR_LENGTH: int = 1024    # max input text length for code embeddings
     EMBEDDING_MODEL_DEVICE: str = "cpu"
+    # max # of (padded) tokens per encode call. Chunks are bucketed by length and packed up to this budget
+    EMBEDDING_BATCH_TOKEN_BUDGET: int = 16384   # eg: 32 chunks of 512 tokens or 256 chunks of 64 tokens
+    EMBEDDING_CODE_BATCH_TOKEN_BUDGET: int = 8192
     EMBEDDING_MODEL_GPU_DEVICE: str = "cuda"
+    # inference backend of the embedding models : "torch", "onnx" or "onnx-int8" (ONNX Runtime, dynamic int8 quantization)
+    EMBEDDING_MODEL_BACKEND: str = "torch"
+    # int8 kernels to target : "arm64", "avx2", "avx512" or "avx512_vnni"
+    EMBEDDING_ONNX_QUANTIZATION_CONFIG: str = "avx2"
+    # where quantized models are exported, once
+    EMBEDDING_ONNX_EXPORT_DIR: str = "onnx_models"
+    # LRU cache of the embeddings of retrieval queries, per model. Repeated questions are not re-embedded
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = 10_000
 
     CROSS_ENCODER_MODEL_ID: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     CROSS_ENCODER_MODEL_DEVICE: str = "cpu" # or cuda
+    # (query, passage) pairs per predict call. Pairs are sorted by length first, so batches are evenly padded
+    CROSS_ENCODER_BATCH_SIZE: int = 32
+    # LRU cache of the cross-encoder scores, keyed on query + passage hash
+    CROSS_ENCODER_SCORE_CACHE_MAX_ENTRIES: int = 100_000
+    # Reranking of the retrieved hits : "llm" (one GPT call per request) or "crossencoder" (local model)
+    RERANKER_MODE: str = "llm"
 
     # Opik config
     OPIK_API_KEY: str | None = None
@@ -11,14 +11,18 @@ logger = get_logger(__file__)
 
 class RabbitMQConnection :
     """
-    Singleton class of Rabbit MQ connection
+    Singleton class of Rabbit MQ connection. Pass shared=False to get a dedicated (non singleton) connection,
+    eg: for consumers where each Bytewax partition must own its connection.
     """
 
     _instance: Self = None
 
-    def __new__(cls, *args, **kwargs) -> Self :
+    def __new__(cls, *args, shared: bool = True, **kwargs) -> Self :
+        if not shared:
+            return super().__new__(cls)
+
         if not cls._instance:
-            cls._instance = super().__new__(cls, *args, **kwargs)
+            cls._instance = super().__new__(cls)
 
         return cls._instance
 
@@ -100,7 +104,8 @@ class RabbitMQConnection :
     def close(self) :
         if self.is_connected():
             self._connection.close()
-            self._connection = None
             logger.info("RabbitMQ connection closed")
+        # a connection closed by the broker is dropped too, connect() opens a new one
+        self._connection = None
 
 
@@ -1,3 +1,10 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
 from core.logger_utils import get_logger
 from core.config import settings
 
@@ -7,19 +14,91 @@ logger = get_logger(__name__)
 
 
 class CrossEncoderModelSingleton:
+    """Cross-encoder scoring (query, passage) pairs, loaded once per process : use get_instance().
+
+    Pairs are sorted by length before batching, so each batch is padded to similar lengths. Scores are kept in an
+    LRU cache keyed on the query and the passage hash, identical passages are scored once.
+    """
+
+    _instance: Optional["CrossEncoderModelSingleton"] = None
+    _instance_lock = threading.Lock()
+
     def __init__(self,
             model_id: str = settings.CROSS_ENCODER_MODEL_ID,
-            device:str = settings.EMBEDDING_MODEL_DEVICE):
+            device:str = settings.CROSS_ENCODER_MODEL_DEVICE,
+            batch_size: int = settings.CROSS_ENCODER_BATCH_SIZE,
+            max_cached_scores: int = settings.CROSS_ENCODER_SCORE_CACHE_MAX_ENTRIES):
 
         self._model_id = model_id
         self._device = device
+        self._batch_size = batch_size
+        self._max_cached_scores = max_cached_scores
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
 
-        self._model = CrossEncoder(model_name=self.model_id, device=self.device)
+        logger.info(f"Loading cross-encoder model {model_id} on {device}")
+        self._model = CrossEncoder(model_id, device=device)
+
+
+    @classmethod
+    def get_instance(cls) -> "CrossEncoderModelSingleton":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
 
-    # def get_model(self):
-    #     return self._model
 
-    # for sake of time
     def __call__(self, pairs: list[tuple[str, str]]) -> list[float]:
-        score = self._model.predict(pairs)
-        return score.tolist()
+        return self.predict(pairs).tolist()
+
+
+    def predict(self, pairs: list[tuple[str, str]]) -> np.ndarray:
+        """Scores the pairs in batches of pairs of similar lengths.
+
+        Returns:
+            np.ndarray: scores, in the same order as pairs
+        """
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
+
+        # longest first, so an out of memory error shows on the first batch
+        order = sorted(range(len(pairs)), key=lambda index: len(pairs[index][0]) + len(pairs[index][1]), reverse=True)
+        sorted_scores = self._model.predict([pairs[index] for index in order],
+                                            batch_size=self._batch_size,
+                                            show_progress_bar=False,
+                                            convert_to_numpy=True)
+        scores = np.empty(len(pairs), dtype=sorted_scores.dtype)
+        scores[order] = sorted_scores
+
+        return scores
+
+
+    def score(self, query: str, passages: list[str]) -> list[float]:
+        """Scores each passage against the query. Only the passages, deduplicated, not in the score cache go
+        through the model.
+
+        Returns:
+            list[float]: scores, in the same order as passages
+        """
+        passage_hashes = [hashlib.md5(passage.encode()).hexdigest() for passage in passages]
+        scores: dict[str, float] = {}
+        with self._lock:
+            for passage_hash in passage_hashes:
+                key = (query, passage_hash)
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[passage_hash] = self._scores[key]
+
+        missing = {passage_hash: passage for passage_hash, passage in zip(passage_hashes, passages)
+                   if passage_hash not in scores}
+        if missing:
+            new_scores = self.predict([(query, passage) for passage in missing.values()])
+            with self._lock:
+                for passage_hash, score in zip(missing, new_scores.tolist()):
+                    scores[passage_hash] = score
+                    self._scores[(query, passage_hash)] = score
+                while len(self._scores) > self._max_cached_scores:
+                    self._scores.popitem(last=False)
+
+        return [scores[passage_hash] for passage_hash in passage_hashes]
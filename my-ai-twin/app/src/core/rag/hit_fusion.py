@@ -0,0 +1,52 @@
+from qdrant_client.conversions import common_types as types
+
+from core.errors import ImproperlyConfigured
+
+# settings.RETRIEVER_HIT_FUSION values
+RECIPROCAL_RANK_FUSION = "rrf"
+MAX_SCORE_FUSION = "max"
+
+# RRF smoothing constant, from the original paper (Cormack et al. 2009). Damps the weight of the top ranks
+RRF_K = 60
+
+
+def fuse_hits(ranked_hits: dict[str, list[list[types.ScoredPoint]]],
+              method: str = RECIPROCAL_RANK_FUSION,
+              limit: int | None = None) -> list[types.ScoredPoint]:
+    """Fuses the hits of several searches (one per expanded query and collection) into a single ranking, with each
+    point once.
+
+    - rrf : a point scores sum(1 / (RRF_K + rank)) over the searches it is returned by. Only ranks count, so searches
+    with scores on different scales (eg: text vs code embeddings) are fused fairly, and points returned by several
+    queries rank higher.
+    - max : a point scores its best similarity score in any search.
+
+    Args:
+        ranked_hits (dict[str, list[list[types.ScoredPoint]]]): hits of each search, best first, keyed on collection name
+        method (str, optional): "rrf" or "max". Defaults to "rrf".
+        limit (int | None, optional): # of hits kept, the best ones. None = all. Defaults to None.
+
+    Returns:
+        list[types.ScoredPoint]: unique hits (by collection and point id), best first, with their fused score
+    """
+    if method not in (RECIPROCAL_RANK_FUSION, MAX_SCORE_FUSION):
+        raise ImproperlyConfigured(f"Unknown hit fusion method {method}, expected one of "
+                                   f"{RECIPROCAL_RANK_FUSION}, {MAX_SCORE_FUSION}")
+
+    fused_scores: dict[tuple[str, types.PointId], float] = {}
+    hits_by_key: dict[tuple[str, types.PointId], types.ScoredPoint] = {}
+    for collection_name, searches in ranked_hits.items():
+        for hits in searches:
+            for rank, hit in enumerate(hits, start=1):
+                # point ids are unique within a collection only
+                key = (collection_name, hit.id)
+                hits_by_key.setdefault(key, hit)
+                if method == RECIPROCAL_RANK_FUSION:
+                    fused_scores[key] = fused_scores.get(key, 0.0) + 1 / (RRF_K + rank)
+                else:
+                    fused_scores[key] = max(fused_scores.get(key, hit.score), hit.score)
+
+    # stable : ties keep the order the points were first returned in
+    keys = sorted(fused_scores, key=lambda key: fused_scores[key], reverse=True)[:limit]
+
+    return [hits_by_key[key].model_copy(update={"score": fused_scores[key]}) for key in keys]
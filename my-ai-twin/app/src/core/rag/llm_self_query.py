@@ -1,3 +1,6 @@
+import asyncio
+import threading
+
 import opik
 from langchain_openai import ChatOpenAI
 from opik.integrations.langchain import OpikTracer
@@ -14,17 +17,32 @@ logger = get_logger(__name__)
 class LlmSelfQuery:
 
     opik_tracer = OpikTracer(tags=["SelfQuery"])
+    # shared by all the requests, i.e. a single connection pool. Requests are aborted at the retrieval deadline, so a
+    # timed out call does not hold on to the retriever thread running it
+    _model: ChatOpenAI | None = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls) -> ChatOpenAI:
+        if cls._model is None:
+            with cls._model_lock:
+                if cls._model is None:
+                    cls._model = ChatOpenAI(
+                        model=settings.OPENAI_MODEL_ID,
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL,
+                        temperature=0,
+                        timeout=settings.RETRIEVER_LLM_TIMEOUT_SECONDS,
+                        # a retry would only complete past the deadline
+                        max_retries=0,
+                    )
+        return cls._model
 
     @staticmethod
     @opik.track(name="SelfQuery.generate_response")
     def generate_response(query:str) -> str | None :
         prompt = SelfQueryTemplate().create_template()
-
-        model = ChatOpenAI(
-            model=settings.OPENAI_MODEL_ID,
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0,
-        )
+        model = LlmSelfQuery.get_model()
 
         # - replaced below lines with further below given the error "cannot import name PipelinePromptTemplate...."
         # chain = prompt | model
@@ -34,7 +52,21 @@ class LlmSelfQuery:
         # The assumption is user inputs their name or id. If not, None is returned.
         prompt_response = prompt.invoke({"question": query}, {"callbacks": [LlmSelfQuery.opik_tracer]})
         response = model.invoke(prompt_response, {"callbacks": [LlmSelfQuery.opik_tracer]})
-        response = response.content
+
+        return LlmSelfQuery._get_user_id(response.content)
+
+    @staticmethod
+    @opik.track(name="SelfQuery.agenerate_response")
+    async def agenerate_response(query: str) -> str | None:
+        """Async version of generate_response(...). The user lookup in MongoDB runs in a thread."""
+        prompt_response = await SelfQueryTemplate().create_template().ainvoke(
+            {"question": query}, {"callbacks": [LlmSelfQuery.opik_tracer]})
+        response = await LlmSelfQuery.get_model().ainvoke(prompt_response, {"callbacks": [LlmSelfQuery.opik_tracer]})
+
+        return await asyncio.to_thread(LlmSelfQuery._get_user_id, response.content)
+
+    @staticmethod
+    def _get_user_id(response: str) -> str | None:
         user_full_name = response.strip("\n")
 
         if user_full_name == "none":
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from core.config import settings
+from core.logger_utils import get_logger
+from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL
+from featurepipe.utils.embeddings_util import encode_code_inline, encode_text_inline
+
+logger = get_logger(__name__)
+
+
+class QueryEmbedder:
+    """Embeds retrieval queries with the models loaded once by EmbeddingModelManager. All the queries of a request
+    are encoded in a single batch per model, and their embeddings kept in a process wide LRU cache, so repeated
+    questions skip the model altogether.
+    """
+
+    _instance: Optional["QueryEmbedder"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 max_entries: int,
+                 encoders: dict[str, Callable[[list[str]], np.ndarray]] | None = None) -> None:
+        self._max_entries = max_entries
+        self._encoders = encoders or {TEXT_MODEL: encode_text_inline, CODE_MODEL: encode_code_inline}
+        self._embeddings: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    @classmethod
+    def get_instance(cls) -> "QueryEmbedder":
+        """Process wide query embedder, cache sized by settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(max_entries=settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES)
+        return cls._instance
+
+
+    def embed(self, queries: list[str], model_kind: str = TEXT_MODEL) -> np.ndarray:
+        """Embeds the queries with the model of the given kind (TEXT_MODEL or CODE_MODEL). Queries not in the cache
+        are encoded in one batch.
+
+        Returns:
+            np.ndarray: embeddings, one row per query in the same order as queries
+        """
+        embeddings: dict[str, np.ndarray] = {}
+        with self._lock:
+            for query in queries:
+                key = (model_kind, query)
+                if key in self._embeddings:
+                    self._embeddings.move_to_end(key)
+                    embeddings[query] = self._embeddings[key]
+            missing_queries = [query for query in dict.fromkeys(queries) if query not in embeddings]
+            self.hits += len(embeddings)
+            self.misses += len(missing_queries)
+
+        if missing_queries:
+            # the model runs outside the lock, concurrent requests are not serialized on the cache
+            new_embeddings = self._encoders[model_kind](missing_queries)
+            with self._lock:
+                for query, embedding in zip(missing_queries, new_embeddings):
+                    embeddings[query] = embedding
+                    self._embeddings[(model_kind, query)] = embedding
+                while len(self._embeddings) > self._max_entries:
+                    self._embeddings.popitem(last=False)
+
+        return np.stack([embeddings[query] for query in queries])
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
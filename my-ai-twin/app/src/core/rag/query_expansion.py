@@ -1,3 +1,5 @@
+import threading
+
 import opik
 from langchain_openai import ChatOpenAI
 # from langchain.prompts import PromptTemplate
@@ -15,18 +17,33 @@ class QueryExpansion:
     """
     # for observability
     opik_tracer = OpikTracer(tags=["QueryExpansion"])
+    # shared by all the requests, i.e. a single connection pool. Requests are aborted at the retrieval deadline, so a
+    # timed out call does not hold on to the retriever thread running it
+    _model: ChatOpenAI | None = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls) -> ChatOpenAI:
+        if cls._model is None:
+            with cls._model_lock:
+                if cls._model is None:
+                    cls._model = ChatOpenAI(
+                        model=settings.OPENAI_MODEL_ID,
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL,
+                        temperature=0,
+                        timeout=settings.RETRIEVER_LLM_TIMEOUT_SECONDS,
+                        # a retry would only complete past the deadline
+                        max_retries=0,
+                    )
+        return cls._model
 
     @staticmethod
     @opik.track(name="QueryExpansion.generate_response")
     def generate_response(query:str, to_expand_to_n: int) -> list[str]:
         query_expansion_template = QueryExpansionTemplate()
         prompt = query_expansion_template.create_template(to_expand_to_n)
-        model = ChatOpenAI(
-            model=settings.OPENAI_MODEL_ID,
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0,
-        )
-        chain = prompt | model
+        chain = prompt | QueryExpansion.get_model()
         chain = chain.with_config({"callbacks": [QueryExpansion.opik_tracer]})
 
         response = chain.invoke({"question": query}, config={"callbacks": [QueryExpansion.opik_tracer]})
@@ -34,9 +51,23 @@ class QueryExpansion:
         # Below are other ways to call the template
         # prompt_response = prompt.invoke({"question": query}, config={"callbacks": [QueryExpansion.opik_tracer]})
         # response = model.invoke(prompt_response, config={"callbacks": [QueryExpansion.opik_tracer]})
-        response = response.content
+        return QueryExpansion._split_queries(response.content, query_expansion_template.separator)
 
-        queries = response.strip().split(query_expansion_template.separator)
+    @staticmethod
+    @opik.track(name="QueryExpansion.agenerate_response")
+    async def agenerate_response(query: str, to_expand_to_n: int) -> list[str]:
+        """Async version of generate_response(...)"""
+        query_expansion_template = QueryExpansionTemplate()
+        prompt = query_expansion_template.create_template(to_expand_to_n)
+        chain = prompt | QueryExpansion.get_model()
+
+        response = await chain.ainvoke({"question": query}, config={"callbacks": [QueryExpansion.opik_tracer]})
+
+        return QueryExpansion._split_queries(response.content, query_expansion_template.separator)
+
+    @staticmethod
+    def _split_queries(response: str, separator: str) -> list[str]:
+        queries = response.strip().split(separator)
         stripped_queries = [
             stripped_item for item in queries if (stripped_item := item.strip(" \\n"))
         ]
@@ -1,20 +1,37 @@
+import threading
+
 from core.config import settings
 from langchain_openai import ChatOpenAI
 
 from core.rag.prompt_templates import ReRankingTemplate
 from core.rag.cross_encoders import CrossEncoderModelSingleton
 
+# settings.RERANKER_MODE values
+LLM_RERANKER = "llm"
+CROSS_ENCODER_RERANKER = "crossencoder"
+
 class ReRanker:
+    # shared by all the requests, i.e. a single connection pool
+    _model: ChatOpenAI | None = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls) -> ChatOpenAI:
+        if cls._model is None:
+            with cls._model_lock:
+                if cls._model is None:
+                    cls._model = ChatOpenAI(
+                        model=settings.OPENAI_MODEL_ID,
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL,
+                    )
+        return cls._model
 
     @staticmethod
     def generate_response_using_llm(query:str, passages: list[str], keep_top_k: int) -> list[str]:
         reranking_template = ReRankingTemplate()
         prompt = reranking_template.create_template(keep_top_k = keep_top_k)
-        model = ChatOpenAI(
-            model=settings.OPENAI_MODEL_ID,
-            api_key= settings.OPENAI_API_KEY
-        )
-        chain = prompt | model
+        chain = prompt | ReRanker.get_model()
 
         stripped_passages = [
             stripped_item for item in passages if (stripped_item := item.strip())
@@ -38,15 +55,19 @@ class ReRanker:
     @staticmethod
     def generate_response_using_crossencoder(
                 query: str,
-                passages: list[str]) -> list[str]:
-
-        pairs = [[query, f"{passage.text}"] for passage in passages]
-        cross_encoder = CrossEncoderModelSingleton()
-        ranked_pairs = cross_encoder(pairs)
-        sorted_ranked_pairs = sorted(zip(passages, ranked_pairs), key= lambda x: x[1], reverse=True)
+                passages: list[str],
+                keep_top_k: int | None = None) -> list[str]:
+        """Reranks the passages with the local cross-encoder, best first. Identical passages eg: the same chunk
+        retrieved by several expanded queries, are scored and returned once.
+        """
+        stripped_passages = list(dict.fromkeys(
+            stripped_item for item in passages if (stripped_item := item.strip())
+        ))
+        scores = CrossEncoderModelSingleton.get_instance().score(query, stripped_passages)
+        sorted_ranked_pairs = sorted(zip(stripped_passages, scores), key= lambda x: x[1], reverse=True)
 
         final_ranked_pairs = []
-        for passage, rank_score in sorted_ranked_pairs:
+        for passage, rank_score in sorted_ranked_pairs[:keep_top_k]:
             final_ranked_pairs.append(passage)
 
-        return final_ranked_pairs
\ No newline at end of file
+        return final_ranked_pairs
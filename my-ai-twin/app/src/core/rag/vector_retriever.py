@@ -1,157 +1,281 @@
+import asyncio
 import concurrent.futures
+import threading
+import time
+from typing import Awaitable, Optional
 
 import opik
 from core.config import settings
 from qdrant_client import models
-from sentence_transformers.SentenceTransformer import SentenceTransformer
 
 from core.logger_utils import get_logger
 from core import string_utils
-from db.qdrant_connection import QdrantDatabaseConnector
+from db.qdrant_connection import QdrantDatabaseConnector, tenant_field
 from core.rag.query_expansion import QueryExpansion
-from core.rag.reranker import ReRanker
+from core.rag.reranker import ReRanker, CROSS_ENCODER_RERANKER
+from core.rag.cross_encoders import CrossEncoderModelSingleton
 from core.rag.llm_self_query import LlmSelfQuery
+from core.rag.query_embedder import QueryEmbedder
+from core.rag.hit_fusion import fuse_hits
+from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL
 
 
 logger = get_logger(__name__)
 
+# collections searched, with the payload field holding the author id. For repos its the owner_id.
+# Refer to TENANT_FIELDS in db.qdrant_connection.py
+SEARCH_COLLECTIONS = {
+    collection_name: tenant_field(collection_name)
+    for collection_name in ("vector_posts", "vector_articles", "vector_repositories")
+}
+
+# long lived, threads are not started per request
+_search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(SEARCH_COLLECTIONS),
+                                                         thread_name_prefix="vector-search")
+
+
+def search_collections_ranked(client: QdrantDatabaseConnector,
+                              query_vectors: dict[str, list[list[float]]],
+                              author_id: str | None,
+                              limit: int) -> dict[str, list[list]]:
+    """Searches the collections (articles, posts, repositories) for all the query vectors, filtered on the given
+    author_id. The searches of a collection go in a single query_batch_points request, and the collections are
+    searched in parallel.
+
+    Args:
+        client (QdrantDatabaseConnector): connection to the vector store
+        query_vectors (dict[str, list[list[float]]]): query vectors keyed on collection name
+        author_id (str | None): The author_id to filter the results by. None = no filter
+        limit (int): The number of results to retrieve per query and collection
+
+    Returns:
+        dict[str, list[list]]: hits of each query, best first, keyed on collection name
+    """
+    def search_collection(collection_name: str) -> list:
+        return client.search_batch(collection_name=collection_name,
+                                   query_vectors=query_vectors[collection_name],
+                                   query_filter=_author_filter(collection_name, author_id),
+                                   limit=limit)
+
+    return dict(zip(SEARCH_COLLECTIONS, _search_executor.map(search_collection, SEARCH_COLLECTIONS)))
+
+
+async def asearch_collections_ranked(client: QdrantDatabaseConnector,
+                                     query_vectors: dict[str, list[list[float]]],
+                                     author_id: str | None,
+                                     limit: int) -> dict[str, list[list]]:
+    """Async version of search_collections_ranked(...), on the async Qdrant client : no thread per search"""
+    hits = await asyncio.gather(*(
+        client.asearch_batch(collection_name=collection_name,
+                             query_vectors=query_vectors[collection_name],
+                             query_filter=_author_filter(collection_name, author_id),
+                             limit=limit)
+        for collection_name in SEARCH_COLLECTIONS
+    ))
+    return dict(zip(SEARCH_COLLECTIONS, hits))
+
+
+def _author_filter(collection_name: str, author_id: str | None) -> models.Filter | None:
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key=SEARCH_COLLECTIONS[collection_name],
+                match=models.MatchValue(value=author_id),
+            )
+        ]
+    ) if author_id else None
+
+
+def search_collections(client: QdrantDatabaseConnector,
+                       query_vectors: dict[str, list[list[float]]],
+                       author_id: str | None,
+                       limit: int) -> list:
+    """Same as search_collections_ranked(...), with the hits of all the queries in all the collections in one list"""
+    hits = search_collections_ranked(client, query_vectors, author_id, limit)
+
+    # per collection, then per query
+    return string_utils.flatten_nested_list(string_utils.flatten_nested_list(hits.values()))
+
+
+# runs the blocking LLM calls of retrieve_top_k(...) concurrently. The LLM clients abort their requests after
+# settings.RETRIEVER_LLM_TIMEOUT_SECONDS, so timed out calls do not pile up on its threads
+_llm_executor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="retriever-llm")
+
+
+def _result_or_fallback(future: concurrent.futures.Future, deadline: float, fallback, step: str):
+    """Result of the LLM call, or fallback when it fails or does not complete by the deadline (time.monotonic())"""
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except concurrent.futures.TimeoutError:
+        logger.warning(f"{step} timed out after {settings.RETRIEVER_LLM_TIMEOUT_SECONDS} secs, falling back to {fallback!r}")
+    except Exception:
+        logger.exception(f"{step} failed, falling back to {fallback!r}")
+    return fallback
+
+
+async def _await_or_fallback(coroutine: Awaitable, fallback, step: str):
+    """Async version of _result_or_fallback(...), the LLM call is cancelled on timeout"""
+    try:
+        return await asyncio.wait_for(coroutine, timeout=settings.RETRIEVER_LLM_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"{step} timed out after {settings.RETRIEVER_LLM_TIMEOUT_SECONDS} secs, falling back to {fallback!r}")
+    except Exception:
+        logger.exception(f"{step} failed, falling back to {fallback!r}")
+    return fallback
+
+
 class VectorRetriever:
     """Retrieves Vectors from a Vector store using query expansion and multitenancy search.
+
+    Long lived : holds the Qdrant connection, the LLM chains and the warm embedding models, and serves any number of
+    queries, concurrently through the async API. Use get_instance() for the process wide retriever.
     """
 
-    def __init__(self, query: str) -> None:
+    _instance: Optional["VectorRetriever"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self) -> None:
         self._client = QdrantDatabaseConnector()
-        self.query = query
-        self._embedder = SentenceTransformer(settings.EMBEDDING_MODEL_ID)
+        self._query_embedder = QueryEmbedder.get_instance()
         self._query_expander = QueryExpansion()
         self._metadata_extractor = LlmSelfQuery()
         self._reranker = ReRanker()
 
 
-    def _search_single_query(self, generated_query: str, author_id: str, k: int):
-        """
-        Runs query against Qdrant Db against all the collections (articles, posts, repositories)
-        that match the given author_id and retrieves top "k" (param) results.
+    @classmethod
+    def get_instance(cls) -> "VectorRetriever":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
 
-        Args:
-            generated_query (str): The query to run against the vector store
-            author_id (str): The author_id to filter the results by
-            k (int): The number of results to retrieve. Should be greater than 3
-        """
 
-        assert k > 3, "k should be greater than 3"  # Number of results expected per query
+    def warmup(self) -> None:
+        """Startup hook : loads the embedding models, and the cross-encoder when reranking with it, and runs a first
+        inference, so the first request does not pay for it"""
+        start_time = time.perf_counter()
+        self._embed_queries(["warm up"])
+        if settings.RERANKER_MODE == CROSS_ENCODER_RERANKER:
+            CrossEncoderModelSingleton.get_instance().predict([("warm up", "warm up")])
+        logger.info(f"Retriever warmed up in {time.perf_counter() - start_time:.2f} secs")
 
-        query_vector = self._embedder.encode(generated_query).tolist()
-        vectors = [
-            self._client.search(
-                collection_name="vector_posts",
-                query_filter = models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="author_id",
-                            match=models.MatchValue(value=author_id),
-                        )
-                    ]
-                    if author_id
-                    else None
-                ),
-                query_vector = query_vector,
-                limit=k // 3,
-            ),
-            self._client.search(
-                collection_name="vector_articles",
-                query_filter = models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="author_id",
-                            match=models.MatchValue(value=author_id),
-                        )
-                    ]
-                    if author_id
-                    else None
-                ),
-                query_vector = query_vector,
-                limit = k // 3,
-            ),
-            self._client.search(
-                collection_name="vector_repositories",
-                query_filter= models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="owner_id", # for repos its the owner_id. Refer to RepositoryDBCleanedModel in models.db.base_models.py
-                            match= models.MatchValue(value=author_id),
-                        )
-                    ]
-                    if author_id
-                    else None
-                ),
-                query_vector = query_vector,
-                limit = k // 3,
-            ),
-        ]
-        return string_utils.flatten_nested_list(vectors)
+
+    def _embed_queries(self, queries: list[str]) -> dict[str, list[list[float]]]:
+        """Embeds the queries for each collection searched, in one batch per model. Repositories are searched with
+        embeddings of the code model, as their chunks are embedded with it.
+
+        Returns:
+            dict[str, list[list[float]]]: query vectors, in the order of queries, keyed on collection name
+        """
+        text_vectors = self._query_embedder.embed(queries, TEXT_MODEL).tolist()
+        code_vectors = self._query_embedder.embed(queries, CODE_MODEL).tolist()
+
+        return {
+            collection_name: code_vectors if collection_name == "vector_repositories" else text_vectors
+            for collection_name in SEARCH_COLLECTIONS
+        }
 
 
-    # #TODO : Why use Query at the instance level instead of passing it as a param?
     @opik.track(name="retriever.retrieve_top_k")
-    def retrieve_top_k(self, k: int, to_expand_to_n_queries:int) -> list:
+    def retrieve_top_k(self, query: str, k: int, to_expand_to_n_queries:int) -> list:
         """
         Retrieves top k documents from the vector store using query expansion and multitenancy search. Below are the steps
         followed to execute the query :
         1. Multiple version of query : For Query expansion, it uses LLM to generate multiple (as many as to_expand_to_n_queries)
         version of queries for the given query.
         2. Metadata extraction : Retrieves the author_id from the query using LLM.
-        3. Executes each query in above (1) response, in parallel, against the vector store.
+        3. Embeds the query and all the versions in (1) in a single batch, repeated queries come from a cache.
+        4. Executes all the queries in above (1) response against the vector store, in one batched request per
+        collection. The collections are searched in parallel.
+        5. Fuses the hits of all the searches (settings.RETRIEVER_HIT_FUSION), each chunk once, and keeps the best k
+        as candidates for reranking.
 
         Args:
-            k (int): The number of documents to retrieve.
+            query (str): The user's query.
+            k (int): The number of documents to retrieve, after fusion.
             to_expand_to_n_queries (int): The number of queries to expand to using LLM.
 
         Returns:
-            list: A list of documents retrieved from the vector store.
+            list: A list of unique documents retrieved from the vector store, best first.
         """
+        assert k > 3, "k should be greater than 3"  # Number of results expected per query
+
+        # both LLM calls at once, within settings.RETRIEVER_LLM_TIMEOUT_SECONDS
+        deadline = time.monotonic() + settings.RETRIEVER_LLM_TIMEOUT_SECONDS
+        expansion = _llm_executor.submit(self._query_expander.generate_response, query, to_expand_to_n_queries)
+        self_query = _llm_executor.submit(self._metadata_extractor.generate_response, query)
+        generated_queries = _result_or_fallback(expansion, deadline, fallback=[query], step="Query expansion")
+        author_id = _result_or_fallback(self_query, deadline, fallback=None, step="Self query")
+
+        return self._search(query, generated_queries, author_id, k)
 
-        generated_queries = self._query_expander.generate_response(
-            self.query, to_expand_to_n=to_expand_to_n_queries
-        )
-        logger.info("Successfully generated queries for search: ", num_queries = len(generated_queries))
 
-        author_id = self._metadata_extractor.generate_response(self.query)
+    @opik.track(name="retriever.aretrieve_top_k")
+    async def aretrieve_top_k(self, query: str, k: int, to_expand_to_n_queries: int) -> list:
+        """Async version of retrieve_top_k(...), for serving concurrent requests. The LLM calls and the searches are
+        async, the embedding runs in a thread."""
+        assert k > 3, "k should be greater than 3"  # Number of results expected per query
+
+        generated_queries, author_id = await asyncio.gather(
+            _await_or_fallback(self._query_expander.agenerate_response(query, to_expand_to_n_queries),
+                               fallback=[query], step="Query expansion"),
+            _await_or_fallback(self._metadata_extractor.agenerate_response(query),
+                               fallback=None, step="Self query"))
+
+        queries = self._search_queries(query, generated_queries, author_id)
+        query_vectors = await asyncio.to_thread(self._embed_queries, queries)
+        ranked_hits = await asearch_collections_ranked(self._client, query_vectors, author_id, limit=k // 3)
+
+        return self._fuse(ranked_hits, k)
+
+
+    def _search(self, query: str, generated_queries: list[str], author_id: str | None, k: int) -> list:
+        queries = self._search_queries(query, generated_queries, author_id)
+        query_vectors = self._embed_queries(queries)
+        # one request per collection, holding the searches of all the generated queries
+        ranked_hits = search_collections_ranked(self._client, query_vectors, author_id, limit=k // 3)
+
+        return self._fuse(ranked_hits, k)
+
+
+    def _search_queries(self, query: str, generated_queries: list[str], author_id: str | None) -> list[str]:
+        logger.info("Successfully generated queries for search: ", num_queries = len(generated_queries))
         if author_id:
             logger.info("Successfully extracted the author_id from the query: ", author_id = author_id)
         else :
             logger.warn("Unable to find any Author data in the user's prompt")
 
+        # the original query is searched too, along with its expanded versions
+        return list(dict.fromkeys([query, *generated_queries]))
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            search_tasks = [
-                executor.submit(self._search_single_query, query, author_id, k)
-                for query in generated_queries
-            ]
 
-            hits = [
-                task.result() for task in concurrent.futures.as_completed(search_tasks)
-            ]
-            hits = string_utils.flatten_nested_list(hits)
+    def _fuse(self, ranked_hits: dict[str, list[list]], k: int) -> list:
+        # the same chunk comes back from several queries : reranked once, within a budget of k
+        hits = fuse_hits(ranked_hits, method=settings.RETRIEVER_HIT_FUSION, limit=k)
 
-        logger.info("All documents retrieved successfully: ", num_documents=len(hits))
+        logger.info("All documents retrieved successfully: ",
+                    num_documents=len(hits), num_searched_hits=sum(len(search_hits) for searches in ranked_hits.values() for search_hits in searches))
 
         return hits
 
 
-
     @opik.track(name="retriever.rerank")
-    def rerank(self, hits: list, keep_top_k: int) -> list[str]:
+    def rerank(self, query: str, hits: list, keep_top_k: int) -> list[str]:
         content_list = [hit.payload["content"] for hit in hits]
-        # NOTE : Here reranking is done using LLM. Alt option is to use the fn generate_response_using_crossencoder
-        rerank_hits = self._reranker.generate_response_using_llm(
-            query=self.query, passages=content_list, keep_top_k=keep_top_k
-        )
+        if settings.RERANKER_MODE == CROSS_ENCODER_RERANKER:
+            rerank_hits = self._reranker.generate_response_using_crossencoder(
+                query=query, passages=content_list, keep_top_k=keep_top_k
+            )
+        else:
+            rerank_hits = self._reranker.generate_response_using_llm(
+                query=query, passages=content_list, keep_top_k=keep_top_k
+            )
 
         logger.info("Documents reranked successfully: ", num_documents=len(rerank_hits))
         return rerank_hits
 
 
-    def set_query(self, query: str):
-        self.query = query
-
+    async def arerank(self, query: str, hits: list, keep_top_k: int) -> list[str]:
+        """Async version of rerank(...)"""
+        return await asyncio.to_thread(self.rerank, query, hits, keep_top_k)
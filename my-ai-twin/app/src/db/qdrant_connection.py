@@ -1,31 +1,102 @@
+import asyncio
+import atexit
+import hashlib
+import threading
+import uuid
+import weakref
+from typing import Iterator
+
+import httpx
+
 from qdrant_client.models import PointStruct
 from typing_extensions import deprecated
-from qdrant_client import QdrantClient, models
-from qdrant_client.http.models import Batch, Distance, VectorParams, Filter
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+from qdrant_client.http.models import Batch, Distance, VectorParams, Filter, PointIdsList
 from qdrant_client.conversions import common_types as types
 
 from core import logger_utils
+from core.errors import ImproperlyConfigured
 from core.config import settings
 from models.content_enum import ContentDataEnum
 
 logger = logger_utils.get_logger(__name__)
 
+# payload field holding the author of the points, per content type. All the searches filter on it
+TENANT_FIELDS = {
+    ContentDataEnum.POSTS: "author_id",
+    ContentDataEnum.ARTICLES: "author_id",
+    ContentDataEnum.REPOSITORIES: "owner_id",
+}
+
+# settings.QDRANT_VECTOR_STORAGE_CONFIG quantization values
+SCALAR_QUANTIZATION = "scalar"
+BINARY_QUANTIZATION = "binary"
+
+
+def tenant_field(collection_name: str) -> str:
+    """Payload field holding the author id in the given collection eg: owner_id for vector_repositories"""
+    return next(field for content_type, field in TENANT_FIELDS.items() if content_type in collection_name)
+
+
+def _client_options() -> dict:
+    """Options of the Qdrant clients (sync and async) : server, transport, connection pool and timeout"""
+    if settings.USE_QDRANT_CLOUD:
+        server = {"url": settings.QDRANT_CLOUD_URL, "api_key": settings.QDRANT_API_KEY}
+    else:
+        server = {"host": settings.QDRANT_DATABASE_HOST, "port": settings.QDRANT_DATABASE_PORT}
+
+    return {
+        **server,
+        "prefer_grpc": settings.QDRANT_PREFER_GRPC,
+        "grpc_port": settings.QDRANT_GRPC_PORT,
+        "timeout": settings.QDRANT_TIMEOUT_SECONDS,
+        "limits": httpx.Limits(max_connections=settings.QDRANT_MAX_CONNECTIONS,
+                               max_keepalive_connections=settings.QDRANT_MAX_KEEPALIVE_CONNECTIONS),
+    }
+
 
 class QdrantDatabaseConnector:
-    _instance:QdrantClient | None = None
+    """Connection to Qdrant. All the connectors of a process share one pooled client, created on first use, so
+    sinks, retriever, dataset generator etc. do not each open their own connections. The async API runs on a pooled
+    AsyncQdrantClient, one per event loop.
+
+    An in-process Qdrant (settings.QDRANT_LOCATION) is not shared : each connector gets its own store.
+    """
+
+    _client: QdrantClient | None = None
+    _client_lock = threading.Lock()
+    # AsyncQdrantClient connections are bound to the event loop they are opened in
+    _async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncQdrantClient]" = weakref.WeakKeyDictionary()
 
     def __init__(self) -> None:
-        if self._instance is None:
-            if settings.USE_QDRANT_CLOUD:
-                self._instance = QdrantClient(
-                    url=settings.QDRANT_CLOUD_URL,
-                    api_key=settings.QDRANT_API_KEY
-                )
-            else :
-                self._instance = QdrantClient(
-                    host=settings.QDRANT_DATABASE_HOST,
-                    port=settings.QDRANT_DATABASE_PORT
-                )
+        if settings.QDRANT_LOCATION:
+            # in-process Qdrant eg: ":memory:", for tests and benchmarks
+            self._instance = QdrantClient(location=settings.QDRANT_LOCATION)
+        else:
+            self._instance = self.get_client()
+
+
+    @classmethod
+    def get_client(cls) -> QdrantClient:
+        """Process wide Qdrant client"""
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    cls._client = QdrantClient(**_client_options())
+                    logger.info("Qdrant client created", prefer_grpc=settings.QDRANT_PREFER_GRPC)
+                    atexit.register(cls.close_shared)
+        return cls._client
+
+
+    @classmethod
+    def get_async_client(cls) -> AsyncQdrantClient:
+        """Process wide async Qdrant client, of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with cls._client_lock:
+            if loop not in cls._async_clients:
+                cls._async_clients[loop] = AsyncQdrantClient(**_client_options())
+            return cls._async_clients[loop]
+
 
     def get_collection(self, collection_name:str):
         return self._instance.get_collection(collection_name=collection_name)
@@ -53,16 +124,50 @@ class QdrantDatabaseConnector:
                             if ContentDataEnum.REPOSITORIES in collection_name \
                             else settings.EMBEDDING_SIZE
 
+        hnsw_config = settings.QDRANT_HNSW_CONFIG.get(collection_name, {})
+        storage_config = settings.QDRANT_VECTOR_STORAGE_CONFIG.get(collection_name, {})
+
         try:
             self._instance.create_collection(
                 collection_name=collection_name,
                 vectors_config=VectorParams(
-                    size=embed_size, distance=Distance.COSINE))
+                    size=embed_size, distance=Distance.COSINE, on_disk=storage_config.get("on_disk")),
+                hnsw_config=models.HnswConfigDiff(m=hnsw_config.get("m"),
+                                                  ef_construct=hnsw_config.get("ef_construct"),
+                                                  payload_m=hnsw_config.get("payload_m")),
+                quantization_config=quantization_config(storage_config.get("quantization")))
         except Exception as e:
             logger.error(f"Failed to create Vector collection {collection_name} given the exception ")
             logger.exception(e)
             raise e
 
+        self.create_payload_indexes(collection_name)
+
+
+    def create_payload_indexes(self, collection_name: str):
+        """Creates the keyword payload indexes of a vector collection : on the tenant field (author_id / owner_id),
+        which Qdrant also uses to build per author HNSW graphs (payload_m), so filtered searches stay fast as the
+        number of authors grows, on type and on the entry id. Indexes already created are left as is.
+        """
+        if settings.QDRANT_LOCATION:
+            # in-process Qdrant searches exhaustively, payload indexes have no effect
+            return
+
+        self._instance.create_payload_index(
+            collection_name=collection_name,
+            field_name=tenant_field(collection_name),
+            field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True))
+        self._instance.create_payload_index(
+            collection_name=collection_name,
+            field_name="type",
+            field_schema=models.PayloadSchemaType.KEYWORD)
+        # entry id of the chunk, the stale chunks of an entry are looked up by it
+        self._instance.create_payload_index(
+            collection_name=collection_name,
+            field_name="id",
+            field_schema=models.PayloadSchemaType.KEYWORD)
+        logger.info(f"Payload indexes created on collection {collection_name}")
+
     @deprecated("Use the batch upsert function write_batch_data")
     def write_data(self, collection_name: str, points: Batch):
         """upsert data into the DB
@@ -92,15 +197,96 @@ class QdrantDatabaseConnector:
                collection_name:str,
                query_vector:list,
                query_filter:models.Filter | None=None,
-               limit:int = 3) -> list :
-
+               limit:int = 3,
+               oversampling: float | None = None) -> list :
+        """Searches the collection for the query vector. In quantized collections, limit x oversampling candidates
+        are found with the quantized vectors, then rescored with the original ones. oversampling None = the one of
+        the collection in settings.QDRANT_VECTOR_STORAGE_CONFIG.
+        """
         response = self._instance.query_points(collection_name=collection_name,
                                                query=query_vector,
                                                query_filter=query_filter,
+                                               search_params=self._search_params(collection_name, oversampling),
                                                limit=limit)
         return response.points
 
 
+    def search_batch(self,
+                     collection_name: str,
+                     query_vectors: list[list[float]],
+                     query_filter: models.Filter | None = None,
+                     limit: int = 3,
+                     oversampling: float | None = None) -> list[list[types.ScoredPoint]]:
+        """Runs the searches of all the query vectors against the collection, in a single request. See search(...)
+        for oversampling.
+
+        Returns:
+            list[list[types.ScoredPoint]]: hits of each query vector, in the same order as query_vectors
+        """
+        if not query_vectors:
+            return []
+
+        responses = self._instance.query_batch_points(
+            collection_name=collection_name,
+            requests=self._query_requests(collection_name, query_vectors, query_filter, limit, oversampling))
+        return [response.points for response in responses]
+
+
+    async def asearch_batch(self,
+                            collection_name: str,
+                            query_vectors: list[list[float]],
+                            query_filter: models.Filter | None = None,
+                            limit: int = 3,
+                            oversampling: float | None = None) -> list[list[types.ScoredPoint]]:
+        """Async version of search_batch(...). The in-process Qdrant has no async client shared with this connector,
+        so search_batch(...) runs in a thread.
+        """
+        if not query_vectors:
+            return []
+        if settings.QDRANT_LOCATION:
+            return await asyncio.to_thread(self.search_batch, collection_name, query_vectors, query_filter, limit,
+                                           oversampling)
+
+        responses = await self.get_async_client().query_batch_points(
+            collection_name=collection_name,
+            requests=self._query_requests(collection_name, query_vectors, query_filter, limit, oversampling))
+        return [response.points for response in responses]
+
+
+    def _query_requests(self,
+                        collection_name: str,
+                        query_vectors: list[list[float]],
+                        query_filter: models.Filter | None,
+                        limit: int,
+                        oversampling: float | None) -> list[models.QueryRequest]:
+        search_params = self._search_params(collection_name, oversampling)
+        return [
+            models.QueryRequest(query=query_vector, filter=query_filter, params=search_params, limit=limit,
+                                with_payload=True)
+            for query_vector in query_vectors
+        ]
+
+
+    def _search_params(self, collection_name: str, oversampling: float | None = None) -> models.SearchParams | None:
+        """Search time params of the collection : HNSW (settings.QDRANT_HNSW_CONFIG) and, for quantized
+        collections, rescoring (settings.QDRANT_VECTOR_STORAGE_CONFIG). None = Qdrant defaults
+        """
+        if settings.QDRANT_LOCATION:
+            # in-process Qdrant searches exhaustively, search params have no effect
+            return None
+
+        hnsw_ef = settings.QDRANT_HNSW_CONFIG.get(collection_name, {}).get("hnsw_ef")
+        storage_config = settings.QDRANT_VECTOR_STORAGE_CONFIG.get(collection_name, {})
+        quantization = None
+        if storage_config.get("quantization"):
+            quantization = models.QuantizationSearchParams(
+                rescore=True, oversampling=oversampling or storage_config.get("oversampling"))
+        if hnsw_ef is None and quantization is None:
+            return None
+
+        return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
     def scroll(self, collection_name:str, limit:int) -> tuple[list[types.Record], types.PointId | None]:
         """Use to scroll through a collection that has large number of records, by specifying the param limit.
 
@@ -115,13 +301,126 @@ class QdrantDatabaseConnector:
         return self._instance.scroll(collection_name=collection_name, limit=limit)
 
 
-    def delete_points(self, collection_name:str, points_selector: Filter) :
+    def retrieve_payloads(self, collection_name: str, ids: list[types.PointId]) -> dict[types.PointId, dict]:
+        """Bulk lookup of the payloads of the given point ids, for the ones stored in the collection. No vectors.
+
+        Returns:
+            dict[types.PointId, dict]: payload by point id, normalized with normalize_point_id(...)
+        """
+        if not ids:
+            return {}
+
+        records = self._instance.retrieve(collection_name=collection_name,
+                                          ids=ids,
+                                          with_payload=True,
+                                          with_vectors=False)
+        return {normalize_point_id(record.id): record.payload or {} for record in records}
+
+
+    def scroll_ids_by_payload(self,
+                              collection_name: str,
+                              key: str,
+                              values: list[str],
+                              page_size: int = 1000) -> dict[str, set[types.PointId]]:
+        """Retrieves the ids of all the points whose payload field `key` matches any of the given values.
+
+        Returns:
+            dict[str, set[types.PointId]]: point ids, as returned by Qdrant, grouped by payload value
+        """
+        point_ids: dict[str, set[types.PointId]] = {value: set() for value in values}
+        scroll_filter = Filter(must=[models.FieldCondition(key=key, match=models.MatchAny(any=values))])
+        for record in self.iter_points(collection_name,
+                                       payload_fields=[key],
+                                       scroll_filter=scroll_filter,
+                                       page_size=page_size):
+            point_ids.setdefault(record.payload[key], set()).add(record.id)
+
+        return point_ids
+
+
+    def iter_points(self,
+                    collection_name: str,
+                    payload_fields: list[str] | bool = True,
+                    scroll_filter: Filter | None = None,
+                    page_size: int = 256) -> Iterator[types.Record]:
+        """Scrolls through all the points of the collection, page by page following next_page_offset, and yields
+        them lazily. Vectors are not fetched. Only one page is held in memory at a time.
+
+        Args:
+            collection_name (str): collection to scroll
+            payload_fields (list[str] | bool, optional): payload fields to fetch. True = whole payload. Defaults to True.
+            scroll_filter (Filter | None, optional): only scrolls the points matching the filter. Defaults to None.
+            page_size (int, optional): # of points per request. Defaults to 256.
+
+        Yields:
+            Iterator[types.Record]: points, in the order of their ids
+        """
+        offset = None
+        while True:
+            records, offset = self._instance.scroll(collection_name=collection_name,
+                                                    scroll_filter=scroll_filter,
+                                                    limit=page_size,
+                                                    offset=offset,
+                                                    with_payload=payload_fields,
+                                                    with_vectors=False)
+            yield from records
+
+            if offset is None:
+                return
+
+
+    def delete_points(self, collection_name:str, points_selector: Filter | PointIdsList) :
         self._instance.delete(collection_name=collection_name,
                         points_selector=points_selector,
                         wait=True)
 
 
     def close(self):
-        if self._instance:
+        """Closes the connection of an in-process Qdrant. No-op for the process wide client, which other connectors
+        keep using : close it on shutdown with close_shared()."""
+        if self._instance is not None and self._instance is not QdrantDatabaseConnector._client:
             self._instance.close()
             logger.info("Qdrant database connection closed")
+
+
+    @classmethod
+    def close_shared(cls) -> None:
+        """Closes the process wide clients, for shutdown. The next connector opens a new one"""
+        with cls._client_lock:
+            if cls._client is not None:
+                cls._client.close()
+                logger.info("Qdrant client closed")
+            cls._client = None
+            # bound to their event loops, they are closed along with them
+            cls._async_clients.clear()
+
+
+def quantization_config(quantization: str | None) -> models.QuantizationConfig | None:
+    """Qdrant quantization config for the given quantization ("scalar", "binary" or None). Quantized vectors are
+    always kept in RAM, the original ones can be on disk.
+    """
+    if quantization is None:
+        return None
+    if quantization == SCALAR_QUANTIZATION:
+        # int8, the 1% most extreme values are clipped so outliers do not waste the range
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == BINARY_QUANTIZATION:
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+
+    raise ImproperlyConfigured(f"Unknown quantization {quantization}, expected one of "
+                               f"{SCALAR_QUANTIZATION}, {BINARY_QUANTIZATION} or None")
+
+
+def chunk_point_id(entry_id: str, chunk_id: str) -> str:
+    """Point id of a chunk of an entry : md5 of both. Scoped to the entry, so identical chunks of two entries are
+    distinct points, and pruning the chunks of one entry never deletes a point another entry still produces.
+    """
+    return hashlib.md5(f"{entry_id}:{chunk_id}".encode()).hexdigest()
+
+
+def normalize_point_id(point_id: types.PointId) -> types.PointId:
+    """Qdrant returns UUID ids in their hyphenated form, eg: for chunk ids (md5 hex) written without hyphens.
+    Normalizes ids so ids sent to and received from Qdrant can be compared.
+    """
+    return str(uuid.UUID(point_id)) if isinstance(point_id, str) else point_id
@@ -0,0 +1,53 @@
+import zlib
+from datetime import timedelta
+
+import bytewax.operators as op
+from bytewax.dataflow import Stream
+
+from featurepipe.featurepipe_config import fp_settings
+from models.base_models import DataModel
+from models.content_enum import ContentDataEnum
+
+
+def sharded_content_type_key(data_model: DataModel, num_shards: int) -> str:
+    """Batching key : the content type, suffixed with a shard of the entry_id when num_shards > 1"""
+    if num_shards <= 1:
+        return data_model.type
+
+    # crc32 instead of hash(), which is randomized per process
+    shard = zlib.crc32(data_model.entry_id.encode()) % num_shards
+    return f"{data_model.type}-{shard}"
+
+
+def content_type_key(data_model: DataModel) -> str:
+    """Key of the embedding batches, sharded by fp_settings.EMBEDDING_BATCH_KEY_SHARDS"""
+    return sharded_content_type_key(data_model, fp_settings.EMBEDDING_BATCH_KEY_SHARDS)
+
+
+def raw_content_type_key(data_model: DataModel) -> str:
+    """Key of the raw document batches, sharded by fp_settings.CLEANING_BATCH_KEY_SHARDS"""
+    return sharded_content_type_key(data_model, fp_settings.CLEANING_BATCH_KEY_SHARDS)
+
+
+def batch_by_content_type(step_id: str,
+                          stream: Stream[DataModel],
+                          max_sizes: dict[str, int],
+                          timeouts_secs: dict[str, float]) -> Stream[tuple[str, list[DataModel]]]:
+    """Batches the stream into homogeneous batches keyed on the content type (posts, articles, repositories).
+    op.collect takes a single max_size and timeout per step. Hence the stream is split per content type, each
+    collected with its own settings, and merged back.
+    Keyed operators route all items of a key to one worker. To spread a content type across workers, the key
+    is suffixed with a shard of the entry_id, when fp_settings.EMBEDDING_BATCH_KEY_SHARDS > 1.
+    """
+    batched_streams = []
+    for data_type in (ContentDataEnum.POSTS, ContentDataEnum.ARTICLES, ContentDataEnum.REPOSITORIES):
+        type_stream = op.filter(f"{step_id} filter {data_type}", stream, lambda x, data_type=data_type: x.type == data_type)
+        type_keyed = op.key_on(f"{step_id} key {data_type}", type_stream, content_type_key)
+        batched_streams.append(
+            op.collect(f"{step_id} collect {data_type}",
+                       type_keyed,
+                       timeout=timedelta(seconds=timeouts_secs[data_type]),
+                       max_size=max_sizes[data_type])
+        )
+
+    return op.merge(f"{step_id} merge", *batched_streams)
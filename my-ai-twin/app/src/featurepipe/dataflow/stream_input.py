@@ -1,7 +1,8 @@
 import json
-import time
-from datetime import datetime
-from typing import Generic, Iterable, List, Optional, TypeVar
+import math
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Generic, Iterable, List, Optional, TypeVar
 
 from bytewax.inputs import FixedPartitionedSource, StatefulSourcePartition
 from featurepipe.featurepipe_config import fp_settings
@@ -15,68 +16,206 @@ DataT = TypeVar("DataT")
 MessageT = TypeVar("MessageT")
 
 
+def epoch_prefetch_count(min_prefetch_count: int) -> int:
+    """Sizes the prefetch window when acking on snapshot. A delivery stays unacked for up to 2 epochs, the epoch
+    that emitted it and the next one, so the window must hold 2 epochs of messages to keep the consumer busy.
+    """
+    epoch_msgs = math.ceil(fp_settings.BYTEWAX_SNAPSHOT_INTERVAL * fp_settings.RABBITMQ_MAX_MSGS_PER_SECOND)
+    return max(min_prefetch_count, 2 * epoch_msgs)
+
+
 class RabbitMQPartition (StatefulSourcePartition, Generic[DataT, MessageT]):
     """
     Creates connection between Bytewax and RabbitMQ, to transfer data from MQ to Bytewax streaming pipeline.
     By inheriting StatefullSourcePartition, enables snapshot functionality to save the state of the queue.
+
+    Messages are pushed by the broker to a consumer (basic_consume) instead of polled one at a time (basic_get).
+    The broker keeps up to `prefetch_count` unacknowledged messages buffered on this consumer's channel and each
+    next_batch() drains whatever is buffered, without blocking. When the queue is idle, next_awake() backs off
+    exponentially so Bytewax does not spin on an empty queue.
+
+    Acknowledgement modes :
+    - ack_on_snapshot=False : each batch is acked as soon as it is emitted i.e. at-most-once. A crash loses the
+      messages still being processed downstream.
+    - ack_on_snapshot=True : at-least-once. Delivery tags emitted in an epoch are acked in bulk (multiple=True) at
+      the snapshot of the following epoch, by when Bytewax has committed the snapshot of the epoch that consumed
+      them. On a crash the broker redelivers every unacked message. Hence the broker, not the Bytewax resume state,
+      tracks the position in the queue and snapshot() returns None.
     """
 
     # A good writeup on MQ Connection, Channel and Consumer difference - https://stackoverflow.com/a/48770082
-    def __init__(self, queue_name:str, resume_state:MessageT | None = None) -> None:
-        self._in_flight_msg_ids: MessageT = resume_state or set()
+    def __init__(self,
+                 queue_name:str,
+                 connection: RabbitMQConnection | None = None,
+                 prefetch_count: int = fp_settings.RABBITMQ_PREFETCH_COUNT,
+                 ack_on_snapshot: bool = fp_settings.RABBITMQ_ACK_ON_SNAPSHOT) -> None:
         self.queue_name = queue_name
-        self.connection = RabbitMQConnection()
+        self._ack_on_snapshot = ack_on_snapshot
+        self._max_batch_size = prefetch_count
+        self._prefetch_count = epoch_prefetch_count(prefetch_count) if ack_on_snapshot else prefetch_count
+        # highest delivery tag emitted in the current epoch and in the previous epoch (acked at the next snapshot)
+        self._last_emitted_tag: Optional[int] = None
+        self._pending_ack_tag: Optional[int] = None
+        # deliveries pushed by the broker, waiting to be emitted by next_batch(). Tuple of (delivery_tag, body)
+        self._buffer: deque[tuple[int, bytes]] = deque()
+        self._next_awake: Optional[datetime] = None
+        self._idle_backoff = timedelta(0)
+        # pika connections are not thread safe and Bytewax workers run as threads. Hence each partition
+        # owns a dedicated connection (and channel) instead of the RabbitMQConnection singleton.
+        self.connection = connection or RabbitMQConnection(shared=False)
+        self._start_consuming()
+
+
+    def _start_consuming(self) -> None:
+        # delivery tags are scoped to a channel. Unacked deliveries of a previous channel are redelivered by the broker
+        self._buffer.clear()
+        self._last_emitted_tag = None
+        self._pending_ack_tag = None
         self.connection.connect()
         self.channel = self.connection.get_channel()
+        if self.channel is None:
+            # connect() logs and swallows connection errors
+            raise ConnectionError(f"Unable to open a channel to RabbitMQ for Queue={self.queue_name}")
+        # prefetch only applies to manually acknowledged deliveries. Hence auto_ack=False in both ack modes
+        self.channel.basic_qos(prefetch_count=self._prefetch_count)
+        self.channel.basic_consume(queue=self.queue_name,
+                                   on_message_callback=self._on_message,
+                                   auto_ack=False)
+
+
+    def _reconnect(self) -> None:
+        # the broken connection is closed first, else its socket and heartbeat leak on every reconnect
+        try:
+            self.connection.close()
+        except Exception:
+            logger.warning(f"Failed to close the broken connection to Queue={self.queue_name}", exc_info=True)
+
+        try:
+            self._start_consuming()
+        except Exception:
+            logger.exception(f"Failed to reconnect to Queue={self.queue_name}")
+
+
+    def _on_message(self, channel, method_frame, header_frame, body) -> None:
+        self._buffer.append((method_frame.delivery_tag, body))
+
 
-    # def next_batch(self, sched: Optional[datetime]) -> Iterable[DataT] :
     def next_batch(self) -> Iterable[DataT] :
+        if self.channel is None:
+            # the last reconnect failed
+            self._schedule_after(timedelta(seconds=fp_settings.RABBITMQ_RECONNECT_DELAY_SECONDS))
+            self._reconnect()
+            return []
+
         try:
-            method_frame, header_frame, body_frame = self.channel.basic_get(
-                queue=self.queue_name,
-                auto_ack=True)
+            # dispatches the deliveries already received from the broker to _on_message, without blocking
+            self.channel.connection.process_data_events(time_limit=0)
         except Exception as e :
-            logger.error(f"Error while fetching message from Queue={self.queue_name}")
-            time.sleep(10)  #TODO - replace this hack with more elegant solution aka wait for connection before exec this operation
+            logger.error(f"Error while fetching message from Queue={self.queue_name}. Reconnecting....")
+            logger.exception(e)
+            self._schedule_after(timedelta(seconds=fp_settings.RABBITMQ_RECONNECT_DELAY_SECONDS))
+            self._reconnect()
+            return []
 
-            self.connection.connect()
-            self.channel = self.connection.get_channel()
+        if not self._buffer:
+            # back off exponentially while the queue stays empty
+            self._idle_backoff = min(
+                max(self._idle_backoff * 2, timedelta(milliseconds=fp_settings.RABBITMQ_IDLE_BACKOFF_MIN_MS)),
+                timedelta(milliseconds=fp_settings.RABBITMQ_IDLE_BACKOFF_MAX_MS))
+            self._schedule_after(self._idle_backoff)
             return []
 
-        if method_frame:
-            msg_id = method_frame.delivery_tag
-            self._in_flight_msg_ids.add(msg_id)
+        self._idle_backoff = timedelta(0)
+        self._next_awake = None
+
+        batch = []
+        delivery_tag = None
+        while self._buffer and len(batch) < self._max_batch_size:
+            delivery_tag, body = self._buffer.popleft()
+            batch.append(json.loads(body))
 
-            return [json.loads(body_frame)]
+        if self._ack_on_snapshot:
+            self._last_emitted_tag = delivery_tag
         else:
-            return []
+            # ack everything up to and including the last emitted message, in one round trip
+            self.channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
+        return batch
+
+
+    def next_awake(self) -> Optional[datetime]:
+        return self._next_awake
+
+
+    def _schedule_after(self, delay: timedelta) -> None:
+        self._next_awake = datetime.now(timezone.utc) + delay
+
 
     def snapshot(self) -> MessageT:
-        return self._in_flight_msg_ids
+        """Called by Bytewax at the end of every epoch. Acks, in bulk, the deliveries emitted in the previous epoch.
+        """
+        if self._ack_on_snapshot:
+            if self._pending_ack_tag is not None:
+                try:
+                    self.channel.basic_ack(delivery_tag=self._pending_ack_tag, multiple=True)
+                except Exception as e:
+                    # unacked deliveries are redelivered once the channel is re-opened
+                    logger.error(f"Failed to ack deliveries up to tag {self._pending_ack_tag} on Queue={self.queue_name}")
+                    logger.exception(e)
 
-    def garbage_collect(self, state):
-        closed_in_flight_msg_ids = state
-        for msg_id in closed_in_flight_msg_ids:
-            self.channel.basic_ack(delivery_tag=msg_id)
-            self._in_flight_msg_ids.remove(msg_id)
+            self._pending_ack_tag = self._last_emitted_tag
+            self._last_emitted_tag = None
+
+        return None
 
 
     def close(self):
-        self.channel.close()
+        if self.channel is not None:
+            self.channel.close()
+        self.connection.close()
 
 
 
 class RabbitMQSource(FixedPartitionedSource):
+    """
+    Partitioned source where every partition is a competing consumer on the same queue. RabbitMQ round-robins
+    messages across consumers, so the dataflow scales with the number of partitions spread across Bytewax
+    workers (threads, processes or hosts). Each partition's unacked deliveries are tracked by the broker on that
+    partition's channel and redelivered after a crash.
+    """
+
+    def __init__(self,
+                 queue_name: str = fp_settings.RABBITMQ_QUEUE_NAME,
+                 num_partitions: int = fp_settings.RABBITMQ_NUM_PARTITIONS,
+                 connection_factory: Callable[[], RabbitMQConnection] | None = None,
+                 prefetch_count: int = fp_settings.RABBITMQ_PREFETCH_COUNT,
+                 ack_on_snapshot: bool = fp_settings.RABBITMQ_ACK_ON_SNAPSHOT) -> None:
+        if num_partitions < 1:
+            raise ValueError(f"num_partitions must be >= 1, received {num_partitions}")
+
+        self.queue_name = queue_name
+        self.num_partitions = num_partitions
+        self._connection_factory = connection_factory
+        self.prefetch_count = prefetch_count
+        self.ack_on_snapshot = ack_on_snapshot
+
     def list_parts(self) -> List[str] :
-        return ["single partition"]
+        # NOTE : partition names are the keys of the recovery state. Changing the # of partitions of a
+        # recovery enabled dataflow drops the resume state of the removed partitions.
+        return [f"{self.queue_name}-{index}" for index in range(self.num_partitions)]
 
     def build_part(self,
                    now:datetime,
                    for_part: str,
                    resume_state: MessageT | None = None) -> StatefulSourcePartition[DataT, MessageT]:
 
-        # #TODO : Each instantiation results in new RabbitMQ connection. Shud this be optimized ??
-        return RabbitMQPartition(queue_name=fp_settings.RABBITMQ_QUEUE_NAME)
+        # resume_state is ignored. The broker redelivers whatever was not acked before the dataflow stopped
+        logger.info(f"Building RabbitMQ partition {for_part} for queue {self.queue_name}")
+        connection = self._connection_factory() if self._connection_factory else None
+        return RabbitMQPartition(queue_name=self.queue_name,
+                                 connection=connection,
+                                 prefetch_count=self.prefetch_count,
+                                 ack_on_snapshot=self.ack_on_snapshot)
 
 
 
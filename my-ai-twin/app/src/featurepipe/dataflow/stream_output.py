@@ -1,9 +1,10 @@
 # from typing import List
 from enum import Enum
 from bytewax.outputs import DynamicSink, StatelessSinkPartition
-from qdrant_client.models import PointStruct
+from qdrant_client.models import PointStruct, PointIdsList
 
-from db.qdrant_connection import QdrantDatabaseConnector
+from db.qdrant_connection import QdrantDatabaseConnector, chunk_point_id, normalize_point_id
+from featurepipe.featurepipe_config import fp_settings
 from models.db.documents import RepositoryDocument, ArticleDocument, PostDocument
 from core.logger_utils import get_logger
 from models.base_models import VectorDBDataModel
@@ -54,6 +55,10 @@ class BytewaxQdrantOutput(DynamicSink):
                     self._connection.create_vector_collection(collection_name)
                 else:
                     self._connection.create_non_vector_collection(collection_name)
+            else:
+                # collections created before payload indexing
+                if is_vector:
+                    self._connection.create_payload_indexes(collection_name)
 
 
     def build(self, step_id:str, worker_index:int, worker_count: int) -> StatelessSinkPartition:
@@ -66,7 +71,7 @@ class BytewaxQdrantOutput(DynamicSink):
             worker_count (int): ignored
 
         Raises:
-            ValueError: if this class _sink_type is not initialized with the 2 supported value, 'clean', 'vector'
+            ValueError: if this class _sink_type is not initialized with the 2 supported value, 'clean' or 'vector'
             during instantiation
 
         Returns:
@@ -108,7 +113,7 @@ class QdrantCleanedDataSink(StatelessSinkPartition):
             ]
             # get datatype from the first PointStruct, meta field assuming datatype is identical across
             data_type: str = point_structs[0].payload['type']
-            collection_name = get_vector_collection_name(data_type)
+            collection_name = get_clean_collection_name(data_type)
 
             self._client.write_batch_data(collection_name=collection_name, points_batch=point_structs)
             logger.info(f"Successfully inserted cleaned data {collection_name},  num={len(point_structs)}")
@@ -116,12 +121,22 @@ class QdrantCleanedDataSink(StatelessSinkPartition):
 
 
 class QdrantVectorDataSink(StatelessSinkPartition):
-    def __init__(self, connection: QdrantDatabaseConnector):
+    """Writes the embedded chunks. With idempotent writes, the chunks an entry no longer produces eg: after the entry
+    was edited and re-crawled, are deleted once all the chunks of its latest chunking are written. Batches are keyed
+    on the entry_id (see content_type_key), hence all the chunks of an entry, in order, reach the same sink partition.
+    """
+
+    def __init__(self, connection: QdrantDatabaseConnector, idempotent: bool | None = None):
         self._client = connection
+        self._idempotent = fp_settings.QDRANT_IDEMPOTENT_WRITES if idempotent is None else idempotent
+        # point ids written so far per entry_id and chunking_id, chunkings in the order they came in
+        self._written_chunks: dict[str, dict[str, list]] = {}
 
 
     def write_batch(self, items: list[tuple[str, list[VectorDBDataModel]]]) -> None:
         logger.info(f"List of tuples received for Vector models= {len(items)}")
+        # point ids of the latest chunking of each entry fully written by this call, keyed on collection and entry_id
+        written_entries: dict[str, dict[str, set]] = {}
         for batch_tup in items :
             logger.info(f"Batch size received for Vector models= {len(batch_tup)}")
             # the first element is a string identifying the batch which we ignore
@@ -133,22 +148,95 @@ class QdrantVectorDataSink(StatelessSinkPartition):
             # self._client.write_data(collection_name=collection_name, points=Batch(ids=ids, vectors=vectors, payloads=metadata))
 
             point_structs: list[PointStruct] = [
-                PointStruct(id=payload[0],
+                PointStruct(id=chunk_point_id(item.entry_id, payload[0]),
                             vector=payload[1],
                             payload= payload[2] if payload[2] is not None else {}
-                        ) for payload in payloads
+                        ) for item, payload in zip(batch_items, payloads)
             ]
 
             # get datatype from the first PointStruct, meta field assuming datatype is identical across
             data_type: str = point_structs[0].payload['type']
             collection_name = get_vector_collection_name(data_type)
 
+            if self._idempotent:
+                new_point_structs = self._skip_existing_points(collection_name, point_structs)
+                if new_point_structs:
+                    logger.info(f"Data being inserted into Qdrant has # of Ids= {len(new_point_structs)}")
+                    self._client.write_batch_data(collection_name, points_batch=new_point_structs)
+                    logger.info(f"Successfully inserted vector data : {collection_name}, num={len(new_point_structs)}")
+
+                self._track_written_chunks(batch_items, point_structs, written_entries.setdefault(collection_name, {}))
+                continue
+
             logger.info(f"Data being inserted into Qdrant has # of Ids= {len(point_structs)}")
 
             self._client.write_batch_data(collection_name, points_batch=point_structs)
 
             logger.info(f"Successfully inserted vector data : {collection_name}, num={len(point_structs)}")
 
+        for collection_name, entry_point_ids in written_entries.items():
+            if entry_point_ids:
+                self._delete_stale_chunks(collection_name, entry_point_ids)
+
+
+    def _track_written_chunks(self,
+                              batch_items: list[VectorDBDataModel],
+                              point_structs: list[PointStruct],
+                              written_entries: dict[str, set]) -> None:
+        """Records the point ids written per chunking of the entries. Adds to written_entries the entries whose
+        chunking is now fully written, with its point ids. Older chunkings of these entries are superseded, and
+        dropped.
+        """
+        for item, point in zip(batch_items, point_structs):
+            # chunks of an unknown chunking, eg: embedded by the deprecated per item path, are not pruned on
+            if item.chunking_id is None:
+                continue
+
+            chunkings = self._written_chunks.setdefault(item.entry_id, {})
+            point_ids = chunkings.setdefault(item.chunking_id, [])
+            point_ids.append(normalize_point_id(point.id))
+            if len(point_ids) < item.num_entry_chunks:
+                continue
+
+            for chunking_id in list(chunkings):
+                del chunkings[chunking_id]
+                if chunking_id == item.chunking_id:
+                    break
+            if not chunkings:
+                del self._written_chunks[item.entry_id]
+            # a later chunking of the same entry, in the same call, replaces this one
+            written_entries[item.entry_id] = set(point_ids)
+
+
+    def _delete_stale_chunks(self, collection_name: str, entry_point_ids: dict[str, set]) -> None:
+        """Deletes the stored points of the entries that are neither in their latest written chunking, nor in a newer
+        chunking still being written
+        """
+        stored_ids = self._client.scroll_ids_by_payload(collection_name, key="id", values=list(entry_point_ids))
+        stale_ids = []
+        for entry_id, point_ids in entry_point_ids.items():
+            kept_ids = point_ids.union(*self._written_chunks.get(entry_id, {}).values())
+            stale_ids.extend(point_id for point_id in stored_ids.get(entry_id, set())
+                             if normalize_point_id(point_id) not in kept_ids)
+
+        if stale_ids:
+            self._client.delete_points(collection_name, points_selector=PointIdsList(points=stale_ids))
+            logger.info(f"Deleted stale chunks from {collection_name}, num={len(stale_ids)}")
+
+
+    def _skip_existing_points(self, collection_name: str, point_structs: list[PointStruct]) -> list[PointStruct]:
+        """Drops the points already stored in the collection with the same payload. Point ids are derived from the
+        entry and chunk content, so a stored id holds a vector of the identical chunk : new or changed chunks get a new id,
+        and points whose payload changed are written again eg: a corrected author_id, or embeddings of another model or
+        backend (the embedding_model payload field).
+        """
+        stored_payloads = self._client.retrieve_payloads(collection_name, [point.id for point in point_structs])
+        new_points = [point for point in point_structs
+                      if stored_payloads.get(normalize_point_id(point.id)) != point.payload]
+        logger.info(f"Skipping points already stored in {collection_name}, num={len(point_structs) - len(new_points)}")
+
+        return new_points
+
 
 
 def get_clean_collection_name(data_type:int) -> str:
@@ -1,4 +1,5 @@
 import hashlib
+import uuid
 from abc import ABC, abstractmethod
 
 from models.content_enum import ContentDataEnum
@@ -93,15 +94,35 @@ class RepositoryChunkingHandler(ChunkingDataHandler):
 
 
 class ChunkingHandlerFactory:
-    @staticmethod
-    def create_handler(data_type) -> ChunkingDataHandler:
-        if (data_type == ContentDataEnum.POSTS):
-            return PostChunkingHandler()
-        elif (data_type == ContentDataEnum.ARTICLES):
-            return ArticleChunkingHandler()
-        elif (data_type == ContentDataEnum.REPOSITORIES):
-            return RepositoryChunkingHandler()
-        else :
-            raise ValueError("Unsupported chunking handler data")
+    # handlers are stateless, hence one instance per data type is shared
+    _handlers: dict[str, ChunkingDataHandler] = {}
+
+    @classmethod
+    def create_handler(cls, data_type) -> ChunkingDataHandler:
+        handler = cls._handlers.get(data_type)
+        if handler is None:
+            if (data_type == ContentDataEnum.POSTS):
+                handler = PostChunkingHandler()
+            elif (data_type == ContentDataEnum.ARTICLES):
+                handler = ArticleChunkingHandler()
+            elif (data_type == ContentDataEnum.REPOSITORIES):
+                handler = RepositoryChunkingHandler()
+            else :
+                raise ValueError("Unsupported chunking handler data")
+            cls._handlers[data_type] = handler
+
+        return handler
+
+
+def chunk_data_model(data_model: DataModel) -> list[DataModel]:
+    """Module level function, so it can be sent to a process pool. The chunks are tagged with the id of this chunking
+    of the entry and their count, for the vector sink to tell when all of them are written"""
+    chunk_models = ChunkingHandlerFactory.create_handler(data_type=data_model.type).chunk(data_model=data_model)
+    chunking_id = uuid.uuid4().hex
+    for chunk_model in chunk_models:
+        chunk_model.chunking_id = chunking_id
+        chunk_model.num_entry_chunks = len(chunk_models)
+
+    return chunk_models
 
 
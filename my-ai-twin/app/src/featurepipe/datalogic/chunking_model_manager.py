@@ -1,7 +1,8 @@
 import threading
 from typing import Optional
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter, SentenceTransformersTokenTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter, SentenceTransformersTokenTextSplitter
+from transformers import AutoTokenizer, PreTrainedTokenizerFast
 
 from core.config import settings
 from core.logger_utils import get_logger
@@ -10,6 +11,7 @@ class ChunkingModelManager:
 
     _char_splitter_model: Optional[RecursiveCharacterTextSplitter] = None
     _token_splitter_model: Optional[SentenceTransformersTokenTextSplitter] = None
+    _fast_tokenizer: Optional[PreTrainedTokenizerFast] = None
     _lock = threading.Lock()
 
     @classmethod
@@ -41,4 +43,16 @@ class ChunkingModelManager:
 
 
 
+    @classmethod
+    def get_fast_tokenizer(cls) -> PreTrainedTokenizerFast:
+        """Rust backed tokenizer of the text embedding model, which returns offset mappings"""
+        if cls._fast_tokenizer is None:
+            with cls._lock:
+                if cls._fast_tokenizer is None:
+                    cls._fast_tokenizer = AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL_ID, use_fast=True)
+
+        return cls._fast_tokenizer
+
+
+
 
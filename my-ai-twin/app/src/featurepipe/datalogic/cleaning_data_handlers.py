@@ -77,15 +77,27 @@ class RepositoryCleaningHandler(CleaningDataHander):
 
 
 class CleaningHandlerFactory:
-
-    @staticmethod
-    def create_handler(data_type) -> CleaningDataHander:
-        if data_type == ContentDataEnum.POSTS:
-            return PostCleaningHander()
-        elif data_type == ContentDataEnum.ARTICLES:
-            return ArticleCleaningHandler()
-        elif data_type == ContentDataEnum.REPOSITORIES:
-            return RepositoryCleaningHandler()
-        else :
-            raise ValueError(f"CleaningHander unsupported for given data type: {data_type}")
+    # handlers are stateless, hence one instance per data type is shared
+    _handlers: dict[str, CleaningDataHander] = {}
+
+    @classmethod
+    def create_handler(cls, data_type) -> CleaningDataHander:
+        handler = cls._handlers.get(data_type)
+        if handler is None:
+            if data_type == ContentDataEnum.POSTS:
+                handler = PostCleaningHander()
+            elif data_type == ContentDataEnum.ARTICLES:
+                handler = ArticleCleaningHandler()
+            elif data_type == ContentDataEnum.REPOSITORIES:
+                handler = RepositoryCleaningHandler()
+            else :
+                raise ValueError(f"CleaningHander unsupported for given data type: {data_type}")
+            cls._handlers[data_type] = handler
+
+        return handler
+
+
+def clean_data_model(data_model: DataModel) -> DataModel:
+    """Module level function, so it can be sent to a process pool"""
+    return CleaningHandlerFactory.create_handler(data_type=data_model.type).clean(data_model=data_model)
 
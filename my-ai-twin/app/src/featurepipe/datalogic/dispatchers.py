@@ -1,17 +1,69 @@
 from typing_extensions import deprecated
+import multiprocessing as mp
+import threading
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
 from core.logger_utils import get_logger
+from featurepipe.featurepipe_config import fp_settings
 from models.content_enum import ContentDataEnum
 from models.base_models import DataModel
 from models.raw_models import PostRawModel, ArticleRawModel, RepositoryRawModel
 
-from featurepipe.datalogic.chunking_data_handlers import ChunkingHandlerFactory
-from featurepipe.datalogic.cleaning_data_handlers import CleaningHandlerFactory
+from featurepipe.datalogic.chunking_data_handlers import ChunkingHandlerFactory, chunk_data_model
+from featurepipe.datalogic.cleaning_data_handlers import CleaningHandlerFactory, clean_data_model
 from featurepipe.datalogic.embedding_data_handlers import EmbeddingHandlerFactory, EmbeddingDataHandler
+from featurepipe.datalogic.embedding_worker_pool import EmbeddingWorkerPool
 
 
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class DispatchPool:
+    """Pool processing the documents of a batch in parallel, configured by fp_settings.DISPATCH_POOL_KIND and
+    DISPATCH_POOL_SIZE. Shared by the Bytewax workers of the process. Size 0 = documents are processed inline.
+    """
+
+    _executor: Optional[Executor] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls) -> Optional[Executor]:
+        if fp_settings.DISPATCH_POOL_SIZE <= 0:
+            return None
+
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    logger.info(f"Starting {fp_settings.DISPATCH_POOL_KIND} pool of {fp_settings.DISPATCH_POOL_SIZE} workers")
+                    if fp_settings.DISPATCH_POOL_KIND == "process":
+                        cls._executor = ProcessPoolExecutor(max_workers=fp_settings.DISPATCH_POOL_SIZE,
+                                                            mp_context=mp.get_context("spawn"))
+                    elif fp_settings.DISPATCH_POOL_KIND == "thread":
+                        cls._executor = ThreadPoolExecutor(max_workers=fp_settings.DISPATCH_POOL_SIZE,
+                                                           thread_name_prefix="dispatch")
+                    else:
+                        raise ValueError(f"Unsupported dispatch pool kind {fp_settings.DISPATCH_POOL_KIND}")
+        return cls._executor
+
+
+    @classmethod
+    def map(cls, fn: Callable[[T], R], items: list[T]) -> list[R]:
+        """Applies fn to each item. Results are in the order of items"""
+        executor = cls.get_executor()
+        if executor is None or len(items) < 2:
+            return [fn(item) for item in items]
+
+        # chunks amortize the IPC of process pools, ignored by thread pools
+        chunk_size = max(len(items) // (fp_settings.DISPATCH_POOL_SIZE * 4), 1)
+        return list(executor.map(fn, items, chunksize=chunk_size))
+
+
+
 class RawDispatcher:
     @staticmethod
     def handle_mq_message(message: dict) -> DataModel:
@@ -44,6 +96,24 @@ class CleaningDispatcher:
         return clean_model
 
 
+    @classmethod
+    def dispatch_batch_cleaner(cls, batched_data: tuple[str, list[DataModel]]) -> tuple[str, list[DataModel]]:
+        """Cleans a batch of raw documents, in bulk
+
+        Args:
+            batched_data (tuple[str, list[DataModel]]): raw documents, keyed on their content type
+
+        Returns:
+            tuple[str, list[DataModel]]: the batch key and the cleaned documents, in the same order
+        """
+        batch_key, data_models = batched_data
+        clean_models = DispatchPool.map(clean_data_model, data_models)
+
+        logger.info(f"Batch cleaned {len(clean_models)} documents", batch_key=batch_key)
+
+        return (batch_key, clean_models)
+
+
 class ChunkingDispatcher:
     chunk_factory = ChunkingHandlerFactory()
 
@@ -51,14 +121,32 @@ class ChunkingDispatcher:
     def dispatch_chunker(cls, data_model: DataModel) -> list[DataModel]:
         data_type = data_model.type
 
-        handler = cls.chunk_factory.create_handler(data_type=data_type)
-        chunk_models = handler.chunk(data_model=data_model)
+        chunk_models = chunk_data_model(data_model)
 
         logger.info("Cleaned Data chunked successfully.", data_type=data_type, chunked_content_len=len(chunk_models))
 
         return chunk_models
 
 
+    @classmethod
+    def dispatch_batch_chunker(cls, batched_data: tuple[str, list[DataModel]]) -> list[list[DataModel]]:
+        """Chunks a batch of cleaned documents, in bulk
+
+        Args:
+            batched_data (tuple[str, list[DataModel]]): cleaned documents, keyed on their content type
+
+        Returns:
+            list[list[DataModel]]: the chunks of each document, in the same order as the documents
+        """
+        batch_key, data_models = batched_data
+        chunk_models = DispatchPool.map(chunk_data_model, data_models)
+
+        logger.info(f"Batch chunked {len(data_models)} documents in {sum(len(chunks) for chunks in chunk_models)} chunks",
+                    batch_key=batch_key)
+
+        return chunk_models
+
+
 
 class EmbeddingDispatcher:
     embedding_factory = EmbeddingHandlerFactory()   #class var
@@ -68,6 +156,10 @@ class EmbeddingDispatcher:
     # vars to capture stats on each individual embedding
     single_total_embedding_time = 0
     single_total_embedded_items = 0
+    _stats_lock = threading.Lock()
+    # threads waiting on the EmbeddingWorkerPool, one per batch in flight
+    _batch_executor: Optional[ThreadPoolExecutor] = None
+    _batch_executor_lock = threading.Lock()
 
     @classmethod
     @deprecated("Use the batching function dispatch_batch_embedder(...)")
@@ -97,18 +189,25 @@ class EmbeddingDispatcher:
         """Process embedding for batch of texts (chunks)
 
         Args:
-            batched_data (tuple[str, list[DataModel]]): chuncked text
+            batched_data (tuple[str, list[DataModel]]): chuncked text, keyed on its content type (posts, articles etc..)
+
+        Raises:
+            ValueError: if the batch is not homogeneous i.e. it holds more than one content type
 
         Returns:
-            tuple[str, list[DataModel]]: _description_
+            tuple[str, list[DataModel]]: the batch key and the embedded models
         """
 
         batch_key, data_models = batched_data
         if not data_models:
             return (batch_key, [])
 
-        # all items in the batch must be same type
+        # all items in the batch must be same type, since the handler (embedding model) is picked by type
         data_type: str = data_models[0].type
+        mismatched_types = {dm.type for dm in data_models if dm.type != data_type}
+        if mismatched_types:
+            raise ValueError(f"Batch {batch_key} of type {data_type} contains items of type(s) {mismatched_types}")
+
         handler: EmbeddingDataHandler = cls.embedding_factory.create_handler(data_type)
 
         # measure total time
@@ -117,8 +216,9 @@ class EmbeddingDispatcher:
         time_elapsed: int | float = time.perf_counter() - start_time
 
 
-        cls.total_embedding_time += time_elapsed
-        cls.total_embedded_items += len(embeds_models)
+        with cls._stats_lock:
+            cls.total_embedding_time += time_elapsed
+            cls.total_embedded_items += len(embeds_models)
 
         logger.info(f"Batch embedded {len(embeds_models)} chunks", data_type=data_type)
         logger.info(f"Total time to embed a total of {cls.total_embedded_items} items, so far, is= {cls.total_embedding_time}")
@@ -126,3 +226,31 @@ class EmbeddingDispatcher:
         return (batch_key, embeds_models)
 
 
+    @classmethod
+    def dispatch_batches_embedder(cls, batches: list[tuple[str, list[DataModel]]]) -> list[tuple[str, list[DataModel]]]:
+        """Embeds all the batches received by the Bytewax step at once. With the EmbeddingWorkerPool, every batch is
+        submitted to the pool before the first one is collected, so the batches are embedded concurrently, one per
+        worker process. Without the pool, batches are embedded inline, one after the other.
+
+        Args:
+            batches (list[tuple[str, list[DataModel]]]): chunked text batches, each keyed on its content type
+
+        Returns:
+            list[tuple[str, list[DataModel]]]: the batch keys and the embedded models, in the same order as batches
+        """
+        if len(batches) < 2 or EmbeddingWorkerPool.get_instance() is None:
+            return [cls.dispatch_batch_embedder(batched_data) for batched_data in batches]
+
+        return list(cls._get_batch_executor().map(cls.dispatch_batch_embedder, batches))
+
+
+    @classmethod
+    def _get_batch_executor(cls) -> ThreadPoolExecutor:
+        if cls._batch_executor is None:
+            with cls._batch_executor_lock:
+                if cls._batch_executor is None:
+                    # one batch queued per worker process on top of the ones embedded, so no worker waits for the next
+                    cls._batch_executor = ThreadPoolExecutor(max_workers=2 * fp_settings.EMBEDDING_WORKER_POOL_SIZE,
+                                                             thread_name_prefix="embedding-batch")
+        return cls._batch_executor
+
@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from featurepipe.featurepipe_config import fp_settings
+from core.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite limits the # of host parameters per statement
+_MAX_SQL_PARAMS = 500
+
+
+class EmbeddingCache:
+    """Persistent, content addressed cache of embeddings, backed by SQLite. Entries are keyed on the model id and
+    the chunk hash (chunk_id = md5 of the chunk content), so re-ingesting an unchanged chunk never re-embeds it.
+    Least recently used entries are evicted once the cache holds more than max_entries.
+    """
+
+    _instance: Optional["EmbeddingCache"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path: str, max_entries: int) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # shared by Bytewax worker threads, access is serialized by self._lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        # WAL lets Bytewax processes, sharing the file, read while another one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_access INTEGER NOT NULL,
+                PRIMARY KEY (model_id, chunk_hash)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+
+
+    @classmethod
+    def get_instance(cls) -> Optional["EmbeddingCache"]:
+        """Process wide cache configured by fp_settings. Returns None when the cache is disabled."""
+        if not fp_settings.EMBEDDING_CACHE_ENABLED:
+            return None
+
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    logger.info(f"Opening embedding cache at {fp_settings.EMBEDDING_CACHE_PATH}")
+                    cls._instance = cls(db_path=fp_settings.EMBEDDING_CACHE_PATH,
+                                        max_entries=fp_settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        return cls._instance
+
+
+    def get_many(self, model_id: str, chunk_hashes: list[str]) -> dict[str, np.ndarray]:
+        """Looks up the embeddings of the given chunk hashes, computed by the given model.
+
+        Returns:
+            dict[str, np.ndarray]: embeddings found, keyed on chunk hash. Missing hashes are not in the dict
+        """
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(unique_hashes), _MAX_SQL_PARAMS):
+                batch = unique_hashes[start : start + _MAX_SQL_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, dtype, embedding FROM embeddings WHERE model_id = ? AND chunk_hash IN ({placeholders})",
+                    [model_id, *batch]).fetchall()
+                for chunk_hash, dtype, embedding in rows:
+                    found[chunk_hash] = np.frombuffer(embedding, dtype=dtype)
+
+            if found:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model_id = ? AND chunk_hash = ?",
+                    [(now, model_id, chunk_hash) for chunk_hash in found])
+
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+
+        return found
+
+
+    def put_many(self, model_id: str, embeddings: dict[str, np.ndarray]) -> None:
+        if not embeddings:
+            return
+
+        now = time.time_ns()
+        rows = [(model_id, chunk_hash, str(embedding.dtype), np.ascontiguousarray(embedding).tobytes(), now)
+                for chunk_hash, embedding in embeddings.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, chunk_hash, dtype, embedding, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            self._evict()
+            self._conn.execute("COMMIT")
+
+
+    def _evict(self) -> None:
+        """Deletes the least recently used entries over max_entries"""
+        num_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        num_to_evict = num_entries - self._max_entries
+        if num_to_evict > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (num_to_evict,))
+            logger.info(f"Evicted {num_to_evict} least recently used embeddings from the cache")
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
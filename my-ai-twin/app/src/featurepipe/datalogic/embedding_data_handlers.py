@@ -1,5 +1,5 @@
 
-from typing import Any
+from typing import Callable
 import time
 import numpy as np
 from typing_extensions import deprecated
@@ -11,7 +11,10 @@ from models.chunk_models import PostChunkModel, ArticleChunkModel, RepositoryChu
 from models.db_vector_models import PostVectorDBModel, ArticleVectorDBModel, RepositoryVectorDBModel
 
 from featurepipe.utils.embeddings_util import batch_encode_text, batch_encode_code_using_BGE, convert_text_to_embedding, convert_repotext_to_embedding_BGE
+from featurepipe.datalogic.embedding_cache import EmbeddingCache
+from featurepipe.datalogic.embedding_model_manager import EmbeddingModelManager
 
+from core.config import settings
 from core.logger_utils import get_logger
 
 logger = get_logger(__name__)
@@ -27,6 +30,38 @@ class EmbeddingDataHandler(ABC):
     def embed_batch(self, data_models: list[DataModel]) -> list[DataModel]:
         return [self.embed(dm) for dm in data_models]
 
+    @staticmethod
+    def _encode_with_cache(data_models: list[DataModel],
+                           encode_fn: Callable[[list[str]], np.ndarray],
+                           model_id: str) -> list[np.ndarray]:
+        """Looks up the embeddings of the chunks in the EmbeddingCache, by model id and chunk_id (md5 of the chunk),
+        and only encodes the chunks not found in the cache.
+
+        Args:
+            data_models (list[DataModel]): chunk models, with chunk_id and chunk_content
+            encode_fn (Callable[[list[str]], np.ndarray]): batch encoding function eg: batch_encode_text
+            model_id (str): id of the model used by encode_fn
+
+        Returns:
+            list[np.ndarray]: embeddings in the same order as data_models
+        """
+        cache = EmbeddingCache.get_instance()
+        if cache is None:
+            return list(encode_fn([dm.chunk_content for dm in data_models]))
+
+        embeddings = cache.get_many(model_id, [dm.chunk_id for dm in data_models])
+        # identical chunks are encoded once
+        missing_models = list({dm.chunk_id: dm for dm in data_models if dm.chunk_id not in embeddings}.values())
+        if missing_models:
+            new_embeddings = encode_fn([dm.chunk_content for dm in missing_models])
+            computed = {dm.chunk_id: embedding for dm, embedding in zip(missing_models, new_embeddings)}
+            cache.put_many(model_id, computed)
+            embeddings.update(computed)
+
+        logger.info(f"Embedding cache: {len(data_models) - len(missing_models)} of {len(data_models)} chunks cached",
+                    **cache.stats())
+        return [embeddings[dm.chunk_id] for dm in data_models]
+
 
 class PostEmbeddingHandler(EmbeddingDataHandler):
     @deprecated("Please use embed_batch function")
@@ -43,10 +78,10 @@ class PostEmbeddingHandler(EmbeddingDataHandler):
 
     def embed_batch(self, data_models: list[PostChunkModel]) -> list[PostVectorDBModel] :
         start_time: int | float = time.perf_counter()
-        texts: list[str] = [dm.chunk_content for dm in data_models]
 
-        # batch encode all
-        embeddings: np.ndarray[tuple[Any, ...], dtype[Any]] = batch_encode_text(texts)
+        # batch encode all, except the chunks already in the cache
+        model_key = EmbeddingModelManager.model_key(settings.EMBEDDING_MODEL_ID)
+        embeddings: list[np.ndarray] = self._encode_with_cache(data_models, batch_encode_text, model_key)
         end_time: int | float = time.perf_counter()
         logger.info(f"Time to convert text to embeddings: {end_time - start_time}")
 
@@ -59,6 +94,9 @@ class PostEmbeddingHandler(EmbeddingDataHandler):
                     chunk_id= data_model.chunk_id,
                     chunk_content= data_model.chunk_content,
                     embedded_content= embeds_text,
+                    embedding_model= model_key,
+                    chunking_id= data_model.chunking_id,
+                    num_entry_chunks= data_model.num_entry_chunks,
                     author_id= data_model.author_id
             ) for data_model, embeds_text in zip(data_models, embeddings)
         ]
@@ -81,12 +119,12 @@ class ArticleEmbeddingHandler(EmbeddingDataHandler):
 
     def embed_batch(self, data_models: list[ArticleChunkModel]) -> list[ArticleVectorDBModel]:
         start_time: int | float = time.perf_counter()
-        texts: list[str] = [dm.chunk_content for dm in data_models]
 
-        # batch encode to embeddings
-        embeddings: np.ndarray[tuple[Any, ...], dtype[Any]] = batch_encode_text(texts)
+        # batch encode to embeddings, except the chunks already in the cache
+        model_key = EmbeddingModelManager.model_key(settings.EMBEDDING_MODEL_ID)
+        embeddings: list[np.ndarray] = self._encode_with_cache(data_models, batch_encode_text, model_key)
         end_time: int | float = time.perf_counter()
-        logger.info(f"Time to convert {len(texts)} no of texts to embeddings: {end_time - start_time}")
+        logger.info(f"Time to convert {len(data_models)} no of texts to embeddings: {end_time - start_time}")
 
         # create model
         return [
@@ -98,6 +136,9 @@ class ArticleEmbeddingHandler(EmbeddingDataHandler):
                     chunk_id= data_model.chunk_id,
                     chunk_content= data_model.chunk_content,
                     embedded_content= embeds_text,
+                    embedding_model= model_key,
+                    chunking_id= data_model.chunking_id,
+                    num_entry_chunks= data_model.num_entry_chunks,
                     author_id= data_model.author_id
             ) for data_model, embeds_text in zip(data_models, embeddings)
         ]
@@ -126,13 +167,13 @@ class RepositoryEmbeddingHandler(EmbeddingDataHandler) :
     def embed_batch(self, data_models: list[RepositoryChunkModel]) -> list[RepositoryVectorDBModel] :
 
         start_time: int | float = time.perf_counter()
-        texts: list[str] = [dm.chunk_content for dm in data_models]
 
-        # batch embed
-        embeddings: np.ndarray[tuple[Any, ...], dtype[Any]] = batch_encode_code_using_BGE(texts)
+        # batch embed, except the chunks already in the cache
+        model_key = EmbeddingModelManager.model_key(settings.EMBEDDING_MODEL_FOR_CODE_ID)
+        embeddings: list[np.ndarray] = self._encode_with_cache(data_models, batch_encode_code_using_BGE, model_key)
 
         end_time: int | float = time.perf_counter()
-        logger.info(f"Time to convert {len(texts)} no of texts to embeddings: {end_time - start_time}")
+        logger.info(f"Time to convert {len(data_models)} no of texts to embeddings: {end_time - start_time}")
 
         return [
             RepositoryVectorDBModel(
@@ -144,22 +185,32 @@ class RepositoryEmbeddingHandler(EmbeddingDataHandler) :
                 chunk_content= data_model.chunk_content,
                 # embedded_content= convert_text_to_embedding(data_model.chunk_content),
                 embedded_content= embeds_text,
+                embedding_model= model_key,
+                chunking_id= data_model.chunking_id,
+                num_entry_chunks= data_model.num_entry_chunks,
                 owner_id= data_model.owner_id,
             ) for data_model, embeds_text in zip(data_models, embeddings)
         ]
 
 
 class EmbeddingHandlerFactory:
-
-    @staticmethod
-    def create_handler(data_type) -> EmbeddingDataHandler:
-        if (data_type == ContentDataEnum.POSTS):
-            return PostEmbeddingHandler()
-        elif (data_type == ContentDataEnum.ARTICLES):
-            return ArticleEmbeddingHandler()
-        elif (data_type == ContentDataEnum.REPOSITORIES):
-            return RepositoryEmbeddingHandler()
-        else:
-            raise ValueError(f"Embedding handler unsupported for data type {data_type}")
+    # handlers are stateless, hence one instance per data type is shared
+    _handlers: dict[str, EmbeddingDataHandler] = {}
+
+    @classmethod
+    def create_handler(cls, data_type) -> EmbeddingDataHandler:
+        handler = cls._handlers.get(data_type)
+        if handler is None:
+            if (data_type == ContentDataEnum.POSTS):
+                handler = PostEmbeddingHandler()
+            elif (data_type == ContentDataEnum.ARTICLES):
+                handler = ArticleEmbeddingHandler()
+            elif (data_type == ContentDataEnum.REPOSITORIES):
+                handler = RepositoryEmbeddingHandler()
+            else:
+                raise ValueError(f"Embedding handler unsupported for data type {data_type}")
+            cls._handlers[data_type] = handler
+
+        return handler
 
 
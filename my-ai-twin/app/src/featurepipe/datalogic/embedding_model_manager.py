@@ -1,4 +1,5 @@
 import threading
+from pathlib import Path
 from typing import Optional
 import torch
 
@@ -10,6 +11,54 @@ from core.logger_utils import get_logger
 
 logger = get_logger(__name__)
 
+TORCH_BACKEND = "torch"
+ONNX_BACKEND = "onnx"
+ONNX_INT8_BACKEND = "onnx-int8"
+
+
+def load_sentence_transformer(model_id: str, backend: str, device: str) -> SentenceTransformer:
+    """Loads a SentenceTransformer with the given inference backend.
+
+    Args:
+        model_id (str): HuggingFace model id or local path eg: BAAI/bge-small-en-v1.5
+        backend (str): 'torch', 'onnx' (ONNX Runtime, fp32) or 'onnx-int8' (ONNX Runtime, dynamic int8 quantization)
+        device (str): torch device. ONNX backends run on CPU
+
+    Raises:
+        ValueError: unsupported backend
+
+    Returns:
+        SentenceTransformer: model, with the same encode(...) API whatever the backend
+    """
+    if backend == TORCH_BACKEND:
+        return SentenceTransformer(model_id, device=device)
+
+    if backend == ONNX_BACKEND:
+        # exports to ONNX on the fly, if the model repo doesn't ship an onnx/model.onnx
+        return SentenceTransformer(model_id, backend="onnx", device="cpu")
+
+    if backend == ONNX_INT8_BACKEND:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        quantization_config = settings.EMBEDDING_ONNX_QUANTIZATION_CONFIG
+        export_dir = Path(settings.EMBEDDING_ONNX_EXPORT_DIR) / model_id.strip("/").replace("/", "__")
+        # signed (qint8) or unsigned (quint8) weights, depending on the config
+        quantized_file_glob = f"onnx/model_q*int8_{quantization_config}.onnx"
+        # quantization runs once, the quantized model is then loaded from the export dir
+        if not any(export_dir.glob(quantized_file_glob)):
+            logger.info(f"Exporting {model_id} to ONNX, int8 quantized for {quantization_config}, in {export_dir}")
+            onnx_model = SentenceTransformer(model_id, backend="onnx", device="cpu")
+            onnx_model.save(str(export_dir))
+            export_dynamic_quantized_onnx_model(onnx_model,
+                                                quantization_config=quantization_config,
+                                                model_name_or_path=str(export_dir))
+
+        file_name = next(export_dir.glob(quantized_file_glob)).relative_to(export_dir).as_posix()
+        return SentenceTransformer(str(export_dir), backend="onnx", device="cpu", model_kwargs={"file_name": file_name})
+
+    raise ValueError(f"Unsupported embedding model backend {backend}")
+
+
 class EmbeddingModelManager:
     """ Singleton class to initialize Embedding models only once i.e load once and reused
     """
@@ -17,7 +66,7 @@ class EmbeddingModelManager:
     # ASSUME : Sentence Transformer
     _text_model: Optional[SentenceTransformer] = None
     # ASSUME : For now assume open source AbsEmbedder aka BGE (BAAI General Embeddings)
-    _code_model: Optional[AbsEmbedder] = None
+    _code_model: Optional[AbsEmbedder | SentenceTransformer] = None
     _lock = threading.Lock()
 
     @classmethod
@@ -25,33 +74,46 @@ class EmbeddingModelManager:
         if cls._text_model is None:
             with cls._lock:
                 if cls._text_model is None:
-                    logger.info("Loading text embedding model.....")
+                    logger.info(f"Loading text embedding model, backend= {settings.EMBEDDING_MODEL_BACKEND}.....")
                     device_type:str = settings.EMBEDDING_MODEL_GPU_DEVICE if torch.cuda.is_available() else settings.EMBEDDING_MODEL_DEVICE
-                    cls._text_model = SentenceTransformer(
-                                            settings.EMBEDDING_MODEL_ID,
-                                            device=device_type)
+                    cls._text_model = load_sentence_transformer(settings.EMBEDDING_MODEL_ID,
+                                                                backend=settings.EMBEDDING_MODEL_BACKEND,
+                                                                device=device_type)
 
         return cls._text_model
 
 
 
     @classmethod
-    def get_bge_code_model(cls) -> AbsEmbedder:
+    def get_bge_code_model(cls) -> AbsEmbedder | SentenceTransformer:
         """This is a specific function for code, to use BGE model. Unfortunately it doesnt look like
         these transformers have a common type to use as return type.
+        FlagEmbedding only runs torch models. With an ONNX backend, the BGE model is loaded as a SentenceTransformer,
+        whose CLS pooling + normalization outputs the same embeddings.
 
         Returns:
-            AbsEmbedder: Base class for all BGE (BAAI) models
+            AbsEmbedder | SentenceTransformer: Base class for all BGE (BAAI) models, or SentenceTransformer on ONNX
         """
         if cls._code_model is None:
             with cls._lock:
                 if cls._code_model is None:
-                    logger.info("Loading BGE Embedding code model")
-                    cls._code_model = FlagAutoModel.from_finetuned(
-                        settings.EMBEDDING_MODEL_FOR_CODE_ID,
-                        use_fp16=True   # Use half precision for 2x speed
-                    )
+                    logger.info(f"Loading BGE Embedding code model, backend= {settings.EMBEDDING_MODEL_BACKEND}")
+                    if settings.EMBEDDING_MODEL_BACKEND == TORCH_BACKEND:
+                        cls._code_model = FlagAutoModel.from_finetuned(
+                            settings.EMBEDDING_MODEL_FOR_CODE_ID,
+                            # half precision is 2x faster on GPU only, on CPU it is emulated and slower
+                            use_fp16=torch.cuda.is_available()
+                        )
+                    else:
+                        cls._code_model = load_sentence_transformer(settings.EMBEDDING_MODEL_FOR_CODE_ID,
+                                                                    backend=settings.EMBEDDING_MODEL_BACKEND,
+                                                                    device=settings.EMBEDDING_MODEL_DEVICE)
         return cls._code_model
 
 
-
+    @staticmethod
+    def model_key(model_id: str) -> str:
+        """Identifies the embeddings produced by a model and backend, eg: as EmbeddingCache key. Torch keeps the bare
+        model id, so embeddings already cached remain valid."""
+        backend = settings.EMBEDDING_MODEL_BACKEND
+        return model_id if backend == TORCH_BACKEND else f"{model_id}@{backend}"
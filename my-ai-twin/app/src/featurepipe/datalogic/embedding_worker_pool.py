@@ -0,0 +1,249 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+
+import numpy as np
+
+from featurepipe.featurepipe_config import fp_settings
+from core.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+TEXT_MODEL = "text"
+CODE_MODEL = "code"
+
+# interval at which the result collector checks that the worker processes are alive
+_WORKER_CHECK_INTERVAL_SECONDS = 1.0
+
+
+def encode_with_preloaded_models(model_kind: str, texts: list[str]) -> np.ndarray:
+    """Default encoder of the pool workers. Encodes with the models loaded by EmbeddingModelManager in the worker"""
+    from featurepipe.utils.embeddings_util import encode_code_inline, encode_text_inline
+
+    if model_kind == TEXT_MODEL:
+        return encode_text_inline(texts)
+    elif model_kind == CODE_MODEL:
+        return encode_code_inline(texts)
+    else:
+        raise ValueError(f"Unsupported model kind {model_kind}")
+
+
+def preload_models() -> None:
+    """Default worker initializer, loads the text and code models before the first batch comes in"""
+    from featurepipe.datalogic.embedding_model_manager import EmbeddingModelManager
+
+    EmbeddingModelManager.get_text_model()
+    EmbeddingModelManager.get_bge_code_model()
+
+
+def assign_cores(num_workers: int, cores_per_worker: int, available_cores: list[int]) -> list[list[int]]:
+    """Splits the available cores into disjoint sets, one per worker. By default, cores are shared out evenly.
+    When more cores are requested than available, the sets wrap around and overlap.
+    """
+    if cores_per_worker <= 0:
+        cores_per_worker = max(len(available_cores) // num_workers, 1)
+
+    return [
+        [available_cores[(index * cores_per_worker + offset) % len(available_cores)] for offset in range(cores_per_worker)]
+        for index in range(num_workers)
+    ]
+
+
+def _worker_main(worker_index: int,
+                 cores: list[int],
+                 initializer: Callable[[], None],
+                 encoder: Callable[[str, list[str]], np.ndarray],
+                 request_queue: mp.Queue,
+                 result_queue: mp.Queue) -> None:
+    """Worker process loop. Embeddings are written into a shared memory block created per request, only its name
+    and the array shape/dtype go back through the result queue.
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        # one intra-op thread per pinned core, instead of one per core of the machine
+        import torch
+        torch.set_num_threads(len(cores))
+    except ImportError:
+        pass
+
+    initializer()
+    logger.info(f"Embedding worker {worker_index} ready, pinned to cores {cores}")
+
+    while True:
+        request = request_queue.get()
+        # None : the pool is shutting down
+        if request is None:
+            return
+
+        request_id, model_kind, texts = request
+        try:
+            embeddings = np.ascontiguousarray(encoder(model_kind, texts))
+            shm = shared_memory.SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+            np.ndarray(embeddings.shape, dtype=embeddings.dtype, buffer=shm.buf)[...] = embeddings
+            # the parent unlinks the block, once copied out
+            shm.close()
+            result_queue.put((request_id, shm.name, embeddings.shape, embeddings.dtype.str, None))
+        except Exception as e:
+            logger.exception(e)
+            result_queue.put((request_id, None, None, None, repr(e)))
+
+
+class EmbeddingWorkerPool:
+    """Embedding service for CPU-only deployments. A pool of processes, each with the embedding models preloaded and
+    pinned to its own set of cores, so embedding runs outside the GIL of the Bytewax process. Batches submitted
+    together (see EmbeddingDispatcher.dispatch_batches_embedder) are embedded concurrently, one per worker.
+
+    Batches go to whichever worker is free, over a shared request queue. Embeddings come back in shared memory
+    rather than pickled through the queue. If a worker process dies, the pool is broken : pending and later batches
+    fail, instead of waiting for results that never come.
+    """
+
+    _instance: Optional["EmbeddingWorkerPool"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 num_workers: int,
+                 cores_per_worker: int = 0,
+                 initializer: Callable[[], None] = preload_models,
+                 encoder: Callable[[str, list[str]], np.ndarray] = encode_with_preloaded_models) -> None:
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, got {num_workers}")
+
+        # spawn, as forking a process with torch threads running is unsafe
+        context = mp.get_context("spawn")
+        self._request_queue = context.Queue()
+        self._result_queue = context.Queue()
+        self._futures: dict[int, Future] = {}
+        self._futures_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        # reason the pool is broken, None while all the workers are alive
+        self._broken: Optional[str] = None
+        self._closing = False
+
+        available_cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self._processes = [
+            context.Process(target=_worker_main,
+                            args=(index, cores, initializer, encoder, self._request_queue, self._result_queue),
+                            name=f"embedding-worker-{index}",
+                            daemon=True)
+            for index, cores in enumerate(assign_cores(num_workers, cores_per_worker, available_cores))
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._collector = threading.Thread(target=self._collect_results, name="embedding-results", daemon=True)
+        self._collector.start()
+        logger.info(f"Started embedding worker pool of {num_workers} processes")
+
+
+    @classmethod
+    def get_instance(cls) -> Optional["EmbeddingWorkerPool"]:
+        """Process wide pool configured by fp_settings. Returns None when the pool is disabled i.e. embedding runs inline."""
+        if fp_settings.EMBEDDING_WORKER_POOL_SIZE <= 0:
+            return None
+
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(num_workers=fp_settings.EMBEDDING_WORKER_POOL_SIZE,
+                                        cores_per_worker=fp_settings.EMBEDDING_WORKER_CORES_PER_PROCESS)
+                    atexit.register(cls._instance.close)
+        return cls._instance
+
+
+    def submit(self, model_kind: str, texts: list[str]) -> Future:
+        """Queues a batch of texts for embedding, with the model of the given kind (TEXT_MODEL or CODE_MODEL).
+
+        Returns:
+            Future: resolves to the embeddings, np.ndarray with one row per text in the same order as texts
+        """
+        future: Future = Future()
+        request_id = next(self._request_ids)
+        with self._futures_lock:
+            if self._broken is not None:
+                raise RuntimeError(f"Embedding worker pool is broken: {self._broken}")
+            self._futures[request_id] = future
+        self._request_queue.put((request_id, model_kind, texts))
+
+        return future
+
+
+    def encode(self, model_kind: str, texts: list[str]) -> np.ndarray:
+        return self.submit(model_kind, texts).result(timeout=fp_settings.EMBEDDING_WORKER_TIMEOUT_SECONDS)
+
+
+    def _collect_results(self) -> None:
+        while True:
+            try:
+                result = self._result_queue.get(timeout=_WORKER_CHECK_INTERVAL_SECONDS)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            # None : the pool is shutting down
+            if result is None:
+                return
+
+            request_id, shm_name, shape, dtype, error = result
+            with self._futures_lock:
+                future = self._futures.pop(request_id, None)
+            # the future already failed, when the pool broke
+            if future is None:
+                if shm_name is not None:
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                    shm.close()
+                    shm.unlink()
+                continue
+
+            if error is not None:
+                future.set_exception(RuntimeError(f"Embedding worker failed: {error}"))
+                continue
+
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                # a single copy out of the shared block, which is released right after
+                future.set_result(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf).copy())
+            finally:
+                shm.close()
+                shm.unlink()
+
+
+    def _check_workers(self) -> None:
+        """Breaks the pool when a worker process died eg: killed by the OOM killer. The batch it was embedding is
+        lost and there is no telling which one it was, so all the pending batches fail.
+        """
+        if self._closing or self._broken is not None:
+            return
+
+        dead_processes = [process for process in self._processes if not process.is_alive()]
+        if not dead_processes:
+            return
+
+        reason = ", ".join(f"{process.name} exited with code {process.exitcode}" for process in dead_processes)
+        logger.error(f"Embedding worker pool is broken: {reason}")
+        with self._futures_lock:
+            self._broken = reason
+            pending_futures = list(self._futures.values())
+            self._futures.clear()
+        for future in pending_futures:
+            future.set_exception(RuntimeError(f"Embedding worker pool is broken: {reason}"))
+
+
+    def close(self) -> None:
+        self._closing = True
+        for _ in self._processes:
+            self._request_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+        self._result_queue.put(None)
+        self._collector.join(timeout=10)
+        logger.info("Embedding worker pool closed")
@@ -1,17 +1,22 @@
+import asyncio
 import json
+from itertools import islice
 from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator, Optional
 from sklearn.model_selection import train_test_split
 import comet_ml
 # from comet_ml import Artifact, start
 
 from core.logger_utils import get_logger
 from core.config import settings
+from featurepipe.featurepipe_config import fp_settings
 from db.qdrant_connection import QdrantDatabaseConnector
 
 from featurepipe.datasetgen.dataformatter import DataFormatter
 from featurepipe.datasetgen.document_chunker import DocumentChunker
 from featurepipe.utils.json_helper import JSONFileHandler
 from featurepipe.datasetgen.gpt_communicator import GPTCommunicator
+from featurepipe.datasetgen.response_cache import ResponseCache
 
 
 logger = get_logger(__name__)
@@ -46,30 +51,119 @@ class DatasetGenerator:
         assert(settings.COMET_PROJECT), "COMET_PROJECT key is not set. Please set the value in your .env file."
         assert(settings.OPENAI_API_KEY), "OPEN_API_KEY key is not set. Please set the value in your .env file."
 
-        cleaned_documents = self.fetch_all_cleaned_content(collection_name)
-        cleaned_documents = DocumentChunker().chunk_documents(cleaned_documents)
-        num_cleaned_documents = len(cleaned_documents)
+        # documents are streamed from Qdrant and chunked lazily, one batch at a time
+        cleaned_documents = self.iter_cleaned_content(collection_name)
+        cleaned_documents = DocumentChunker.iter_chunk_documents(cleaned_documents)
 
+        batches = batched(cleaned_documents, batch_size)
+        response_cache = self.open_response_cache(collection_name)
         generated_instruct_dataset = []
-        for i in range (0, num_cleaned_documents, batch_size):
-            batch = cleaned_documents[i : i + batch_size]
-            prompt = self.data_formatter.format_prompt(batch, data_type, i)
-            batch_instructions = self.gpt_communicator.send_prompt(prompt)
-
-            if (len(batch_instructions) != len(batch)):
-                logger.error(
-                    f"Received {len(batch_instructions)} instructions for {len(batch)} documents.\
-                        Skipping this batch....")
-                continue
-
-            for instruction, content in zip(batch_instructions, batch):
-                instruction["content"] = content
-                generated_instruct_dataset.append(instruction)
+        try:
+            if fp_settings.DATASET_GEN_ASYNC:
+                async def collect_instructions() -> None:
+                    async for batch, batch_instructions in self.send_batches_async(batches, data_type, batch_size, response_cache):
+                        self._add_instructions(generated_instruct_dataset, batch, batch_instructions)
+
+                asyncio.run(collect_instructions())
+            else:
+                for batch, batch_instructions in self.send_batches(batches, data_type, batch_size, response_cache):
+                    self._add_instructions(generated_instruct_dataset, batch, batch_instructions)
+        finally:
+            if response_cache is not None:
+                response_cache.close()
 
         train_test_data = self._split_dataset(generated_instruct_dataset)
         self.push_to_comet(train_test_data, data_type, collection_name)
 
 
+    @staticmethod
+    def _add_instructions(generated_instruct_dataset: list[dict], batch: list[str], batch_instructions: list) -> None:
+        if (len(batch_instructions) != len(batch)):
+            logger.error(
+                f"Received {len(batch_instructions)} instructions for {len(batch)} documents.\
+                    Skipping this batch....")
+            return
+
+        for instruction, content in zip(batch_instructions, batch):
+            instruction["content"] = content
+            generated_instruct_dataset.append(instruction)
+
+
+    def open_response_cache(self, collection_name: str) -> Optional[ResponseCache]:
+        """Cache of the GPT responses of the given collection. None when disabled by fp_settings"""
+        if not fp_settings.DATASET_GEN_CACHE_ENABLED:
+            return None
+
+        return ResponseCache(Path(fp_settings.DATASET_GEN_CACHE_DIR) / f"{collection_name}_responses.jsonl",
+                             model_id=self.gpt_communicator.gpt_model)
+
+
+    def send_batches(self,
+                     batches: Iterable[list[str]],
+                     data_type: str,
+                     batch_size: int,
+                     response_cache: Optional[ResponseCache] = None) -> Iterator[tuple[list[str], list]]:
+        """Sends the prompt of each batch to GPT, one after another. Batches answered in the response cache are not
+        sent again.
+
+        Yields:
+            Iterator[tuple[list[str], list]]: each batch, with the instructions generated for it
+        """
+        for batch_index, batch in enumerate(batches):
+            batch_instructions = response_cache.get(data_type, batch) if response_cache is not None else None
+            if batch_instructions is None:
+                prompt = self.data_formatter.format_prompt(batch, data_type, batch_index * batch_size)
+                batch_instructions = self.gpt_communicator.send_prompt(prompt)
+                self._cache_response(response_cache, data_type, batch, batch_instructions)
+
+            yield batch, batch_instructions
+
+
+    async def send_batches_async(self,
+                                 batches: Iterable[list[str]],
+                                 data_type: str,
+                                 batch_size: int,
+                                 response_cache: Optional[ResponseCache] = None) -> AsyncIterator[tuple[list[str], list]]:
+        """Same as send_batches, with the prompts sent concurrently. Batches are read in windows of
+        DATASET_GEN_WINDOW_FACTOR * OPENAI_MAX_CONCURRENCY batches : the prompts of a window are sent together, and
+        its results yielded before the next window is read. Results are in the order of the batches, so the
+        train / test split is the same as with send_batches.
+
+        Yields:
+            AsyncIterator[tuple[list[str], list]]: each batch, with the instructions generated for it
+        """
+        window_size = max(fp_settings.DATASET_GEN_WINDOW_FACTOR * fp_settings.OPENAI_MAX_CONCURRENCY, 1)
+        # the requests and tokens per minute limits hold across windows
+        rate_limiter = self.gpt_communicator.new_rate_limiter()
+        first_batch_index = 0
+        for window in batched(batches, window_size):
+            responses = [response_cache.get(data_type, batch) if response_cache is not None else None for batch in window]
+            unanswered = [index for index, response in enumerate(responses) if response is None]
+            prompts = [self.data_formatter.format_prompt(window[index], data_type, (first_batch_index + index) * batch_size)
+                       for index in unanswered]
+            first_batch_index += len(window)
+            logger.info(f"{len(window) - len(unanswered)} of {len(window)} batches already answered in the response cache")
+
+            def on_response(index: int, response: list) -> None:
+                # cached as soon as it comes back, so a crash only loses the requests in flight
+                batch_index = unanswered[index]
+                responses[batch_index] = response
+                self._cache_response(response_cache, data_type, window[batch_index], response)
+
+            if unanswered:
+                await self.gpt_communicator.send_prompts_async(prompts, on_response=on_response, rate_limiter=rate_limiter)
+
+            for batch, response in zip(window, responses):
+                yield batch, response
+
+
+    @staticmethod
+    def _cache_response(response_cache: Optional[ResponseCache], data_type: str, batch: list[str], response: list) -> None:
+        # only complete answers, the others are sent again on the next run
+        if response_cache is not None and len(response) == len(batch):
+            response_cache.put(data_type, batch, response)
+
+
     def _split_dataset(self, generated_instruct_dataset: list[dict], test_size: float = 0.2) -> tuple[list[dict], list[dict]]:
 
         if len(generated_instruct_dataset) == 0 :
@@ -128,17 +222,30 @@ class DatasetGenerator:
         Returns:
             list: list of cleaned content of the given collection_name
         """
-        all_cleaned_contents = []
+        return list(self.iter_cleaned_content(collection_name))
 
-        scroll_response: tuple = client.scroll(collection_name=collection_name, limit=10000)
-        points = scroll_response[0]
 
-        for point in points:
-            cleaned_content = point.payload["cleaned_content"]
+    def iter_cleaned_content(self, collection_name: str) -> Iterator[str]:
+        """Streams the cleaned content persisted in Qdrant Db, page by page. Only the cleaned_content payload field
+        is fetched.
+
+        Args:
+            collection_name (str): Collection name in QDrant Db. eg: articles, posts, repositories etc..
+
+        Yields:
+            Iterator[str]: non empty cleaned content of the given collection_name
+        """
+        for point in client.iter_points(collection_name=collection_name, payload_fields=["cleaned_content"]):
+            cleaned_content = point.payload.get("cleaned_content")
             if cleaned_content:
-                all_cleaned_contents.append(cleaned_content)
+                yield cleaned_content
+
 
-        return all_cleaned_contents
+def batched(items: Iterable, batch_size: int) -> Iterator[list]:
+    """Splits items in lists of batch_size items, the last one possibly shorter. Same as itertools.batched (python 3.12)"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
 
 
 if __name__ == "__main__":
@@ -1,18 +1,82 @@
 import re
+from typing import Iterable, Iterator
+
+from typing_extensions import deprecated
+
+# a sentence ending ., ? or ! and the whitespace after it, except after abbreviations eg: "e.g." and "Mr.".
+# Same boundaries as the split pattern of _extract_substrings_, but the match starts on the punctuation, which the
+# regex engine scans for, rather than trying the lookbehinds at every character
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r"[.?!](?<!\w\.\w.)(?<![A-Z][a-z]\.)\s")
+
 
 class DocumentChunker:
 
     @classmethod
     def chunk_documents(cls, documents:list[str], min_length:int = 1000, max_length:int = 2000) -> list[str]:
-        chunked_docs = []
+        return list(cls.iter_chunk_documents(documents, min_length=min_length, max_length=max_length))
+
+
+    @classmethod
+    def iter_chunk_documents(cls, documents: Iterable[str], min_length: int = 1000, max_length: int = 2000) -> Iterator[str]:
+        """Lazy variant of chunk_documents(...). Documents are pulled from the iterable one at a time."""
         for document in documents:
-            chunks = cls._extract_substrings_(document, min_len=min_length, max_len=max_length)
-            chunked_docs.extend(chunks)
+            yield from cls.iter_substrings(document, min_len=min_length, max_len=max_length)
+
+
+    @classmethod
+    def iter_sentence_spans(cls, txt: str) -> Iterator[tuple[int, int]]:
+        """Offsets (start, end) of the sentences of txt, stripped of surrounding whitespace. Empty sentences are skipped."""
+        start = 0
+        for boundary in _SENTENCE_BOUNDARY_PATTERN.finditer(txt):
+            # the sentence ends with its punctuation
+            span = cls._strip_span(txt, start, boundary.start() + 1)
+            if span is not None:
+                yield span
+            start = boundary.end()
+
+        span = cls._strip_span(txt, start, len(txt))
+        if span is not None:
+            yield span
 
-        return chunked_docs
+
+    @classmethod
+    def iter_substrings(cls, txt: str, min_len: int, max_len: int) -> Iterator[str]:
+        """Groups the sentences of txt into chunks of at most max_len characters, sentences joined by a space. Chunks
+        shorter than min_len are dropped. A chunk is kept as the spans of its sentences, and only built once complete,
+        so the time is linear in the length of txt.
+        """
+        chunk_spans: list[tuple[int, int]] = []
+        # length of the sentences of the chunk, each followed by a space
+        chunk_length = 0
+        for start, end in cls.iter_sentence_spans(txt):
+            sentence_length = end - start
+            if chunk_length + sentence_length <= max_len:
+                chunk_spans.append((start, end))
+                chunk_length += sentence_length + 1
+
+            else:
+                if chunk_length >= min_len:
+                    yield " ".join(txt[span_start:span_end] for span_start, span_end in chunk_spans)
+
+                chunk_spans = [(start, end)]
+                chunk_length = sentence_length + 1
+
+        if chunk_length >= min_len:
+            yield " ".join(txt[span_start:span_end] for span_start, span_end in chunk_spans)
+
+
+    @staticmethod
+    def _strip_span(txt: str, start: int, end: int) -> tuple[int, int] | None:
+        """Same as txt[start:end].strip(), as offsets. None when only whitespace"""
+        while start < end and txt[start].isspace():
+            start += 1
+        while end > start and txt[end - 1].isspace():
+            end -= 1
+        return (start, end) if start < end else None
 
 
     @classmethod
+    @deprecated("Please use DocumentChunker.iter_substrings")
     def _extract_substrings_(cls, txt, min_len:int, max_len:int) -> list[str]:
 
         sentences = re.split(r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s", txt)
@@ -45,5 +109,3 @@ class DocumentChunker:
             extracts.append(current_chunk.strip())
 
         return extracts
-
-
@@ -1,31 +1,48 @@
+import asyncio
 import json
+import random
+from typing import Callable
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+from pydantic import SecretStr
 
 from core.config import settings
 from core.logger_utils import get_logger
-from openai import OpenAI
+from featurepipe.datasetgen.rate_limiter import AsyncRateLimiter
+from featurepipe.featurepipe_config import fp_settings
 
 MAX_LENGTH = 16384
 SYSTEM_PROMPT = "You are a technical writer handing someone's account to post about AI and MLOps."
+# 429 and transient errors, retried with backoff. Anything else skips the batch
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
 
 logger = get_logger(__name__)
 
 class GPTCommunicator:
 
-    def __init__(self, gptmodel: str = settings.OPENAI_MODEL_ID):
-        self.api_key = settings.OPENAI_API_KEY
-        self.gpt_model = settings.OPENAI_MODEL_ID
+    def __init__(self, gptmodel: str = settings.OPENAI_MODEL_ID, base_url: str | None = settings.OPENAI_BASE_URL):
+        api_key = settings.OPENAI_API_KEY
+        self.api_key = api_key.get_secret_value() if isinstance(api_key, SecretStr) else api_key
+        self.gpt_model = gptmodel
+        self.base_url = base_url
+        self._client: OpenAI | None = None
+
+
+    @property
+    def client(self) -> OpenAI:
+        """One client, i.e. one connection pool, reused across prompts"""
+        if self._client is None:
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
 
 
     def send_prompt(self, prompt:str) -> list:
         try:
-            client = OpenAI(api_key=self.api_key)
             logger.info(f"Sending batch to OpenAI model {self.gpt_model}")
 
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content" : SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt[:MAX_LENGTH]},
-                ],
+            chat_completion = self.client.chat.completions.create(
+                messages=self._messages(prompt),
                 model=self.gpt_model
             )
             response = chat_completion.choices[0].message.content
@@ -35,6 +52,112 @@ class GPTCommunicator:
             return []
 
 
+    @staticmethod
+    def new_rate_limiter() -> AsyncRateLimiter:
+        """Rate limiter configured with the account limits of fp_settings"""
+        return AsyncRateLimiter(requests_per_minute=fp_settings.OPENAI_MAX_REQUESTS_PER_MINUTE,
+                                tokens_per_minute=fp_settings.OPENAI_MAX_TOKENS_PER_MINUTE)
+
+
+    async def send_prompts_async(self,
+                                 prompts: list[str],
+                                 on_response: Callable[[int, list], None] | None = None,
+                                 rate_limiter: AsyncRateLimiter | None = None) -> list[list]:
+        """Sends the prompts concurrently, up to OPENAI_MAX_CONCURRENCY requests in flight, within the requests and
+        tokens per minute limits of fp_settings. Rate limited requests are retried with jittered exponential backoff.
+
+        Args:
+            prompts (list[str]): prompts to send
+            on_response (Callable[[int, list], None], optional): called with the index of the prompt and its response,
+                as soon as the response comes back
+            rate_limiter (AsyncRateLimiter, optional): limiter shared across calls eg: the windows of a run. Defaults to
+                a new limiter, configured by fp_settings
+
+        Returns:
+            list[list]: the parsed response of each prompt, in the same order as prompts. [] for a failed prompt
+        """
+        if rate_limiter is None:
+            rate_limiter = self.new_rate_limiter()
+        semaphore = asyncio.Semaphore(fp_settings.OPENAI_MAX_CONCURRENCY)
+        logger.info(f"Sending {len(prompts)} batches to OpenAI model {self.gpt_model}, "
+                    f"{fp_settings.OPENAI_MAX_CONCURRENCY} at a time")
+
+        # shared by all the requests. Retries are done here, with jitter, rather than by the client
+        async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0) as client:
+            async def send(index: int, prompt: str) -> list:
+                response = await self._send_prompt_async(client, semaphore, rate_limiter, prompt)
+                if on_response is not None:
+                    on_response(index, response)
+                return response
+
+            return await asyncio.gather(*(send(index, prompt) for index, prompt in enumerate(prompts)))
+
+
+    async def _send_prompt_async(self,
+                                 client: AsyncOpenAI,
+                                 semaphore: asyncio.Semaphore,
+                                 rate_limiter: AsyncRateLimiter,
+                                 prompt: str) -> list:
+        messages = self._messages(prompt)
+        reserved_tokens = self.estimate_tokens(messages)
+        async with semaphore:
+            for attempt in range(fp_settings.OPENAI_MAX_RETRIES + 1):
+                await rate_limiter.acquire(reserved_tokens)
+                try:
+                    chat_completion = await client.chat.completions.create(messages=messages, model=self.gpt_model)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == fp_settings.OPENAI_MAX_RETRIES:
+                        logger.error(f"Skipping batch! Still failing after {attempt} retries: {e!r}")
+                        return []
+                    delay = self.retry_delay(attempt, getattr(e, "response", None))
+                    logger.warning(f"Retrying batch in {delay:.2f} secs, attempt {attempt + 1}: {e!r}")
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception:
+                    logger.exception(f"Skipping batch! An error occurred while communicating with API")
+                    return []
+
+                if chat_completion.usage is not None:
+                    rate_limiter.record_usage(reserved_tokens, chat_completion.usage.total_tokens)
+                try:
+                    return json.loads(self.clean_response(chat_completion.choices[0].message.content))
+                except Exception:
+                    logger.exception(f"Skipping batch! Unable to parse the response")
+                    return []
+
+
+    @staticmethod
+    def retry_delay(attempt: int, response=None) -> float:
+        """Full jitter backoff : uniform in [0, base * 2^attempt], capped. When the server says how long to wait
+        (retry-after headers), waits at least that long."""
+        delay = random.uniform(0, min(fp_settings.OPENAI_RETRY_MAX_DELAY_SECONDS,
+                                      fp_settings.OPENAI_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if "retry-after-ms" in headers:
+                return max(delay, float(headers["retry-after-ms"]) / 1000)
+            if "retry-after" in headers:
+                return max(delay, float(headers["retry-after"]))
+        except ValueError:
+            # retry-after as an http date
+            pass
+        return delay
+
+
+    @staticmethod
+    def estimate_tokens(messages: list[dict]) -> int:
+        """Tokens counted against the tokens per minute limit : ~4 characters per prompt token, plus the expected
+        completion"""
+        return sum(len(message["content"]) for message in messages) // 4 + fp_settings.OPENAI_EXPECTED_COMPLETION_TOKENS
+
+
+    @staticmethod
+    def _messages(prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content" : SYSTEM_PROMPT},
+            {"role": "user", "content": prompt[:MAX_LENGTH]},
+        ]
+
 
     @staticmethod
     def clean_response(response: str) -> str:
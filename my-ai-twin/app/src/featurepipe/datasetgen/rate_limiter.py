@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Callable
+
+
+class AsyncRateLimiter:
+    """Client side requests per minute and tokens per minute limits, as token buckets. Each bucket holds up to a
+    minute worth of capacity and refills continuously, the way the OpenAI API accounts for its rate limits.
+
+    Waiters are served first come first served : the one at the head holds the lock while it waits for capacity.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int,
+                 tokens_per_minute: int,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if requests_per_minute <= 0 or tokens_per_minute <= 0:
+            raise ValueError(f"Rate limits must be > 0, got {requests_per_minute} RPM and {tokens_per_minute} TPM")
+
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._last_refill = clock()
+        self._lock = asyncio.Lock()
+
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed_minutes = (now - self._last_refill) / 60
+        self._last_refill = now
+        self._available_requests = min(self._requests_per_minute,
+                                       self._available_requests + elapsed_minutes * self._requests_per_minute)
+        self._available_tokens = min(self._tokens_per_minute,
+                                     self._available_tokens + elapsed_minutes * self._tokens_per_minute)
+
+
+    async def acquire(self, num_tokens: int) -> None:
+        """Waits until one request and num_tokens tokens fit in the limits, then takes them"""
+        # a request larger than the bucket would wait forever
+        num_tokens = min(num_tokens, self._tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._available_requests >= 1 and self._available_tokens >= num_tokens:
+                    self._available_requests -= 1
+                    self._available_tokens -= num_tokens
+                    return
+
+                wait_minutes = max((1 - self._available_requests) / self._requests_per_minute,
+                                   (num_tokens - self._available_tokens) / self._tokens_per_minute)
+                await asyncio.sleep(wait_minutes * 60)
+
+
+    def record_usage(self, reserved_tokens: int, used_tokens: int) -> None:
+        """Settles the tokens reserved by acquire against the usage reported in the response. Overuse is taken from
+        the bucket, possibly below 0, which delays the next requests."""
+        self._refill()
+        self._available_tokens = min(self._tokens_per_minute,
+                                     self._available_tokens + min(reserved_tokens, self._tokens_per_minute) - used_tokens)
@@ -0,0 +1,70 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+from core.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResponseCache:
+    """Append-only JSONL store of the parsed GPT responses, keyed on the hash of the model id, data type and documents of
+    the batch. Not on the prompt, which numbers the documents from the start of the collection : a document added or
+    removed would miss the cache for all the batches after it. Each response is written and flushed as soon as it
+    comes back, so a rerun after a crash only sends the batches not answered yet.
+    """
+
+    def __init__(self, path: Path, model_id: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._model_id = model_id
+        self._responses: dict[str, list] = {}
+        ends_with_newline = True
+
+        if path.exists():
+            with path.open("r") as file:
+                for line in file:
+                    ends_with_newline = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                        self._responses[entry["batch_hash"]] = entry["response"]
+                    except (json.JSONDecodeError, KeyError):
+                        # last line cut short by a crash, or an entry of an older format
+                        continue
+            logger.info(f"Loaded {len(self._responses)} cached responses from {path}")
+
+        self._file = path.open("a")
+        # terminates the line cut short by a crash, else the next entry would be appended to it
+        if not ends_with_newline:
+            self._file.write("\n")
+
+
+    def batch_hash(self, data_type: str, batch: list[str]) -> str:
+        return hashlib.sha256(json.dumps([self._model_id, data_type, batch]).encode()).hexdigest()
+
+
+    def get(self, data_type: str, batch: list[str]) -> Optional[list]:
+        return self._responses.get(self.batch_hash(data_type, batch))
+
+
+    def put(self, data_type: str, batch: list[str], response: list) -> None:
+        batch_hash = self.batch_hash(data_type, batch)
+        self._responses[batch_hash] = response
+        self._file.write(json.dumps({"batch_hash": batch_hash, "response": response}) + "\n")
+        self._file.flush()
+
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+
+    def close(self) -> None:
+        self._file.close()
+
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -21,9 +21,79 @@ class FeaturePipeSettings (BaseSettings) :
     # Open AI
     OPENAI_MODEL_ID: str = "gpt-4o-mini"
     OPENAI_API_KEY: str | None = None
+    # Instruct dataset generation : True = prompts are sent concurrently over a shared async client. False = one by one
+    DATASET_GEN_ASYNC: bool = True
+    OPENAI_MAX_CONCURRENCY: int = 16
+    # Async generation reads, formats and sends batches in windows of DATASET_GEN_WINDOW_FACTOR * OPENAI_MAX_CONCURRENCY
+    # batches, so only a window of prompts is held in memory
+    DATASET_GEN_WINDOW_FACTOR: int = 4
+    # Client side rate limits, set to the limits of the account's tier
+    OPENAI_MAX_REQUESTS_PER_MINUTE: int = 500
+    OPENAI_MAX_TOKENS_PER_MINUTE: int = 200_000
+    # Completion tokens reserved per request against the tokens per minute limit, until the response reports the usage
+    OPENAI_EXPECTED_COMPLETION_TOKENS: int = 512
+    # Retries of rate limited (429) and transient errors, with exponential backoff and full jitter
+    OPENAI_MAX_RETRIES: int = 6
+    OPENAI_RETRY_BASE_DELAY_SECONDS: float = 1
+    OPENAI_RETRY_MAX_DELAY_SECONDS: float = 60
+    # Parsed GPT responses, cached per collection in DATASET_GEN_CACHE_DIR/<collection>_responses.jsonl. Reruns only
+    # send the prompts not answered yet
+    DATASET_GEN_CACHE_ENABLED: bool = True
+    DATASET_GEN_CACHE_DIR: str = "generated_dataset"
 
     # MQ config
     RABBITMQ_PORT: int = 5672
     RABBITMQ_QUEUE_NAME: str = "default"
+    # Number of input partitions. Each partition is a competing consumer on RABBITMQ_QUEUE_NAME with its own
+    # connection and channel. Bytewax spreads partitions across workers, so set this >= total # of workers.
+    RABBITMQ_NUM_PARTITIONS: int = 1
+    # Max # of unacked messages the broker pushes to each partition's consumer. Also the max size of a batch
+    RABBITMQ_PREFETCH_COUNT: int = 100
+    # backoff, between polls of the local buffer, while the queue is idle. Doubles from min to max
+    RABBITMQ_IDLE_BACKOFF_MIN_MS: int = 10
+    RABBITMQ_IDLE_BACKOFF_MAX_MS: int = 1000
+    RABBITMQ_RECONNECT_DELAY_SECONDS: int = 10
+    # True : at-least-once, deliveries are acked in bulk on Bytewax snapshots. False : acked as soon as emitted
+    RABBITMQ_ACK_ON_SNAPSHOT: bool = False
+    # Expected peak ingest rate per partition. Along with the epoch length, sizes the prefetch window on ack on snapshot
+    RABBITMQ_MAX_MSGS_PER_SECOND: int = 50
+
+    # Raw documents are batched per content type before cleaning and chunking, which then run in bulk
+    CLEANING_BATCH_MAX_SIZE: int = 100
+    CLEANING_BATCH_TIMEOUT_SECONDS: float = 2
+    # # of batching keys per content type. Keyed operators route all the items of a key to one worker, so cleaning and
+    # chunking run on at most 3 x CLEANING_BATCH_KEY_SHARDS workers : set >= total # of Bytewax workers
+    CLEANING_BATCH_KEY_SHARDS: int = 16
+    # Pool cleaning and chunking the documents of a batch : "thread" or "process". Size 0 = no pool, run inline
+    DISPATCH_POOL_KIND: str = "process"
+    DISPATCH_POOL_SIZE: int = 0
+
+    # Chunking : True = token windows cut at the offsets of a single tokenization of each document.
+    # False = paragraphs split by RecursiveCharacterTextSplitter, then SentenceTransformersTokenTextSplitter
+    CHUNKING_FAST_PATH: bool = True
+    CHUNK_OVERLAP_TOKENS: int = 50
+
+    # Embedding batches, per content type. Repositories are embedded with the large BGE code model, hence smaller batches
+    EMBEDDING_BATCH_MAX_SIZE: dict[str, int] = {"posts": 128, "articles": 64, "repositories": 16}
+    EMBEDDING_BATCH_TIMEOUT_SECONDS: dict[str, float] = {"posts": 5, "articles": 5, "repositories": 10}
+    # # of batching keys per content type. Set > 1 to spread embedding of a content type across Bytewax workers
+    EMBEDDING_BATCH_KEY_SHARDS: int = 1
+
+    # Persistent embedding cache, keyed on model id + chunk hash. Unchanged chunks are never re-embedded
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "embedding_cache/embeddings.sqlite"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 1_000_000
+
+    # Embedding worker pool for CPU-only deployments : # of processes, each with the models preloaded and pinned to
+    # EMBEDDING_WORKER_CORES_PER_PROCESS cores (0 = cores shared out evenly). 0 processes = embed inline in Bytewax steps
+    EMBEDDING_WORKER_POOL_SIZE: int = 0
+    EMBEDDING_WORKER_CORES_PER_PROCESS: int = 0
+    EMBEDDING_WORKER_TIMEOUT_SECONDS: float = 300
+
+    # Idempotent vector writes : skip chunks already stored in Qdrant and delete the chunks an entry no longer produces
+    QDRANT_IDEMPOTENT_WRITES: bool = True
+
+    # Bytewax epoch length in seconds. Same env var as the `-s` option of `python -m bytewax.run`
+    BYTEWAX_SNAPSHOT_INTERVAL: float = 10
 
 fp_settings = FeaturePipeSettings()
\ No newline at end of file
@@ -11,7 +11,9 @@ import sys
 #     settings.patch_localhost()
 
 from models.base_models import DataModel
+from featurepipe.featurepipe_config import fp_settings
 from db.qdrant_connection import QdrantDatabaseConnector
+from featurepipe.dataflow.batching import batch_by_content_type, raw_content_type_key
 from featurepipe.dataflow.stream_input import RabbitMQSource
 from featurepipe.dataflow.stream_output import BytewaxQdrantOutput
 from featurepipe.datalogic.dispatchers import (
@@ -25,16 +27,23 @@ connection = QdrantDatabaseConnector()
 
 logger.info("Successfully started.....................")
 
+
 flow = Dataflow("Streaming ingestion pipeline")
 stream: Stream = op.input("input", flow, RabbitMQSource())
 logger.info("Reading MQ message.....")
 stream: Stream[DataModel] = op.map("raw dispatch", stream, RawDispatcher.handle_mq_message)
-stream: Stream[DataModel] = op.map("clean dispatch", stream, CleaningDispatcher.dispatch_cleaner)
 
-# Batch cleaned data before inserting to Qdrant
-# Using collect operator for count-based batching
-clean_stream_keyed: Stream[tuple[str, DataModel]] = op.key_on("cleaned items key", stream, lambda x: "batch_key")
-clean_batched: Stream[tuple[str, list[DataModel]]] = op.collect("batch cleaned data", clean_stream_keyed, timeout=timedelta(seconds=5), max_size=100)
+# Batch raw documents before cleaning, so cleaning and chunking run in bulk rather than per message
+# Keyed on content type, so each batch of cleaned data also goes to a single Qdrant collection, and sharded on
+# entry_id so cleaning and chunking are spread across all the workers
+raw_stream_keyed: Stream[tuple[str, DataModel]] = op.key_on("raw items key", stream, raw_content_type_key)
+raw_batched: Stream[tuple[str, list[DataModel]]] = op.collect(
+    "batch raw data",
+    raw_stream_keyed,
+    timeout=timedelta(seconds=fp_settings.CLEANING_BATCH_TIMEOUT_SECONDS),
+    max_size=fp_settings.CLEANING_BATCH_MAX_SIZE,
+)
+clean_batched: Stream[tuple[str, list[DataModel]]] = op.map("clean dispatch", raw_batched, CleaningDispatcher.dispatch_batch_cleaner)
 
 op.output(
     "cleaned data insert to qdrant",
@@ -42,16 +51,27 @@ op.output(
     BytewaxQdrantOutput(connection=connection, sink_type="clean"),
 )
 
-stream: Stream[DataModel] = op.flat_map("chunk dispatch", stream, ChunkingDispatcher.dispatch_chunker)
+# one item per document, holding all the chunks of the document
+chunked: Stream[list[DataModel]] = op.flat_map("chunk dispatch", clean_batched, ChunkingDispatcher.dispatch_batch_chunker)
+
+stream: Stream[DataModel] = op.flatten("flatten chunks", chunked)
 print("Completed chunking. Moving to Batching before embedding.....")
 
-# Batch embedded data before inserting to Qdrant
-chunk_stream_keyed: Stream[tuple[str, DataModel]] = op.key_on("chunk items key", stream, lambda x: "batch_key")
-chunk_batched: Stream[tuple[str, list[DataModel]]] = op.collect("batch chunks", chunk_stream_keyed, timeout=timedelta(seconds=5), max_size=100)
+# Batch chunks per content type before embedding, so each embedding model runs full, homogeneous batches
+chunk_batched: Stream[tuple[str, list[DataModel]]] = batch_by_content_type(
+    "batch chunks",
+    stream,
+    max_sizes=fp_settings.EMBEDDING_BATCH_MAX_SIZE,
+    timeouts_secs=fp_settings.EMBEDDING_BATCH_TIMEOUT_SECONDS,
+)
 
-vector_batched: Stream[DataModel] = op.map("batch embeddings", chunk_batched, EmbeddingDispatcher.dispatch_batch_embedder)
+# all the batches of an activation are embedded together, so they run concurrently on the embedding worker pool
+vector_batched: Stream[DataModel] = op.flat_map_batch("batch embeddings", chunk_batched,
+                                                       EmbeddingDispatcher.dispatch_batches_embedder)
 
 
+# Chunks are stored with the md5 of their entry id and content as point id. Re-crawled entries only upsert new chunks, and the chunks an entry
+# no longer produces are deleted by the sink, once all the chunks of the entry are written
 op.output(
     "embedded data insert to qdrant",
     vector_batched,
@@ -37,9 +37,10 @@ if __name__ == "__main__":
     # to test locally
     # settings.patch_localhost() # Moved to top level
 
-    retriever = VectorRetriever(query=code_query)
-    hits = retriever.retrieve_top_k(k= 6, to_expand_to_n_queries=5)
-    reranked_hits = retriever.rerank(hits=hits, keep_top_k=5)
+    retriever = VectorRetriever.get_instance()
+    retriever.warmup()
+    hits = retriever.retrieve_top_k(query=code_query, k= 6, to_expand_to_n_queries=5)
+    reranked_hits = retriever.rerank(query=code_query, hits=hits, keep_top_k=5)
 
     logger.info("======== Retreived Documents =========")
     for rank, hit in enumerate(reranked_hits):
@@ -7,6 +7,7 @@ from FlagEmbedding import AbsEmbedder
 from core.config import settings
 from core.logger_utils import get_logger
 from featurepipe.datalogic.embedding_model_manager import EmbeddingModelManager
+from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL, EmbeddingWorkerPool
 import numpy as np
 
 logger = get_logger(__name__)
@@ -39,33 +40,105 @@ def convert_repotext_to_embedding(text: str):
 
 
 def batch_encode_text(texts: list[str]) -> np.ndarray:
-    """Encode multiple texts in a single batch
+    """Encode multiple texts, in sub-batches packed up to settings.EMBEDDING_BATCH_TOKEN_BUDGET tokens.
+    Runs on the EmbeddingWorkerPool when enabled, inline otherwise.
 
     Args:
         texts (list[str]): list of texts
 
     Returns:
-        list[np.ndarray]: _description_
+        np.ndarray: embeddings, one row per text in the same order as texts
     """
-    model: SentenceTransformer = EmbeddingModelManager.get_text_model()
-    # https://github.com/FlagOpen/FlagEmbedding/blob/master/FlagEmbedding/inference/embedder/encoder_only/base.py
-    return model.encode(
-            sentences=texts,
-            batch_size=32,
-            convert_to_numpy=True,
-            show_progress_bar=False,
-            # normalize_embeddings=True
-            )
+    pool = EmbeddingWorkerPool.get_instance()
+    if pool is not None:
+        return pool.encode(TEXT_MODEL, texts)
+
+    return encode_text_inline(texts)
 
 
 def batch_encode_code_using_BGE(texts: list[str]) -> np.ndarray :
+    pool = EmbeddingWorkerPool.get_instance()
+    if pool is not None:
+        return pool.encode(CODE_MODEL, texts)
+
+    return encode_code_inline(texts)
+
+
+def encode_text_inline(texts: list[str]) -> np.ndarray:
+    """Encodes with the text model loaded in this process"""
+    model: SentenceTransformer = EmbeddingModelManager.get_text_model()
+    return encode_with_token_budget(model=model,
+                                    texts=texts,
+                                    max_length=model.max_seq_length,
+                                    token_budget=settings.EMBEDDING_BATCH_TOKEN_BUDGET)
+
+
+def encode_code_inline(texts: list[str]) -> np.ndarray:
+    """Encodes with the code model loaded in this process"""
     model: AbsEmbedder = EmbeddingModelManager.get_bge_code_model()
-    # https://github.com/FlagOpen/FlagEmbedding/blob/master/FlagEmbedding/inference/embedder/encoder_only/base.py
-    return model.encode(sentences=texts,
-                    batch_size=32,
-                    convert_to_numpy=True,
-                    show_progress_bar=False,
-                    )
+    return encode_with_token_budget(model=model,
+                                    texts=texts,
+                                    max_length=settings.EMBEDDING_MODEL_MAX_INPUT_LENGTH,
+                                    token_budget=settings.EMBEDDING_CODE_BATCH_TOKEN_BUDGET)
+
+
+def bucket_by_token_budget(token_counts: list[int], token_budget: int) -> list[list[int]]:
+    """Packs texts into sub-batches by length. The texts are sorted by token count and each sub-batch is filled
+    while its padded size i.e. # of texts x longest text, fits in the token budget. Short texts hence go in large
+    sub-batches and long texts in small ones, instead of a fixed # of texts padded to the longest one.
+
+    Args:
+        token_counts (list[int]): # of tokens of each text
+        token_budget (int): max # of (padded) tokens per sub-batch. A text longer than the budget gets its own sub-batch
+
+    Returns:
+        list[list[int]]: sub-batches of indices into token_counts
+    """
+    sorted_indices = sorted(range(len(token_counts)), key=lambda index: token_counts[index], reverse=True)
+
+    sub_batches = []
+    current_batch: list[int] = []
+    longest = 0
+    for index in sorted_indices:
+        # sorted longest first, hence the first text of a sub-batch sets its padded length
+        if current_batch and longest * (len(current_batch) + 1) > token_budget:
+            sub_batches.append(current_batch)
+            current_batch = []
+
+        if not current_batch:
+            longest = max(token_counts[index], 1)
+        current_batch.append(index)
+
+    if current_batch:
+        sub_batches.append(current_batch)
+
+    return sub_batches
+
+
+def encode_with_token_budget(model, texts: list[str], max_length: int, token_budget: int) -> np.ndarray:
+    """Encodes texts with the given model (SentenceTransformer or BGE AbsEmbedder), in sub-batches packed by
+    bucket_by_token_budget(...). The embeddings are scattered back to the original order of texts.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    # fast tokenizers encode the whole list in one call, in Rust
+    input_ids = model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)["input_ids"]
+    sub_batches = bucket_by_token_budget([len(ids) for ids in input_ids], token_budget)
+
+    embeddings: np.ndarray | None = None
+    for indices in sub_batches:
+        # https://github.com/FlagOpen/FlagEmbedding/blob/master/FlagEmbedding/inference/embedder/encoder_only/base.py
+        sub_batch_embeddings = model.encode([texts[index] for index in indices],
+                                            batch_size=len(indices),
+                                            convert_to_numpy=True,
+                                            show_progress_bar=False)
+        sub_batch_embeddings = np.asarray(sub_batch_embeddings).reshape(len(indices), -1)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), sub_batch_embeddings.shape[1]), dtype=sub_batch_embeddings.dtype)
+        embeddings[indices] = sub_batch_embeddings
+
+    return embeddings
 
 
 @deprecated("Please use the batch_encode_code_using_BGE function")
@@ -1,13 +1,25 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter, SentenceTransformersTokenTextSplitter
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter, SentenceTransformersTokenTextSplitter
+from transformers import PreTrainedTokenizerFast
 
 from core.config import settings
+from featurepipe.featurepipe_config import fp_settings
 from featurepipe.datalogic.chunking_model_manager import ChunkingModelManager
 
+# size of the segments long texts are tokenized in, in parallel
+_SEGMENT_CHARS = 8_000
+
 
 def chunk_text(text:str) -> list[str]:
     """Util helps chunk data that is large aka multiple sentences / paragraphs, to be able to generate
     embeddings where input length of str can be a constraint.
     """
+    if fp_settings.CHUNKING_FAST_PATH:
+        return chunk_text_by_token_offsets(text=text,
+                                           tokenizer=ChunkingModelManager.get_fast_tokenizer(),
+                                           max_tokens=settings.EMBEDDING_MODEL_MAX_INPUT_LENGTH,
+                                           overlap_tokens=fp_settings.CHUNK_OVERLAP_TOKENS)
+
     # Keeping sentences and para intact, split across paragraphs
     # char_splitter = RecursiveCharacterTextSplitter(
     #     separators=["\n\n"],    # split only paragraphs. Combines paragraphs until the chunk_size is reached
@@ -32,3 +44,89 @@ def chunk_text(text:str) -> list[str]:
 
     return chunks
 
+
+def chunk_text_by_token_offsets(text: str,
+                                tokenizer: PreTrainedTokenizerFast,
+                                max_tokens: int,
+                                overlap_tokens: int) -> list[str]:
+    """Chunks the text in overlapping windows of tokens. The text is tokenized once, by the fast tokenizer of the
+    embedding model, and the chunks are slices of the text cut at the offsets of the first and last token of each
+    window. Windows are snapped to word boundaries, so a chunk re-tokenizes to the same tokens.
+
+    Args:
+        text (str): cleaned text
+        tokenizer (PreTrainedTokenizerFast): tokenizer of the embedding model
+        max_tokens (int): max input length of the embedding model, including the special tokens eg: [CLS], [SEP]
+        overlap_tokens (int): # of tokens shared by consecutive chunks
+
+    Raises:
+        ValueError: if overlap_tokens leaves no room for new tokens in a window
+
+    Returns:
+        list[str]: chunks, in the order of the text
+    """
+    window = max_tokens - tokenizer.num_special_tokens_to_add()
+    stride = window - overlap_tokens
+    if stride <= 0:
+        raise ValueError(f"Chunk overlap of {overlap_tokens} tokens must be less than the window of {window} tokens")
+
+    offsets, word_starts = _tokenize_offsets(text, tokenizer)
+    num_tokens = len(offsets)
+
+    def is_word_start(index: int) -> bool:
+        return index == num_tokens or word_starts[index]
+
+    chunks = []
+    start = 0
+    while start < num_tokens:
+        end = min(start + window, num_tokens)
+        # end the window before a word cut in two, unless the window is a single word
+        word_end = end
+        while not is_word_start(word_end) and word_end > start + 1:
+            word_end -= 1
+        if is_word_start(word_end):
+            end = word_end
+
+        chunks.append(text[offsets[start, 0] : offsets[end - 1, 1]])
+        if end == num_tokens:
+            break
+
+        # start the next window, overlapping this one, at a word start
+        next_start = max(end - overlap_tokens, start + 1)
+        while not is_word_start(next_start) and next_start < end:
+            next_start += 1
+        start = next_start
+
+    return chunks
+
+
+def _tokenize_offsets(text: str, tokenizer: PreTrainedTokenizerFast) -> tuple[np.ndarray, np.ndarray]:
+    """Tokenizes the text, without special tokens.
+    Fast tokenizers only run in parallel across the texts of a batch. Hence a long text is split in segments at line
+    breaks, which are word boundaries, and the segments are tokenized as one batch.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (start, end) char offsets of each token in the text, and whether each token starts a word
+    """
+    segment_starts = [0]
+    while len(text) - segment_starts[-1] > _SEGMENT_CHARS:
+        line_break = text.find("\n", segment_starts[-1] + _SEGMENT_CHARS)
+        if line_break < 0:
+            break
+        segment_starts.append(line_break + 1)
+    segment_ends = segment_starts[1:] + [len(text)]
+
+    # the Rust tokenizer, as BatchEncoding conversions of offsets and word ids cost as much as the tokenization
+    encodings = tokenizer.backend_tokenizer.encode_batch(
+        [text[start:end] for start, end in zip(segment_starts, segment_ends)], add_special_tokens=False)
+
+    offsets = [np.empty((0, 2), dtype=np.int64)]
+    word_starts = [np.empty(0, dtype=bool)]
+    for segment_start, encoding in zip(segment_starts, encodings):
+        if not encoding.offsets:
+            continue
+        offsets.append(np.asarray(encoding.offsets, dtype=np.int64) + segment_start)
+        word_ids = np.asarray(encoding.word_ids, dtype=np.int64)
+        word_starts.append(np.concatenate(([True], word_ids[1:] != word_ids[:-1])))
+
+    return np.concatenate(offsets), np.concatenate(word_starts)
@@ -1,5 +1,6 @@
 import re
 
+from typing_extensions import deprecated
 from unstructured.cleaners.core import clean, clean_non_ascii_chars, replace_unicode_quotes
 
 
@@ -81,7 +82,67 @@ def _replace_urls_with_placeholder_(text, placeholder="[URL]"):
 
 
 
+# Bold / italic (sans-serif) math chars to plain ASCII. Same ranges as _convert_bold_chars_ and
+# _convert_italic_char_. The other chars of the bold regex range i.e. non sans-serif bold digits, are left as is
+_UNSTYLE_TABLE: dict[int, str] = {
+    **{0x1D5D4 + offset: chr(ord("A") + offset) for offset in range(26)},     # bold upper case
+    **{0x1D5EE + offset: chr(ord("a") + offset) for offset in range(26)},     # bold lower case
+    **{0x1D7EC + offset: chr(ord("0") + offset) for offset in range(10)},     # bold digits
+    **{0x1D608 + offset: chr(ord("A") + offset) for offset in range(26)},     # italic upper case
+    **{0x1D622 + offset: chr(ord("a") + offset) for offset in range(26)},     # italic lower case
+}
+
+# runs of styled chars. Bold and italic letters are contiguous, U+1D5D4 to U+1D63B
+_STYLED_CHARS_PATTERN = re.compile("[\U0001D5D4-\U0001D63B\U0001D7EC-\U0001D7F5]+")
+
+_EMOJI_SYMBOL_PATTERN = re.compile(
+    "["
+    "\U0001f600-\U0001f64f"  # emoticons
+    "\U0001f300-\U0001f5ff"  # symbols & pictographs
+    "\U0001f680-\U0001f6ff"  # transport & map symbols
+    "\U0001f1e0-\U0001f1ff"  # flags (iOS)
+    "\U00002193"  # downwards arrow
+    "\U000021b3"  # downwards arrow with tip rightwards
+    "\U00002192"  # rightwards arrow
+    "]+",
+    flags=re.UNICODE,
+)
+
+_URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+
+
 def normalize_text(text_content: str | None) -> str:
+    """
+    Normalize the text content by removing bold, italic, emojis, symbols, non-ascii chars, urls.
+    Same output as normalize_text_multipass(...), with precompiled patterns and a translation table:
+    unbold + unitalic is one pass, translating whole runs of styled chars, and ASCII text skips all the
+    non-ASCII passes.
+    """
+    if text_content is None:
+        return ""
+
+    if text_content.isascii():
+        cleaned_text = text_content.strip()
+        # the only quote replacement that applies to ASCII text
+        if "&apos;" in cleaned_text:
+            cleaned_text = cleaned_text.replace("&apos;", "'")
+        return _URL_PATTERN.sub("[URL]", cleaned_text)
+
+    # translating only the runs of styled chars, as str.translate(...) with a dict is slow over long texts
+    cleaned_text = _STYLED_CHARS_PATTERN.sub(lambda match: match.group().translate(_UNSTYLE_TABLE), text_content)
+    cleaned_text = _EMOJI_SYMBOL_PATTERN.sub(" ", cleaned_text)
+    cleaned_text = cleaned_text.strip()
+    # unicode quotes are replaced by non-ASCII chars, dropped right after, except for the mojibake sequences
+    # starting with "â" and "&apos;". Hence the replacements are only needed when those are present
+    if "â" in cleaned_text or "&apos;" in cleaned_text:
+        cleaned_text = replace_unicode_quotes(cleaned_text)
+    cleaned_text = cleaned_text.encode("ascii", "ignore").decode()
+
+    return _URL_PATTERN.sub("[URL]", cleaned_text)
+
+
+@deprecated("Please use the normalize_text function")
+def normalize_text_multipass(text_content: str | None) -> str:
     """
     Normalize the text content by removing bold, italic, emojis, symbols, non-ascii chars, urls
     """
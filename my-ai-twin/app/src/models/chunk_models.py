@@ -10,6 +10,10 @@ class PostChunkModel(DataModel):
     author_id: str
     image: Optional[str] = None
     type: str
+    # chunking of the entry (shared by its chunks) and the # of chunks it produced. Once all of them are written,
+    # the vector sink deletes the chunks the entry no longer produces
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
 
 
 class ArticleChunkModel(DataModel):
@@ -20,6 +24,8 @@ class ArticleChunkModel(DataModel):
     chunk_content: str
     author_id: str
     type: str
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
 
 
 class RepositoryChunkModel(DataModel):
@@ -30,3 +36,5 @@ class RepositoryChunkModel(DataModel):
     chunk_content: str
     owner_id: str
     type: str
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
@@ -2,7 +2,7 @@
 This module encapsulates all Vector Embeddings models
 """
 
-from typing import Tuple
+from typing import Optional, Tuple
 import numpy as np
 
 from models.base_models import VectorDBDataModel
@@ -13,8 +13,13 @@ class PostVectorDBModel(VectorDBDataModel):
     chunk_id: str
     chunk_content: str
     embedded_content: np.ndarray
+    # model and backend of the embedding (EmbeddingModelManager.model_key), stored so that a model switch rewrites the points
+    embedding_model: Optional[str] = None
     author_id: str
     type: str
+    # copied from the chunk model, for the vector sink to prune the entry. Not stored in the payload
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -24,8 +29,9 @@ class PostVectorDBModel(VectorDBDataModel):
             "id": self.entry_id,
             "platform": self.platform,
             "content": self.chunk_content,
-            "owner_id": self.author_id,
+            "author_id": self.author_id,
             "type": self.type,
+            "embedding_model": self.embedding_model,
         }
 
         return self.chunk_id, self.embedded_content, data
@@ -39,8 +45,11 @@ class ArticleVectorDBModel(VectorDBDataModel):
     chunk_id: str
     chunk_content: str
     embedded_content: np.ndarray
+    embedding_model: Optional[str] = None
     author_id: str
     type: str
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -53,6 +62,7 @@ class ArticleVectorDBModel(VectorDBDataModel):
             "link": self.link,
             "author_id": self.author_id,
             "type": self.type,
+            "embedding_model": self.embedding_model,
         }
 
         return self.chunk_id, self.embedded_content, data
@@ -66,8 +76,11 @@ class RepositoryVectorDBModel(VectorDBDataModel):
     chunk_id: str
     chunk_content: str
     embedded_content: np.ndarray
+    embedding_model: Optional[str] = None
     owner_id: str
     type: str
+    chunking_id: Optional[str] = None
+    num_entry_chunks: Optional[int] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -80,6 +93,7 @@ class RepositoryVectorDBModel(VectorDBDataModel):
             "link": self.link,
             "owner_id": self.owner_id,
             "type": self.type,
+            "embedding_model": self.embedding_model,
         }
 
         return self.chunk_id, self.embedded_content, data
\ No newline at end of file
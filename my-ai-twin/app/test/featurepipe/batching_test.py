@@ -0,0 +1,82 @@
+import zlib
+from datetime import timedelta
+
+from bytewax.dataflow import Dataflow
+import bytewax.operators as op
+from bytewax.testing import TestingSink, TestingSource, run_main
+
+from featurepipe.dataflow.batching import batch_by_content_type, content_type_key, raw_content_type_key
+from featurepipe.featurepipe_config import fp_settings
+from models.base_models import DataModel
+from models.content_enum import ContentDataEnum
+
+
+def _data_models(num_per_type: int) -> list[DataModel]:
+    return [DataModel(entry_id=f"{data_type}-{index}", type=data_type)
+            for index in range(num_per_type)
+            for data_type in (ContentDataEnum.POSTS, ContentDataEnum.ARTICLES, ContentDataEnum.REPOSITORIES)]
+
+
+def test_content_type_key_without_shards(monkeypatch):
+    monkeypatch.setattr(fp_settings, "EMBEDDING_BATCH_KEY_SHARDS", 1)
+
+    assert [content_type_key(data_model) for data_model in _data_models(2)] == ["posts", "articles", "repositories"] * 2
+
+
+def test_content_type_key_shards_on_entry_id(monkeypatch):
+    monkeypatch.setattr(fp_settings, "EMBEDDING_BATCH_KEY_SHARDS", 4)
+    data_models = _data_models(50)
+
+    keys = [content_type_key(data_model) for data_model in data_models]
+
+    assert keys[0] == f"posts-{zlib.crc32(b'posts-0') % 4}"
+    assert {key.rsplit("-", 1)[0] for key in keys} == {"posts", "articles", "repositories"}
+    assert {int(key.rsplit("-", 1)[1]) for key in keys} == {0, 1, 2, 3}
+    # stable across processes, unlike hash()
+    assert keys == [content_type_key(data_model) for data_model in data_models]
+
+
+def test_raw_batches_spread_over_several_keys(monkeypatch):
+    # independent of the embedding shards
+    monkeypatch.setattr(fp_settings, "EMBEDDING_BATCH_KEY_SHARDS", 1)
+    monkeypatch.setattr(fp_settings, "CLEANING_BATCH_KEY_SHARDS", 4)
+    data_models = _data_models(50)
+    batches = []
+
+    flow = Dataflow("raw batching test")
+    stream = op.input("input", flow, TestingSource(data_models))
+    keyed = op.key_on("key", stream, raw_content_type_key)
+    batched = op.collect("collect", keyed, timeout=timedelta(seconds=60), max_size=100)
+    op.output("output", batched, TestingSink(batches))
+    run_main(flow)
+
+    # 3 content types x 4 shards, each batch of a single type
+    assert len({key for key, _ in batches}) == 12
+    for key, batch in batches:
+        assert {data_model.type for data_model in batch} == {key.rsplit("-", 1)[0]}
+    assert sorted(data_model.entry_id for _, batch in batches for data_model in batch) == \
+        sorted(data_model.entry_id for data_model in data_models)
+
+
+def test_batch_by_content_type_never_mixes_types(monkeypatch):
+    monkeypatch.setattr(fp_settings, "EMBEDDING_BATCH_KEY_SHARDS", 2)
+    data_models = _data_models(10)
+    batches = []
+
+    flow = Dataflow("batching test")
+    stream = op.input("input", flow, TestingSource(data_models))
+    batched = batch_by_content_type("batch", stream,
+                                    max_sizes={"posts": 4, "articles": 3, "repositories": 100},
+                                    timeouts_secs={"posts": 60, "articles": 60, "repositories": 60})
+    op.output("output", batched, TestingSink(batches))
+    run_main(flow)
+
+    for key, batch in batches:
+        assert {data_model.type for data_model in batch} == {key.rsplit("-", 1)[0]}
+        assert {content_type_key(data_model) for data_model in batch} == {key}
+    # per type max_size
+    max_batch_sizes = {data_type: max(len(batch) for key, batch in batches if key.startswith(data_type))
+                       for data_type in ("posts", "articles", "repositories")}
+    assert max_batch_sizes["posts"] <= 4 and max_batch_sizes["articles"] <= 3 and max_batch_sizes["repositories"] > 4
+    assert sorted(data_model.entry_id for _, batch in batches for data_model in batch) == \
+        sorted(data_model.entry_id for data_model in data_models)
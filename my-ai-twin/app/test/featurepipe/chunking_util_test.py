@@ -23,4 +23,61 @@ def test_chunk_data():
 
     chunked_text: list[str] = text_chunking_util.chunk_text(long_txt)
     for i, txt in enumerate(chunked_text) :
-        print(f"Data chunk at index {i} is {txt}")
\ No newline at end of file
+        print(f"Data chunk at index {i} is {txt}")
+
+@pytest.fixture(scope="module")
+def wordpiece_tokenizer(tmp_path_factory):
+    """BERT fast tokenizer with a tiny vocab. Words out of the vocab are split in letters i.e. several tokens"""
+    from transformers import BertTokenizerFast
+
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *".,:()=_", *letters, *[f"##{letter}" for letter in letters],
+             "the", "model", "def", "return", "data", "chunk"]
+    vocab_file = tmp_path_factory.mktemp("tokenizer") / "vocab.txt"
+    vocab_file.write_text("\n".join(vocab))
+
+    return BertTokenizerFast(vocab_file=str(vocab_file))
+
+
+def _token_count(tokenizer, text: str) -> int:
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+@pytest.mark.parametrize("max_tokens, overlap_tokens", [(32, 8), (64, 0), (16, 4)])
+def test_chunk_text_by_token_offsets(wordpiece_tokenizer, max_tokens: int, overlap_tokens: int):
+    lines = ["def chunk(data): return the model", "    embedding = model.encode(data)", "", "the data pipeline"]
+    text = "\n".join(lines * 30)
+
+    chunks = text_chunking_util.chunk_text_by_token_offsets(text, wordpiece_tokenizer, max_tokens, overlap_tokens)
+
+    window = max_tokens - wordpiece_tokenizer.num_special_tokens_to_add()
+    position = 0
+    for chunk in chunks:
+        # slices of the text, in order, fitting in the window once tokenized
+        start = text.find(chunk, position)
+        assert start >= 0
+        position = start + 1
+        assert 0 < _token_count(wordpiece_tokenizer, chunk) <= window
+        # cut at word boundaries, words split in several tokens are kept whole
+        end = start + len(chunk)
+        assert start == 0 or not (text[start - 1].isalnum() and chunk[0].isalnum())
+        assert end == len(text) or not (text[end].isalnum() and chunk[-1].isalnum())
+    assert text.strip().startswith(chunks[0]) and text.strip().endswith(chunks[-1])
+    if overlap_tokens == 0:
+        assert "".join(chunks).replace(" ", "").replace("\n", "") == text.replace(" ", "").replace("\n", "")
+
+
+def test_chunk_text_by_token_offsets_short_and_empty_text(wordpiece_tokenizer):
+    assert text_chunking_util.chunk_text_by_token_offsets("", wordpiece_tokenizer, 32, 8) == []
+    assert text_chunking_util.chunk_text_by_token_offsets("  the model  ", wordpiece_tokenizer, 32, 8) == ["the model"]
+    with pytest.raises(ValueError):
+        text_chunking_util.chunk_text_by_token_offsets("the model", wordpiece_tokenizer, 32, 30)
+
+
+def test_chunk_text_by_token_offsets_across_segments(wordpiece_tokenizer, monkeypatch):
+    text = "\n".join(["def chunk(data): return the model", "the data pipeline"] * 50)
+    single_segment_chunks = text_chunking_util.chunk_text_by_token_offsets(text, wordpiece_tokenizer, 32, 8)
+
+    # long texts are tokenized in segments, cut at line breaks
+    monkeypatch.setattr(text_chunking_util, "_SEGMENT_CHARS", 100)
+    assert text_chunking_util.chunk_text_by_token_offsets(text, wordpiece_tokenizer, 32, 8) == single_segment_chunks
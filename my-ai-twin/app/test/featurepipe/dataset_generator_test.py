@@ -41,3 +41,174 @@ def test_generate_data():
 
         dataset_generator.generate_training_data(collection_name=collection_name, data_type=data_type)
 
+
+
+def test_iter_cleaned_content_scrolls_all_pages(monkeypatch):
+    from qdrant_client.models import PointStruct
+
+    from db.qdrant_connection import QdrantDatabaseConnector
+    from featurepipe.datasetgen import dataset_generator
+
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", ":memory:")
+    connection = QdrantDatabaseConnector()
+    connection.create_non_vector_collection("cleaned_articles")
+    # more points than a page, including empty content
+    connection.write_batch_data("cleaned_articles", [
+        PointStruct(id=index, vector={}, payload={"cleaned_content": f"article {index}" if index % 100 else "", "type": "articles"})
+        for index in range(1, 601)
+    ])
+    monkeypatch.setattr(dataset_generator, "client", connection)
+
+    generator = DatasetGenerator(JSONFileHandler(), DataFormatter(), GPTCommunicator())
+    contents = generator.iter_cleaned_content("cleaned_articles")
+
+    assert next(contents) == "article 1"
+    assert list(contents) == [f"article {index}" for index in range(2, 601) if index % 100]
+    assert [record.payload for record in connection.iter_points("cleaned_articles", payload_fields=["type"], page_size=7)] \
+        == [{"type": "articles"}] * 600
+
+
+def test_batched():
+    from featurepipe.datasetgen.dataset_generator import batched
+
+    assert list(batched(iter(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
+
+
+class CountingCommunicator:
+    """Stand-in for GPTCommunicator, answering one instruction per document of the prompt"""
+
+    gpt_model = "test-model"
+
+    def __init__(self):
+        self.num_prompts = 0
+        # # of prompts of each send_prompts_async call
+        self.window_sizes = []
+
+    def _answer(self, prompt: str) -> list:
+        import re
+
+        self.num_prompts += 1
+        return [{"instruction": f"Write about {number}", "content": number}
+                for number in re.findall(r"Content number (\d+)", prompt)]
+
+    def send_prompt(self, prompt: str) -> list:
+        return self._answer(prompt)
+
+    @staticmethod
+    def new_rate_limiter() -> None:
+        return None
+
+    async def send_prompts_async(self, prompts: list[str], on_response=None, rate_limiter=None) -> list[list]:
+        self.window_sizes.append(len(prompts))
+        responses = []
+        for index, prompt in enumerate(prompts):
+            responses.append(self._answer(prompt))
+            if on_response is not None:
+                on_response(index, responses[-1])
+        return responses
+
+
+async def _collect(batch_results) -> list:
+    return [batch_result async for batch_result in batch_results]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_rerun_skips_batches_in_response_cache(tmp_path, monkeypatch, use_async):
+    import asyncio
+
+    from featurepipe.datasetgen.dataset_generator import batched
+    from featurepipe.featurepipe_config import fp_settings
+
+    monkeypatch.setattr(fp_settings, "DATASET_GEN_CACHE_DIR", str(tmp_path))
+    documents = [f"post {index}" for index in range(10)]
+
+    def run(communicator: CountingCommunicator, documents: list[str]) -> list:
+        generator = DatasetGenerator(JSONFileHandler(), DataFormatter(), communicator)
+        with generator.open_response_cache("cleaned_posts") as response_cache:
+            batches = batched(documents, 3)
+            if use_async:
+                return asyncio.run(_collect(generator.send_batches_async(batches, "posts", 3, response_cache)))
+            return list(generator.send_batches(batches, "posts", 3, response_cache))
+
+    # first run, cut short after 2 batches
+    first_communicator = CountingCommunicator()
+    run(first_communicator, documents[:6])
+    assert first_communicator.num_prompts == 2
+
+    # the rerun only sends the 2 batches not answered yet, results are the same as answered from scratch
+    rerun_communicator = CountingCommunicator()
+    results = run(rerun_communicator, documents)
+    assert rerun_communicator.num_prompts == 2
+    assert [[instruction["content"] for instruction in instructions] for _, instructions in results] \
+        == [["0", "1", "2"], ["3", "4", "5"], ["6", "7", "8"], ["9"]]
+    assert [batch for batch, _ in results] == list(batched(documents, 3))
+
+    # documents added ahead shift the numbering of the prompts, the batches already answered are not sent again
+    shifted_communicator = CountingCommunicator()
+    run(shifted_communicator, ["new post 1", "new post 2", "new post 3"] + documents)
+    assert shifted_communicator.num_prompts == 1
+
+
+def test_async_batches_are_read_in_windows(monkeypatch):
+    import asyncio
+
+    from featurepipe.datasetgen.dataset_generator import batched
+    from featurepipe.featurepipe_config import fp_settings
+
+    monkeypatch.setattr(fp_settings, "OPENAI_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(fp_settings, "DATASET_GEN_WINDOW_FACTOR", 2)
+    documents = [f"post {index}" for index in range(30)]
+    num_read = 0
+
+    def read_batches():
+        nonlocal num_read
+        for batch in batched(documents, 3):
+            num_read += 1
+            yield batch
+
+    communicator = CountingCommunicator()
+    generator = DatasetGenerator(JSONFileHandler(), DataFormatter(), communicator)
+
+    async def run() -> list:
+        batch_results = generator.send_batches_async(read_batches(), "posts", 3)
+        first_result = await anext(batch_results)
+        # only the first window was read and sent
+        assert num_read == 4
+        assert communicator.window_sizes == [4]
+        return [first_result] + await _collect(batch_results)
+
+    results = asyncio.run(run())
+
+    assert communicator.window_sizes == [4, 4, 2]
+    assert [batch for batch, _ in results] == list(batched(documents, 3))
+    assert [[instruction["content"] for instruction in instructions] for _, instructions in results] \
+        == [[str(number) for number in range(start, min(start + 3, 30))] for start in range(0, 30, 3)]
+
+
+def test_response_cache_ignores_truncated_line(tmp_path):
+    from featurepipe.datasetgen.response_cache import ResponseCache
+
+    path = tmp_path / "cleaned_posts_responses.jsonl"
+    with ResponseCache(path, model_id="test-model") as response_cache:
+        response_cache.put("posts", ["post 1"], [{"instruction": "a", "content": "1"}])
+        response_cache.put("posts", ["post 2"], [{"instruction": "b", "content": "2"}])
+    # crash while writing the last response
+    path.write_text(path.read_text()[:-10])
+
+    with ResponseCache(path, model_id="test-model") as response_cache:
+        assert len(response_cache) == 1
+        assert response_cache.get("posts", ["post 1"]) == [{"instruction": "a", "content": "1"}]
+        assert response_cache.get("posts", ["post 2"]) is None
+        # appended after the truncated line, not onto it
+        response_cache.put("posts", ["post 3"], [{"instruction": "c", "content": "3"}])
+
+    with ResponseCache(path, model_id="test-model") as response_cache:
+        assert len(response_cache) == 2
+        assert response_cache.get("posts", ["post 3"]) == [{"instruction": "c", "content": "3"}]
+
+    # a different model or data type does not reuse the responses
+    with ResponseCache(path, model_id="other-model") as response_cache:
+        assert response_cache.get("posts", ["post 1"]) is None
+    with ResponseCache(path, model_id="test-model") as response_cache:
+        assert response_cache.get("articles", ["post 1"]) is None
@@ -0,0 +1,75 @@
+import threading
+
+import numpy as np
+import pytest
+
+from core.config import settings
+from featurepipe.featurepipe_config import fp_settings
+from featurepipe.datalogic.cleaning_data_handlers import CleaningHandlerFactory
+from featurepipe.datalogic.dispatchers import CleaningDispatcher, DispatchPool, EmbeddingDispatcher
+from featurepipe.datalogic.embedding_worker_pool import EmbeddingWorkerPool
+from models.chunk_models import PostChunkModel
+from models.content_enum import ContentDataEnum
+from models.raw_models import PostRawModel
+
+
+def _raw_posts(num_posts: int) -> list[PostRawModel]:
+    return [PostRawModel(entry_id=str(index), type=ContentDataEnum.POSTS, platform="linkedin", author_id="author",
+                         content={"text": f"  Post \U0001D5EF\U0001D5FC\U0001D5F9\U0001D5F1 #{index} \U0001F680 https://example.com/{index}  "})
+            for index in range(num_posts)]
+
+
+@pytest.fixture(params=[("thread", 0), ("thread", 4), ("process", 2)])
+def dispatch_pool(request, monkeypatch):
+    kind, size = request.param
+    monkeypatch.setattr(fp_settings, "DISPATCH_POOL_KIND", kind)
+    monkeypatch.setattr(fp_settings, "DISPATCH_POOL_SIZE", size)
+    monkeypatch.setattr(DispatchPool, "_executor", None)
+    yield
+    if DispatchPool._executor is not None:
+        DispatchPool._executor.shutdown()
+
+
+def test_factory_reuses_handlers():
+    assert CleaningHandlerFactory.create_handler(ContentDataEnum.POSTS) is CleaningHandlerFactory.create_handler(ContentDataEnum.POSTS)
+    with pytest.raises(ValueError):
+        CleaningHandlerFactory.create_handler("unknown")
+
+
+def test_batch_cleaner_matches_per_item_cleaner(dispatch_pool):
+    raw_posts = _raw_posts(25)
+
+    batch_key, clean_models = CleaningDispatcher.dispatch_batch_cleaner(("posts", raw_posts))
+
+    assert batch_key == "posts"
+    assert clean_models == [CleaningDispatcher.dispatch_cleaner(raw_post) for raw_post in raw_posts]
+    assert clean_models[3].cleaned_content == "Post bold #3   [URL]"
+
+
+class BarrierPool:
+    """Stand-in EmbeddingWorkerPool, whose encode only returns once num_batches batches are being encoded at once"""
+
+    def __init__(self, num_batches: int):
+        self.barrier = threading.Barrier(num_batches)
+
+    def encode(self, model_kind: str, texts: list[str]) -> np.ndarray:
+        self.barrier.wait(timeout=10)
+        return np.zeros((len(texts), settings.EMBEDDING_SIZE), dtype=np.float32)
+
+
+def test_batches_are_embedded_concurrently_on_the_worker_pool(monkeypatch):
+    pool = BarrierPool(num_batches=3)
+    monkeypatch.setattr(EmbeddingWorkerPool, "get_instance", lambda: pool)
+    monkeypatch.setattr(fp_settings, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(fp_settings, "EMBEDDING_WORKER_POOL_SIZE", 2)
+    monkeypatch.setattr(EmbeddingDispatcher, "_batch_executor", None)
+    batches = [(f"posts-{index}", [PostChunkModel(entry_id=str(index), platform="linkedin", chunk_id=str(index),
+                                                  chunk_content=f"chunk {index}", author_id="author",
+                                                  type=ContentDataEnum.POSTS)])
+               for index in range(3)]
+
+    embedded_batches = EmbeddingDispatcher.dispatch_batches_embedder(batches)
+
+    assert [batch_key for batch_key, _ in embedded_batches] == ["posts-0", "posts-1", "posts-2"]
+    assert [models[0].entry_id for _, models in embedded_batches] == ["0", "1", "2"]
+    EmbeddingDispatcher._batch_executor.shutdown()
@@ -0,0 +1,51 @@
+import random
+import warnings
+
+import pytest
+
+from featurepipe.datasetgen.document_chunker import DocumentChunker
+
+WORDS = ["model", "vector", "e.g.", "Mr.", "U.S.", "data", "pipeline", "embedding", "query", "token"]
+ENDINGS = [".", "?", "!", ".", ""]
+SEPARATORS = [" ", "\n", "  ", "\n\n", " \t"]
+
+
+def _make_document(rng: random.Random, num_sentences: int) -> str:
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 40))) + rng.choice(ENDINGS)
+                 for _ in range(num_sentences)]
+    document = ""
+    for sentence in sentences:
+        document += sentence + rng.choice(SEPARATORS)
+    return rng.choice(["", " ", "\n"]) + document
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_iter_substrings_same_as_legacy(seed: int):
+    rng = random.Random(seed)
+    document = _make_document(rng, rng.randint(0, 300))
+    min_len, max_len = rng.choice([(1000, 2000), (50, 200), (0, 10), (100, 100)])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        expected = DocumentChunker._extract_substrings_(document, min_len=min_len, max_len=max_len)
+
+    assert list(DocumentChunker.iter_substrings(document, min_len=min_len, max_len=max_len)) == expected
+
+
+def test_iter_sentence_spans_are_offsets_into_document():
+    document = "  First sentence. Mr. Smith asked e.g. this?\nYes!   \n Last one"
+
+    spans = list(DocumentChunker.iter_sentence_spans(document))
+
+    assert [document[start:end] for start, end in spans] == \
+        ["First sentence.", "Mr. Smith asked e.g. this?", "Yes!", "Last one"]
+
+
+def test_iter_chunk_documents_is_lazy():
+    def documents():
+        yield "One. Two. Three."
+        raise AssertionError("the second document must not be pulled before the first one is chunked")
+
+    chunks = DocumentChunker.iter_chunk_documents(documents(), min_length=1, max_length=8)
+
+    assert [next(chunks) for _ in range(3)] == ["One.", "Two.", "Three."]
@@ -0,0 +1,37 @@
+import numpy as np
+
+from featurepipe.datalogic.embedding_cache import EmbeddingCache
+
+
+def test_get_many_returns_cached_embeddings(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "cache.sqlite"), max_entries=100)
+    embedding = np.arange(384, dtype=np.float32)
+
+    cache.put_many("model-a", {"hash-1": embedding})
+
+    found = cache.get_many("model-a", ["hash-1", "hash-2"])
+    assert list(found) == ["hash-1"]
+    assert found["hash-1"].dtype == np.float32
+    assert np.array_equal(found["hash-1"], embedding)
+    # same chunk, embedded by another model, is a miss
+    assert cache.get_many("model-b", ["hash-1"]) == {}
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_cache_persists_across_instances(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache(db_path=db_path, max_entries=100).put_many("model-a", {"hash-1": np.ones(4, dtype=np.float32)})
+
+    assert "hash-1" in EmbeddingCache(db_path=db_path, max_entries=100).get_many("model-a", ["hash-1"])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put_many("model-a", {"hash-1": np.ones(4, dtype=np.float32)})
+    cache.put_many("model-a", {"hash-2": np.ones(4, dtype=np.float32)})
+    # hash-1 is now the most recently used
+    cache.get_many("model-a", ["hash-1"])
+
+    cache.put_many("model-a", {"hash-3": np.ones(4, dtype=np.float32)})
+
+    assert set(cache.get_many("model-a", ["hash-1", "hash-2", "hash-3"])) == {"hash-1", "hash-3"}
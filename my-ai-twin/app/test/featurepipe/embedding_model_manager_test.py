@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from sentence_transformers import SentenceTransformer, models
+from transformers import BertConfig, BertModel, BertTokenizerFast
+
+from core.config import settings
+from featurepipe.datalogic.embedding_model_manager import EmbeddingModelManager, load_sentence_transformer
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + \
+        "the model pipeline vector embedding data stream python function class return query chunk".split()
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory) -> str:
+    """Randomly initialized BGE-like model i.e. BERT + CLS pooling + normalization, saved locally"""
+    path = tmp_path_factory.mktemp("tiny-bge")
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB))
+    tokenizer = BertTokenizerFast(vocab_file=str(vocab_file))
+    bert = BertModel(BertConfig(vocab_size=len(VOCAB), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                                intermediate_size=64, max_position_embeddings=128))
+
+    bert_dir = path / "bert"
+    bert.save_pretrained(bert_dir)
+    tokenizer.save_pretrained(bert_dir)
+    transformer = models.Transformer(str(bert_dir), max_seq_length=64)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="cls")
+    model_dir = path / "model"
+    SentenceTransformer(modules=[transformer, pooling, models.Normalize()], device="cpu").save(str(model_dir))
+
+    return str(model_dir)
+
+
+def _cosine_similarities(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    return (reference * candidate).sum(axis=1) / (np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+
+@pytest.mark.parametrize("backend, min_similarity", [("onnx", 0.9999), ("onnx-int8", 0.95)])
+def test_onnx_backend_parity(tiny_model_path, tmp_path, monkeypatch, backend: str, min_similarity: float):
+    monkeypatch.setattr(settings, "EMBEDDING_ONNX_EXPORT_DIR", str(tmp_path))
+    texts = ["the model pipeline", "vector embedding data stream", "python function class return", "query chunk"] * 4
+
+    reference = load_sentence_transformer(tiny_model_path, backend="torch", device="cpu").encode(texts)
+    candidate = load_sentence_transformer(tiny_model_path, backend=backend, device="cpu").encode(texts)
+
+    assert candidate.shape == reference.shape
+    assert _cosine_similarities(reference, candidate).min() >= min_similarity
+
+
+def test_unsupported_backend(tiny_model_path):
+    with pytest.raises(ValueError):
+        load_sentence_transformer(tiny_model_path, backend="tensorrt", device="cpu")
+
+
+def test_model_key_per_backend(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_BACKEND", "torch")
+    assert EmbeddingModelManager.model_key("BAAI/bge-small-en-v1.5") == "BAAI/bge-small-en-v1.5"
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_BACKEND", "onnx-int8")
+    assert EmbeddingModelManager.model_key("BAAI/bge-small-en-v1.5") == "BAAI/bge-small-en-v1.5@onnx-int8"
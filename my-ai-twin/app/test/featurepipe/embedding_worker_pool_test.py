@@ -0,0 +1,84 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from featurepipe.datalogic.embedding_worker_pool import TEXT_MODEL, EmbeddingWorkerPool, assign_cores
+
+
+def no_preload() -> None:
+    pass
+
+
+def word_count_encoder(model_kind: str, texts: list[str]) -> np.ndarray:
+    """Embeds a text as [# of words, pid of the worker, # of cores the worker is pinned to]"""
+    if model_kind != TEXT_MODEL:
+        raise ValueError(f"Unsupported model kind {model_kind}")
+    num_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 0
+    return np.array([[len(text.split()), os.getpid(), num_cores] for text in texts], dtype=np.float32)
+
+
+def slow_encoder(model_kind: str, texts: list[str]) -> np.ndarray:
+    time.sleep(5)
+    return np.zeros((len(texts), 3), dtype=np.float32)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = EmbeddingWorkerPool(num_workers=2, cores_per_worker=1, initializer=no_preload, encoder=word_count_encoder)
+    yield pool
+    pool.close()
+
+
+def test_assign_cores():
+    assert assign_cores(2, 0, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert assign_cores(3, 1, [4, 5, 6]) == [[4], [5], [6]]
+    # over subscribed, cores are shared
+    assert assign_cores(3, 0, [0, 1]) == [[0], [1], [0]]
+
+
+def test_encode_returns_ordered_embeddings(pool):
+    texts = [" ".join(["word"] * count) for count in (3, 1, 7, 2)]
+
+    embeddings = pool.encode(TEXT_MODEL, texts)
+
+    assert embeddings.shape == (4, 3)
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [3, 1, 7, 2]
+    assert embeddings[0, 1] != os.getpid()
+    if hasattr(os, "sched_getaffinity"):
+        assert embeddings[:, 2].tolist() == [1] * 4
+
+
+def test_concurrent_batches_resolve_their_own_future(pool):
+    futures = [pool.submit(TEXT_MODEL, [" ".join(["word"] * index)] * 50) for index in range(1, 21)]
+
+    results = [future.result(timeout=30) for future in futures]
+
+    for index, result in enumerate(results, start=1):
+        assert result.shape == (50, 3)
+        assert (result[:, 0] == index).all()
+
+
+def test_worker_errors_are_raised(pool):
+    with pytest.raises(RuntimeError):
+        pool.encode("unknown", ["text"])
+
+    # the worker keeps serving
+    assert pool.encode(TEXT_MODEL, ["a b"])[0, 0] == 2
+
+
+def test_pending_batches_fail_when_a_worker_dies():
+    pool = EmbeddingWorkerPool(num_workers=2, cores_per_worker=1, initializer=no_preload, encoder=slow_encoder)
+    try:
+        futures = [pool.submit(TEXT_MODEL, ["text"]) for _ in range(2)]
+        pool._processes[0].kill()
+
+        for future in futures:
+            with pytest.raises(RuntimeError, match="broken"):
+                future.result(timeout=10)
+        with pytest.raises(RuntimeError, match="broken"):
+            pool.submit(TEXT_MODEL, ["text"])
+    finally:
+        pool.close()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from featurepipe.utils.embeddings_util import bucket_by_token_budget, encode_with_token_budget
+
+
+class WordTokenizer:
+    def __call__(self, texts: list[str], add_special_tokens: bool, truncation: bool, max_length: int) -> dict:
+        return {"input_ids": [text.split()[:max_length] for text in texts]}
+
+
+class WordCountModel:
+    """Embeds a text as [# of words, # of texts in the encode call]"""
+    tokenizer = WordTokenizer()
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, sentences: list[str], batch_size: int, convert_to_numpy: bool, show_progress_bar: bool):
+        self.batch_sizes.append(len(sentences))
+        return np.array([[len(sentence.split()), len(sentences)] for sentence in sentences], dtype=np.float32)
+
+
+def test_bucket_by_token_budget():
+    token_counts = [10, 500, 12, 250, 11, 260, 9]
+
+    sub_batches = bucket_by_token_budget(token_counts, token_budget=600)
+
+    assert sorted(index for batch in sub_batches for index in batch) == list(range(len(token_counts)))
+    for batch in sub_batches:
+        assert len(batch) == 1 or max(token_counts[i] for i in batch) * len(batch) <= 600
+    # long texts get small sub-batches, short texts are packed together
+    assert [1] in sub_batches
+    assert sorted([0, 2, 4, 6]) in [sorted(batch) for batch in sub_batches]
+
+
+def test_text_over_budget_gets_its_own_batch():
+    assert bucket_by_token_budget([2000, 10], token_budget=512) == [[0], [1]]
+
+
+def test_encode_with_token_budget_restores_order():
+    texts = ["word " * n for n in [3, 40, 5, 38, 4, 1]]
+    model = WordCountModel()
+
+    embeddings = encode_with_token_budget(model, texts, max_length=512, token_budget=80)
+
+    assert embeddings[:, 0].tolist() == [3, 40, 5, 38, 4, 1]
+    assert sum(model.batch_sizes) == len(texts)
+    assert len(model.batch_sizes) > 1
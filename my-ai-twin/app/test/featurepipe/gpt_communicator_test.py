@@ -0,0 +1,165 @@
+import asyncio
+import json
+import re
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from featurepipe.featurepipe_config import fp_settings
+from featurepipe.datasetgen.dataformatter import DataFormatter
+from featurepipe.datasetgen.gpt_communicator import GPTCommunicator
+from featurepipe.datasetgen.rate_limiter import AsyncRateLimiter
+
+
+class MockCompletionServer:
+    """Local OpenAI compatible chat completion endpoint, served from its own thread. Answers one instruction per
+    "Content number x" line of the prompt, after a simulated latency. The first num_rate_limited requests get a 429."""
+
+    def __init__(self, latency_secs: float = 0.05, num_rate_limited: int = 0):
+        self.latency_secs = latency_secs
+        self.num_rate_limited = num_rate_limited
+        self.num_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    async def _completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.num_requests += 1
+        if self.num_requests <= self.num_rate_limited:
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                     status=429, headers={"retry-after-ms": "20"})
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency_secs)
+        self.in_flight -= 1
+
+        content_numbers = re.findall(r"Content number (\d+)", body["messages"][-1]["content"])
+        instructions = [{"instruction": f"Write about {number}", "content": number} for number in content_numbers]
+        return web.json_response({
+            "id": f"chatcmpl-{self.num_requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"Here you go: {json.dumps(instructions)}"}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        })
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+        self._ready.set()
+        self._loop.run_forever()
+
+    def __enter__(self) -> "MockCompletionServer":
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def communicator_settings(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(fp_settings, "OPENAI_MAX_CONCURRENCY", 8)
+    monkeypatch.setattr(fp_settings, "OPENAI_RETRY_BASE_DELAY_SECONDS", 0.01)
+
+
+def _prompts(num_prompts: int, batch_size: int = 3) -> list[str]:
+    return [DataFormatter.format_prompt([f"post {index}" for index in range(batch_size)], "posts", prompt_index * batch_size)
+            for prompt_index in range(num_prompts)]
+
+
+def test_send_prompts_async_keeps_order(communicator_settings):
+    with MockCompletionServer(num_rate_limited=5) as server:
+        communicator = GPTCommunicator(base_url=server.base_url)
+        responses = asyncio.run(communicator.send_prompts_async(_prompts(40)))
+
+    # the rate limited requests were retried, and every response matches its prompt
+    assert server.num_requests == 45
+    assert [[instruction["content"] for instruction in response] for response in responses] \
+        == [[str(number) for number in range(index * 3, index * 3 + 3)] for index in range(40)]
+    assert 1 < server.max_in_flight <= fp_settings.OPENAI_MAX_CONCURRENCY
+
+
+def test_send_prompts_async_gives_up_after_max_retries(communicator_settings, monkeypatch):
+    monkeypatch.setattr(fp_settings, "OPENAI_MAX_RETRIES", 2)
+    with MockCompletionServer(num_rate_limited=100) as server:
+        communicator = GPTCommunicator(base_url=server.base_url)
+        responses = asyncio.run(communicator.send_prompts_async(_prompts(2)))
+
+    assert responses == [[], []]
+    assert server.num_requests == 6
+
+
+def test_concurrent_prompts_faster_than_sequential(communicator_settings):
+    prompts = _prompts(32)
+    with MockCompletionServer(latency_secs=0.05) as server:
+        communicator = GPTCommunicator(base_url=server.base_url)
+
+        start_time = time.perf_counter()
+        sequential_responses = [communicator.send_prompt(prompt) for prompt in prompts]
+        sequential_secs = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        concurrent_responses = asyncio.run(communicator.send_prompts_async(prompts))
+        concurrent_secs = time.perf_counter() - start_time
+
+    print(f"Sequential: {sequential_secs:.2f} secs, concurrent: {concurrent_secs:.2f} secs")
+    assert concurrent_responses == sequential_responses
+    assert concurrent_secs * 3 < sequential_secs
+
+
+def test_retry_delay_honors_retry_after():
+    for attempt in range(10):
+        assert 0 <= GPTCommunicator.retry_delay(attempt) <= fp_settings.OPENAI_RETRY_MAX_DELAY_SECONDS
+
+    class Response:
+        headers = {"retry-after": "3"}
+
+    assert GPTCommunicator.retry_delay(0, Response()) >= 3
+
+
+def test_rate_limiter_waits_for_tokens():
+    async def acquire_all(limiter: AsyncRateLimiter) -> float:
+        start_time = time.perf_counter()
+        # a full bucket goes through at once, the next request waits for 6 tokens to refill, at 10 tokens / sec
+        await limiter.acquire(600)
+        await limiter.acquire(6)
+        return time.perf_counter() - start_time
+
+    elapsed = asyncio.run(acquire_all(AsyncRateLimiter(requests_per_minute=100, tokens_per_minute=600)))
+
+    assert 0.5 <= elapsed < 2
+
+
+def test_rate_limiter_settles_usage():
+    now = [0.0]
+    limiter = AsyncRateLimiter(requests_per_minute=10, tokens_per_minute=1000, clock=lambda: now[0])
+
+    asyncio.run(limiter.acquire(500))
+    # 300 of the 500 reserved were used
+    limiter.record_usage(reserved_tokens=500, used_tokens=300)
+    assert limiter._available_tokens == 700
+    # overuse delays the next requests
+    limiter.record_usage(reserved_tokens=0, used_tokens=900)
+    assert limiter._available_tokens == -200
+
+    with pytest.raises(ValueError):
+        AsyncRateLimiter(requests_per_minute=0, tokens_per_minute=1000)
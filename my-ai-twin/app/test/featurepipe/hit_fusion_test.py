@@ -0,0 +1,41 @@
+import pytest
+from qdrant_client.models import ScoredPoint
+
+from core.errors import ImproperlyConfigured
+from core.rag.hit_fusion import MAX_SCORE_FUSION, RRF_K, fuse_hits
+
+
+def _hits(*id_scores: tuple[int, float]) -> list[ScoredPoint]:
+    return [ScoredPoint(id=point_id, version=0, score=score, payload={"content": f"chunk {point_id}"})
+            for point_id, score in id_scores]
+
+
+def test_rrf_ranks_points_returned_by_several_searches_first():
+    ranked_hits = {
+        "vector_posts": [_hits((1, 0.9), (2, 0.8)), _hits((2, 0.7), (3, 0.6))],
+        "vector_repositories": [_hits((1, 0.2))],
+    }
+
+    hits = fuse_hits(ranked_hits)
+
+    # point 2 of posts : ranks 2 and 1. The repositories point 1 is another point than the posts point 1
+    assert [(hit.id, hit.score) for hit in hits] == [
+        (2, 1 / (RRF_K + 2) + 1 / (RRF_K + 1)),
+        (1, 1 / (RRF_K + 1)),
+        (1, 1 / (RRF_K + 1)),
+        (3, 1 / (RRF_K + 2)),
+    ]
+    assert hits[0].payload == {"content": "chunk 2"}
+    # the searched hits are left as is
+    assert ranked_hits["vector_posts"][0][1].score == 0.8
+
+
+def test_max_score_fusion_and_limit():
+    ranked_hits = {"vector_posts": [_hits((1, 0.5), (2, 0.4)), _hits((2, 0.9), (1, 0.3), (3, 0.1))]}
+
+    assert [(hit.id, hit.score) for hit in fuse_hits(ranked_hits, method=MAX_SCORE_FUSION)] == [(2, 0.9), (1, 0.5), (3, 0.1)]
+    assert [hit.id for hit in fuse_hits(ranked_hits, method=MAX_SCORE_FUSION, limit=2)] == [2, 1]
+    assert fuse_hits({}) == []
+
+    with pytest.raises(ImproperlyConfigured):
+        fuse_hits(ranked_hits, method="sum")
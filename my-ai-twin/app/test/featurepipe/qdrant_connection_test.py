@@ -0,0 +1,145 @@
+import asyncio
+import weakref
+
+import pytest
+from qdrant_client import models
+
+from core.config import settings
+from core.errors import ImproperlyConfigured
+from db.qdrant_connection import (BINARY_QUANTIZATION, SCALAR_QUANTIZATION, QdrantDatabaseConnector,
+                                  quantization_config, tenant_field)
+
+
+class RecordingClient:
+    """Wraps the in-process QdrantClient, recording the collection configs, payload indexes and search params sent"""
+
+    def __init__(self, client):
+        self._client = client
+        self.hnsw_configs: dict[str, models.HnswConfigDiff] = {}
+        self.quantization_configs: dict[str, models.QuantizationConfig | None] = {}
+        self.payload_indexes: dict[str, object] = {}
+        self.search_params: list[models.SearchParams | None] = []
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def create_collection(self, collection_name, vectors_config, hnsw_config, quantization_config):
+        self.hnsw_configs[collection_name] = hnsw_config
+        self.quantization_configs[collection_name] = quantization_config
+        return self._client.create_collection(collection_name, vectors_config, hnsw_config=hnsw_config,
+                                              quantization_config=quantization_config)
+
+    def create_payload_index(self, collection_name, field_name, field_schema):
+        self.payload_indexes[field_name] = field_schema
+        return self._client.create_payload_index(collection_name, field_name, field_schema)
+
+    def query_batch_points(self, collection_name, requests):
+        self.search_params.extend(request.params for request in requests)
+        return self._client.query_batch_points(collection_name, requests)
+
+
+def _server_like_connection(monkeypatch) -> tuple[QdrantDatabaseConnector, RecordingClient]:
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", ":memory:")
+    connection = QdrantDatabaseConnector()
+    client = connection._instance = RecordingClient(connection._instance)
+    # from here on, the connector behaves as against a Qdrant server
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", None)
+    return connection, client
+
+
+def test_vector_collection_is_created_with_hnsw_config_and_payload_indexes(monkeypatch):
+    connection, client = _server_like_connection(monkeypatch)
+    monkeypatch.setitem(settings.QDRANT_HNSW_CONFIG, "vector_repositories",
+                        {"m": 8, "ef_construct": 64, "payload_m": 12, "hnsw_ef": 32})
+
+    connection.create_vector_collection("vector_repositories")
+
+    assert client.hnsw_configs == {"vector_repositories": models.HnswConfigDiff(m=8, ef_construct=64, payload_m=12)}
+    assert client.payload_indexes == {
+        "owner_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+        "type": models.PayloadSchemaType.KEYWORD,
+        "id": models.PayloadSchemaType.KEYWORD,
+    }
+
+    connection.search_batch("vector_repositories", [[0.1] * settings.EMBEDDING_MODEL_FOR_CODE_VECTOR_LENGTH] * 2)
+    assert client.quantization_configs == {"vector_repositories": None}
+    assert client.search_params == [models.SearchParams(hnsw_ef=32)] * 2
+
+
+def test_quantized_collection_is_searched_with_rescoring(monkeypatch):
+    connection, client = _server_like_connection(monkeypatch)
+    monkeypatch.setitem(settings.QDRANT_VECTOR_STORAGE_CONFIG, "vector_posts",
+                        {"quantization": SCALAR_QUANTIZATION, "on_disk": True, "oversampling": 3.0})
+    monkeypatch.setitem(settings.QDRANT_VECTOR_STORAGE_CONFIG, "vector_articles",
+                        {"quantization": "product", "on_disk": False, "oversampling": 1.0})
+
+    connection.create_vector_collection("vector_posts")
+
+    assert client.quantization_configs["vector_posts"].scalar.type == models.ScalarType.INT8
+    assert connection.get_collection("vector_posts").config.params.vectors.on_disk
+    hnsw_ef = settings.QDRANT_HNSW_CONFIG["vector_posts"]["hnsw_ef"]
+    connection.search_batch("vector_posts", [[0.1] * settings.EMBEDDING_SIZE])
+    connection.search_batch("vector_posts", [[0.1] * settings.EMBEDDING_SIZE], oversampling=1.5)
+    assert client.search_params == [
+        models.SearchParams(hnsw_ef=hnsw_ef, quantization=models.QuantizationSearchParams(rescore=True, oversampling=3.0)),
+        models.SearchParams(hnsw_ef=hnsw_ef, quantization=models.QuantizationSearchParams(rescore=True, oversampling=1.5)),
+    ]
+
+    with pytest.raises(ImproperlyConfigured):
+        connection.create_vector_collection("vector_articles")
+    assert quantization_config(BINARY_QUANTIZATION).binary.always_ram
+
+
+def test_tenant_field():
+    assert [tenant_field(name) for name in ("vector_posts", "vector_articles", "vector_repositories")] == \
+        ["author_id", "author_id", "owner_id"]
+
+
+
+def test_connectors_share_one_pooled_client(monkeypatch):
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", None)
+    monkeypatch.setattr(settings, "QDRANT_PREFER_GRPC", True)
+    monkeypatch.setattr(settings, "QDRANT_MAX_CONNECTIONS", 8)
+    monkeypatch.setattr(QdrantDatabaseConnector, "_client", None)
+    monkeypatch.setattr(QdrantDatabaseConnector, "_async_clients", weakref.WeakKeyDictionary())
+
+    # the clients connect on first request, no server needed
+    connections = [QdrantDatabaseConnector() for _ in range(3)]
+
+    assert len({id(connection._instance) for connection in connections}) == 1
+    options = connections[0]._instance._init_options
+    assert options["prefer_grpc"] and options["grpc_port"] == settings.QDRANT_GRPC_PORT
+    assert options["limits"].max_connections == 8
+
+    async def async_clients():
+        return QdrantDatabaseConnector.get_async_client(), QdrantDatabaseConnector.get_async_client()
+
+    # one async client per event loop
+    first_loop_clients, second_loop_clients = asyncio.run(async_clients()), asyncio.run(async_clients())
+    assert first_loop_clients[0] is first_loop_clients[1]
+    assert first_loop_clients[0] is not second_loop_clients[0]
+
+    # a connector closing does not close the client of the others
+    connections[0].close()
+    assert QdrantDatabaseConnector._client is connections[1]._instance
+    assert QdrantDatabaseConnector()._instance is connections[1]._instance
+
+    QdrantDatabaseConnector.close_shared()
+    assert QdrantDatabaseConnector._client is None
+    assert len(QdrantDatabaseConnector._async_clients) == 0
+
+
+def test_asearch_batch_in_process(monkeypatch):
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", ":memory:")
+    connection = QdrantDatabaseConnector()
+    connection.create_vector_collection("vector_posts")
+    connection.write_batch_data("vector_posts", [
+        models.PointStruct(id=index, vector=[index + 1.0] + [1.0] * (settings.EMBEDDING_SIZE - 1)) for index in range(5)
+    ])
+    query_vectors = [[1.0] * settings.EMBEDDING_SIZE, [5.0] + [1.0] * (settings.EMBEDDING_SIZE - 1)]
+
+    hits = asyncio.run(connection.asearch_batch("vector_posts", query_vectors, limit=2))
+
+    assert [[hit.id for hit in query_hits] for query_hits in hits] == \
+        [[hit.id for hit in query_hits] for query_hits in connection.search_batch("vector_posts", query_vectors, limit=2)]
+    assert asyncio.run(connection.asearch_batch("vector_posts", [])) == []
@@ -0,0 +1,47 @@
+import numpy as np
+
+from core.rag.query_embedder import QueryEmbedder
+from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL
+
+
+class CountingEncoder:
+    """Stand-in for an embedding model, embedding a text as [len(text), dim]"""
+
+    def __init__(self, dim: float):
+        self.dim = dim
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        self.calls.append(texts)
+        return np.array([[len(text), self.dim] for text in texts], dtype=np.float32)
+
+
+def test_embed_encodes_missing_queries_in_one_batch():
+    text_encoder, code_encoder = CountingEncoder(1), CountingEncoder(2)
+    embedder = QueryEmbedder(max_entries=100, encoders={TEXT_MODEL: text_encoder, CODE_MODEL: code_encoder})
+
+    embeddings = embedder.embed(["what is RAG", "a", "what is RAG", "bb"])
+
+    assert embeddings.tolist() == [[11, 1], [1, 1], [11, 1], [2, 1]]
+    # one call, duplicates encoded once
+    assert text_encoder.calls == [["what is RAG", "a", "bb"]]
+
+    # repeated question : only the new expanded query is encoded. Models are cached separately
+    assert embedder.embed(["what is RAG", "ccc"]).tolist() == [[11, 1], [3, 1]]
+    assert text_encoder.calls[-1] == ["ccc"]
+    assert embedder.embed(["what is RAG"], CODE_MODEL).tolist() == [[11, 2]]
+    assert code_encoder.calls == [["what is RAG"]]
+    assert embedder.stats()["hits"] == 1
+
+
+def test_embed_evicts_least_recently_used():
+    text_encoder = CountingEncoder(1)
+    embedder = QueryEmbedder(max_entries=2, encoders={TEXT_MODEL: text_encoder})
+
+    embedder.embed(["a", "b"])
+    embedder.embed(["a"])
+    embedder.embed(["c"])
+    embedder.embed(["a", "b"])
+
+    # b was the least recently used when c came in
+    assert text_encoder.calls == [["a", "b"], ["c"], ["b"]]
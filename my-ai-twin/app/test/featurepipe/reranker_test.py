@@ -0,0 +1,71 @@
+import numpy as np
+
+from core.rag import cross_encoders
+from core.rag.cross_encoders import CrossEncoderModelSingleton
+from core.rag.reranker import ReRanker
+
+
+class CountingCrossEncoder:
+    """Stand-in for sentence_transformers.CrossEncoder, scoring a pair as the # of query words in the passage"""
+
+    def __init__(self, model_id: str, device: str):
+        self.batches: list[list[tuple[str, str]]] = []
+
+    def predict(self, pairs, batch_size: int, show_progress_bar: bool, convert_to_numpy: bool) -> np.ndarray:
+        self.batches.append(list(pairs))
+        return np.array([sum(word in passage.split() for word in query.split()) for query, passage in pairs],
+                        dtype=np.float32)
+
+
+def _cross_encoder(monkeypatch, max_cached_scores: int = 100) -> CrossEncoderModelSingleton:
+    monkeypatch.setattr(cross_encoders, "CrossEncoder", CountingCrossEncoder)
+    cross_encoder = CrossEncoderModelSingleton(model_id="stand-in", device="cpu", batch_size=2,
+                                               max_cached_scores=max_cached_scores)
+    monkeypatch.setattr(CrossEncoderModelSingleton, "_instance", cross_encoder)
+    return cross_encoder
+
+
+def test_predict_sorts_pairs_by_length_and_keeps_the_order(monkeypatch):
+    cross_encoder = _cross_encoder(monkeypatch)
+    pairs = [("rag", "rag"), ("rag", "what is rag in llm apps"), ("rag", "no"), ("rag", "rag is retrieval")]
+
+    scores = cross_encoder.predict(pairs)
+
+    assert scores.tolist() == [1, 1, 0, 1]
+    assert cross_encoder._model.batches == [[pairs[1], pairs[3], pairs[0], pairs[2]]]
+    assert cross_encoder(pairs) == scores.tolist()
+
+
+def test_score_predicts_each_new_passage_once(monkeypatch):
+    cross_encoder = _cross_encoder(monkeypatch, max_cached_scores=3)
+
+    assert cross_encoder.score("what is rag", ["rag", "what is", "rag"]) == [1, 2, 1]
+    assert cross_encoder._model.batches == [[("what is rag", "what is"), ("what is rag", "rag")]]
+
+    # same query : only the new passage goes through the model, another query is scored again
+    assert cross_encoder.score("what is rag", ["rag", "is rag"]) == [1, 2]
+    assert cross_encoder._model.batches[-1] == [("what is rag", "is rag")]
+    assert cross_encoder.score("rag", ["rag"]) == [1]
+    assert cross_encoder._model.batches[-1] == [("rag", "rag")]
+    # evicted, the cache holds 3 scores
+    cross_encoder.score("what is rag", ["what is"])
+    assert cross_encoder._model.batches[-1] == [("what is rag", "what is")]
+
+
+def test_rerank_with_cross_encoder_keeps_top_k_unique_passages(monkeypatch):
+    cross_encoder = _cross_encoder(monkeypatch)
+    passages = ["rag is retrieval", " no match ", "what is rag", "rag is retrieval", ""]
+
+    top_passages = ReRanker.generate_response_using_crossencoder("what is rag", passages, keep_top_k=2)
+
+    assert top_passages == ["what is rag", "rag is retrieval"]
+    assert len(cross_encoder._model.batches[0]) == 3
+
+
+def test_llm_reranker_shares_one_client(monkeypatch):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(ReRanker, "_model", None)
+
+    assert ReRanker.get_model() is ReRanker.get_model()
@@ -1,4 +1,6 @@
+import asyncio
 import sys
+import time
 from pathlib import Path
 
 # For testing (or learning) purpose only, not PROD :
@@ -16,6 +18,9 @@ from core.config import settings
 # TODO : TO run this in CICD pipeline will need to figure out where mongodb wud run and how to access it
 settings.patch_localhost()
 
+import numpy as np
+from qdrant_client import models
+
 from core.rag.vector_retriever import VectorRetriever
 
 logger = logger_utils.get_logger(__name__)
@@ -28,10 +33,182 @@ def test_retriever():
         Could you draft an article paragraph discussing RAG ? I am particularly interested in how to design a RAG system.
         """
 
-    retriever = VectorRetriever(query=query)
-    hits = retriever.retrieve_top_k(k= 6, to_expand_to_n_queries=5)
-    reranked_hits = retriever.rerank(hits=hits, keep_top_k=5)
+    retriever = VectorRetriever.get_instance()
+    retriever.warmup()
+    hits = retriever.retrieve_top_k(query=query, k= 6, to_expand_to_n_queries=5)
+    reranked_hits = retriever.rerank(query=query, hits=hits, keep_top_k=5)
 
     logger.info("======== Retreived Documents =========")
     for rank, hit in enumerate(reranked_hits):
-        logger.info(f"Rank = {rank} : {hit}")
\ No newline at end of file
+        logger.info(f"Rank = {rank} : {hit}")
+
+def _in_memory_vector_store(monkeypatch, num_points: int = 200, num_authors: int = 4):
+    import numpy as np
+    from qdrant_client.models import PointStruct
+
+    from db.qdrant_connection import QdrantDatabaseConnector
+    from core.rag.vector_retriever import SEARCH_COLLECTIONS
+
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", ":memory:")
+    connection = QdrantDatabaseConnector()
+    rng = np.random.default_rng(42)
+    for collection_name, tenant_key in SEARCH_COLLECTIONS.items():
+        connection.create_vector_collection(collection_name)
+        size = connection.get_collection(collection_name).config.params.vectors.size
+        connection.write_batch_data(collection_name, [
+            PointStruct(id=index, vector=rng.random(size).tolist(),
+                        payload={tenant_key: f"author-{index % num_authors}", "content": f"{collection_name} {index}"})
+            for index in range(num_points)
+        ])
+    return connection, rng
+
+
+def test_search_collections_same_hits_as_one_search_per_query(monkeypatch):
+    from core.rag.vector_retriever import SEARCH_COLLECTIONS, search_collections
+
+    connection, rng = _in_memory_vector_store(monkeypatch)
+    query_vectors = {
+        collection_name: rng.random((5, connection.get_collection(collection_name).config.params.vectors.size)).tolist()
+        for collection_name in SEARCH_COLLECTIONS
+    }
+
+    hits = search_collections(connection, query_vectors, author_id="author-1", limit=2)
+
+    expected_hits = [
+        hit
+        for collection_name, tenant_key in SEARCH_COLLECTIONS.items()
+        for query_vector in query_vectors[collection_name]
+        for hit in connection.search(collection_name, query_vector, limit=2, query_filter=models.Filter(
+            must=[models.FieldCondition(key=tenant_key, match=models.MatchValue(value="author-1"))]))
+    ]
+    assert [(hit.id, hit.payload) for hit in hits] == [(hit.id, hit.payload) for hit in expected_hits]
+    assert len(hits) == 3 * 5 * 2
+    assert all(hit.id % 4 == 1 for hit in hits)
+    # no author : no filter
+    assert len(search_collections(connection, query_vectors, author_id=None, limit=3)) == 3 * 5 * 3
+
+
+class SlowQueryExpansion:
+    """Stand-in for QueryExpansion, with the latency of an LLM call"""
+
+    def __init__(self, latency_secs: float = 0.05):
+        self.latency_secs = latency_secs
+
+    def generate_response(self, query: str, to_expand_to_n: int) -> list[str]:
+        time.sleep(self.latency_secs)
+        return [f"{query} version {index}" for index in range(to_expand_to_n)]
+
+    async def agenerate_response(self, query: str, to_expand_to_n: int) -> list[str]:
+        await asyncio.sleep(self.latency_secs)
+        return [f"{query} version {index}" for index in range(to_expand_to_n)]
+
+
+class SlowSelfQuery:
+    def __init__(self, latency_secs: float = 0.05):
+        self.latency_secs = latency_secs
+
+    def generate_response(self, query: str) -> str:
+        time.sleep(self.latency_secs)
+        return "author-1"
+
+    async def agenerate_response(self, query: str) -> str:
+        await asyncio.sleep(self.latency_secs)
+        return "author-1"
+
+
+def _hashing_encoder(size: int):
+    def encode(texts: list[str]) -> np.ndarray:
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2**32).random(size) for text in texts])
+    return encode
+
+
+def _local_retriever(monkeypatch) -> VectorRetriever:
+    from core.rag.query_embedder import QueryEmbedder
+    from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL
+
+    connection, _ = _in_memory_vector_store(monkeypatch)
+    retriever = VectorRetriever()
+    retriever._client = connection
+    retriever._query_embedder = QueryEmbedder(max_entries=100, encoders={
+        TEXT_MODEL: _hashing_encoder(settings.EMBEDDING_SIZE),
+        CODE_MODEL: _hashing_encoder(settings.EMBEDDING_MODEL_FOR_CODE_VECTOR_LENGTH)})
+    retriever._query_expander = SlowQueryExpansion()
+    retriever._metadata_extractor = SlowSelfQuery()
+    return retriever
+
+
+def test_retriever_serves_concurrent_queries(monkeypatch):
+    retriever = _local_retriever(monkeypatch)
+    retriever._query_expander = SlowQueryExpansion(latency_secs=0.25)
+    retriever._metadata_extractor = SlowSelfQuery(latency_secs=0.25)
+    retriever.warmup()
+    queries = [f"question {index}" for index in range(16)]
+
+    start_time = time.perf_counter()
+    sequential_hits = [retriever.retrieve_top_k(query, k=6, to_expand_to_n_queries=3) for query in queries]
+    sequential_secs = time.perf_counter() - start_time
+
+    async def retrieve_all() -> list:
+        return await asyncio.gather(*(retriever.aretrieve_top_k(query, k=6, to_expand_to_n_queries=3) for query in queries))
+
+    start_time = time.perf_counter()
+    concurrent_hits = asyncio.run(retrieve_all())
+    concurrent_secs = time.perf_counter() - start_time
+
+    logger.info(f"Sequential: {sequential_secs:.2f} secs, concurrent: {concurrent_secs:.2f} secs")
+    # the original query + 3 versions, 2 hits each, in 3 collections, fused down to k
+    assert [len(hits) for hits in concurrent_hits] == [6] * len(queries)
+    assert [[hit.id for hit in hits] for hits in concurrent_hits] == [[hit.id for hit in hits] for hits in sequential_hits]
+    assert concurrent_secs * 2 < sequential_secs
+
+
+def test_llm_calls_run_concurrently_and_fall_back_on_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVER_LLM_TIMEOUT_SECONDS", 0.3)
+    retriever = _local_retriever(monkeypatch)
+    retriever.warmup()
+
+    # both calls take 0.2 secs, run one after the other they would time out
+    retriever._query_expander = SlowQueryExpansion(latency_secs=0.2)
+    retriever._metadata_extractor = SlowSelfQuery(latency_secs=0.2)
+    assert len(retriever.retrieve_top_k("question", k=6, to_expand_to_n_queries=3)) == 6
+    assert len(asyncio.run(retriever.aretrieve_top_k("question", k=6, to_expand_to_n_queries=3))) == 6
+
+    # query expansion times out : the raw query only. Self query times out : no author filter
+    retriever._query_expander = SlowQueryExpansion(latency_secs=1)
+    retriever._metadata_extractor = SlowSelfQuery(latency_secs=1)
+    for hits in (retriever.retrieve_top_k("question", k=6, to_expand_to_n_queries=3),
+                 asyncio.run(retriever.aretrieve_top_k("question", k=6, to_expand_to_n_queries=3))):
+        assert len(hits) == 1 * 2 * 3
+        assert {hit.id % 4 for hit in hits} != {1}
+
+
+def test_retriever_fuses_hits_of_all_queries(monkeypatch):
+    from core.rag.query_embedder import QueryEmbedder
+    from featurepipe.datalogic.embedding_worker_pool import CODE_MODEL, TEXT_MODEL
+
+    retriever = _local_retriever(monkeypatch)
+    # all the expanded queries are embedded as the original one : their searches return the same hits
+    same_vector = lambda size: lambda texts: _hashing_encoder(size)(["question"] * len(texts))
+    retriever._query_embedder = QueryEmbedder(max_entries=100, encoders={
+        TEXT_MODEL: same_vector(settings.EMBEDDING_SIZE),
+        CODE_MODEL: same_vector(settings.EMBEDDING_MODEL_FOR_CODE_VECTOR_LENGTH)})
+
+    hits = retriever.retrieve_top_k("question", k=9, to_expand_to_n_queries=3)
+
+    # 4 queries x 3 collections x 3 hits, each hit 4 times. Ids repeat across collections, the contents do not
+    assert len(hits) == len({hit.payload["content"] for hit in hits}) == 9
+    assert [hit.score for hit in hits] == [4 / 61] * 3 + [4 / 62] * 3 + [4 / 63] * 3
+
+
+def test_llm_clients_abort_requests_at_the_deadline(monkeypatch):
+    from core.rag.llm_self_query import LlmSelfQuery
+    from core.rag.query_expansion import QueryExpansion
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "RETRIEVER_LLM_TIMEOUT_SECONDS", 0.3)
+    for llm_step in (QueryExpansion, LlmSelfQuery):
+        monkeypatch.setattr(llm_step, "_model", None)
+        model = llm_step.get_model()
+        assert model.request_timeout == 0.3
+        assert model.max_retries == 0
+        assert llm_step.get_model() is model
@@ -0,0 +1,268 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from featurepipe.featurepipe_config import fp_settings
+from featurepipe.dataflow.stream_input import RabbitMQSource, epoch_prefetch_count
+
+
+class LocalBroker:
+    """In-memory stand-in for a RabbitMQ queue. Every delivery pays a simulated network round trip plus
+    a per message transfer cost."""
+
+    def __init__(self, num_messages: int, round_trip_secs: float = 0.002, transfer_secs_per_msg: float = 0.0005):
+        self.round_trip_secs = round_trip_secs
+        self.transfer_secs_per_msg = transfer_secs_per_msg
+        self._messages: queue.Queue = queue.Queue()
+        for index in range(num_messages):
+            self._messages.put(json.dumps({"entry_id": str(index), "type": "posts"}).encode())
+
+    def get_nowait(self, max_messages: int) -> list[bytes]:
+        messages = []
+        while len(messages) < max_messages:
+            try:
+                messages.append(self._messages.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def is_empty(self) -> bool:
+        return self._messages.empty()
+
+
+class LocalMethodFrame:
+    def __init__(self, delivery_tag: int):
+        self.delivery_tag = delivery_tag
+
+
+class LocalChannel:
+    def __init__(self, broker: LocalBroker, connection: "LocalConnection"):
+        self._broker = broker
+        self.connection = connection
+        self.prefetch_count = 0
+        self.on_message_callback = None
+        self.unacked_tags: list[int] = []
+        self.acks: list[tuple[int, bool]] = []
+        self._delivery_tag = 0
+
+    def basic_qos(self, prefetch_count: int):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool):
+        self.on_message_callback = on_message_callback
+        return "consumer-tag"
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        self.acks.append((delivery_tag, multiple))
+        if multiple:
+            self.unacked_tags = [tag for tag in self.unacked_tags if tag > delivery_tag]
+        else:
+            self.unacked_tags.remove(delivery_tag)
+
+    def deliver(self) -> None:
+        """Pushes messages to the consumer, up to the prefetch window"""
+        messages = self._broker.get_nowait(self.prefetch_count - len(self.unacked_tags))
+        time.sleep(self._broker.round_trip_secs + self._broker.transfer_secs_per_msg * len(messages))
+        for body in messages:
+            self._delivery_tag += 1
+            self.unacked_tags.append(self._delivery_tag)
+            self.on_message_callback(self, LocalMethodFrame(self._delivery_tag), None, body)
+
+    def close(self):
+        pass
+
+
+class LocalConnection:
+    def __init__(self, broker: LocalBroker):
+        self._broker = broker
+        self.channel: LocalChannel | None = None
+
+    def connect(self):
+        pass
+
+    def get_channel(self) -> LocalChannel:
+        self.channel = LocalChannel(self._broker, self)
+        return self.channel
+
+    def process_data_events(self, time_limit: float = 0):
+        self.channel.deliver()
+
+    def close(self):
+        pass
+
+
+def _build_partition(broker: LocalBroker, prefetch_count: int = 100, ack_on_snapshot: bool = False):
+    source = RabbitMQSource(queue_name="test", num_partitions=1, prefetch_count=prefetch_count,
+                            ack_on_snapshot=ack_on_snapshot, connection_factory=lambda: LocalConnection(broker))
+    return source.build_part(now=None, for_part=source.list_parts()[0], resume_state=None)
+
+
+def _run_workers(num_workers: int, num_messages: int) -> list[list[str]]:
+    """Simulates Bytewax workers, each driving one partition in its own thread. Returns the entry ids received by
+    each partition."""
+    broker = LocalBroker(num_messages)
+    source = RabbitMQSource(queue_name="test", num_partitions=num_workers,
+                            connection_factory=lambda: LocalConnection(broker))
+    partitions = [source.build_part(now=None, for_part=part, resume_state=None) for part in source.list_parts()]
+    received: list[list[str]] = [[] for _ in range(num_workers)]
+
+    def drain(index: int):
+        while True:
+            batch = partitions[index].next_batch()
+            if not batch and broker.is_empty():
+                return
+            received[index].extend(message["entry_id"] for message in batch)
+
+    threads = [threading.Thread(target=drain, args=(index,)) for index in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return received
+
+
+def test_list_parts_per_partition():
+    source = RabbitMQSource(queue_name="test", num_partitions=3, connection_factory=lambda: None)
+
+    assert source.list_parts() == ["test-0", "test-1", "test-2"]
+
+
+def test_invalid_num_partitions():
+    with pytest.raises(ValueError):
+        RabbitMQSource(queue_name="test", num_partitions=0)
+
+
+@pytest.mark.parametrize("num_workers", [2, 4])
+def test_messages_are_spread_across_partitions(num_workers: int):
+    num_messages = 500 * num_workers
+
+    received = _run_workers(num_workers, num_messages)
+
+    # every partition consumes, each message exactly once
+    assert all(received)
+    received_ids = [entry_id for entry_ids in received for entry_id in entry_ids]
+    assert sorted(received_ids, key=int) == [str(index) for index in range(num_messages)]
+
+
+def test_next_batch_drains_prefetched_messages():
+    broker = LocalBroker(num_messages=250)
+    partition = _build_partition(broker, prefetch_count=100)
+
+    batch_sizes = [len(partition.next_batch()) for _ in range(3)]
+
+    assert batch_sizes == [100, 100, 50]
+    # one bulk ack per batch, covering all the messages in it
+    assert partition.channel.acks == [(100, True), (200, True), (250, True)]
+    assert partition.channel.unacked_tags == []
+
+
+def test_idle_queue_backs_off():
+    broker = LocalBroker(num_messages=0)
+    partition = _build_partition(broker)
+
+    delays = []
+    for _ in range(10):
+        assert partition.next_batch() == []
+        delays.append(partition.next_awake() - datetime.now(timezone.utc))
+
+    assert delays[0] <= timedelta(milliseconds=fp_settings.RABBITMQ_IDLE_BACKOFF_MIN_MS)
+    assert delays[1] > delays[0]
+    assert delays[-1] <= timedelta(milliseconds=fp_settings.RABBITMQ_IDLE_BACKOFF_MAX_MS)
+    assert delays[-1] > timedelta(milliseconds=fp_settings.RABBITMQ_IDLE_BACKOFF_MAX_MS // 2)
+
+    broker._messages.put(b'{"entry_id": "1", "type": "posts"}')
+    assert len(partition.next_batch()) == 1
+    assert partition.next_awake() is None
+
+
+def test_ack_on_snapshot_acks_previous_epoch_in_bulk():
+    broker = LocalBroker(num_messages=30)
+    partition = _build_partition(broker, prefetch_count=10, ack_on_snapshot=True)
+    channel = partition.channel
+
+    # epoch 1
+    assert len(partition.next_batch()) == 10
+    assert len(partition.next_batch()) == 10
+    assert partition.snapshot() is None
+    assert channel.acks == []
+
+    # epoch 2 : deliveries of epoch 1 are acked once epoch 2 is snapshotted
+    assert len(partition.next_batch()) == 10
+    partition.snapshot()
+    assert channel.acks == [(20, True)]
+    assert channel.unacked_tags == [21, 22, 23, 24, 25, 26, 27, 28, 29, 30]
+
+    # epoch 3 emits nothing, epoch 2 is still acked
+    partition.snapshot()
+    assert channel.acks == [(20, True), (30, True)]
+    partition.snapshot()
+    assert channel.acks == [(20, True), (30, True)]
+
+
+def test_ack_on_snapshot_sizes_prefetch_to_epochs():
+    epoch_msgs = fp_settings.BYTEWAX_SNAPSHOT_INTERVAL * fp_settings.RABBITMQ_MAX_MSGS_PER_SECOND
+    broker = LocalBroker(num_messages=0)
+
+    partition = _build_partition(broker, prefetch_count=10, ack_on_snapshot=True)
+
+    assert partition.channel.prefetch_count == epoch_prefetch_count(10) == max(10, 2 * epoch_msgs)
+    assert _build_partition(broker, prefetch_count=10).channel.prefetch_count == 10
+
+
+class FlakyConnection(LocalConnection):
+    """LocalConnection whose broker drops the connection, or refuses new ones, on demand"""
+
+    def __init__(self, broker: LocalBroker):
+        super().__init__(broker)
+        self.num_open = 0
+        self.broker_down = False
+        self.fail_next_fetch = False
+
+    def connect(self):
+        # as RabbitMQConnection.connect(), connection errors are logged, not raised
+        if not self.broker_down:
+            self.num_open += 1
+
+    def get_channel(self) -> LocalChannel | None:
+        return None if self.broker_down else super().get_channel()
+
+    def process_data_events(self, time_limit: float = 0):
+        if self.fail_next_fetch:
+            self.fail_next_fetch = False
+            raise ConnectionResetError("connection reset by broker")
+        super().process_data_events(time_limit)
+
+    def close(self):
+        self.num_open = max(self.num_open - 1, 0)
+
+
+def test_reconnect_closes_the_broken_connection():
+    broker = LocalBroker(num_messages=20)
+    connection = FlakyConnection(broker)
+    partition = RabbitMQSource(queue_name="test", num_partitions=1, prefetch_count=10,
+                               connection_factory=lambda: connection).build_part(now=None, for_part="test-0",
+                                                                                 resume_state=None)
+
+    connection.fail_next_fetch = True
+    assert partition.next_batch() == []
+    assert connection.num_open == 1
+    assert len(partition.next_batch()) == 10
+
+    # broker down : no channel, the partition retries on the next batch
+    connection.fail_next_fetch, connection.broker_down = True, True
+    assert partition.next_batch() == []
+    assert connection.num_open == 0
+    assert partition.next_awake() is not None
+
+    assert partition.next_batch() == []
+    assert partition.channel is None
+
+    connection.broker_down = False
+    assert partition.next_batch() == []
+    assert len(partition.next_batch()) == 10
+    assert connection.num_open == 1
@@ -0,0 +1,141 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from core.config import settings
+from db.qdrant_connection import QdrantDatabaseConnector, chunk_point_id, normalize_point_id
+from featurepipe.dataflow.stream_output import QdrantVectorDataSink
+from models.content_enum import ContentDataEnum
+from models.db_vector_models import PostVectorDBModel
+
+COLLECTION_NAME = "vector_posts"
+
+
+class CountingConnector(QdrantDatabaseConnector):
+    """In-memory Qdrant, counting the points uploaded"""
+
+    def __init__(self):
+        super().__init__()
+        self.num_uploaded = 0
+
+    def write_batch_data(self, collection_name, points_batch):
+        self.num_uploaded += len(points_batch)
+        super().write_batch_data(collection_name, points_batch)
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    monkeypatch.setattr(settings, "QDRANT_LOCATION", ":memory:")
+    connection = CountingConnector()
+    connection.create_vector_collection(COLLECTION_NAME)
+    yield connection
+    connection.close()
+
+
+def _chunk_id(content: str) -> str:
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def _vector_models(entry_id: str, contents: list[str], chunking_id: str | None = None) -> list[PostVectorDBModel]:
+    """Embedded chunks of an entry. With a chunking_id, the chunks are the complete chunking of the entry"""
+    return [PostVectorDBModel(entry_id=entry_id, platform="linkedin", chunk_id=_chunk_id(content),
+                              chunk_content=content, embedded_content=np.random.rand(settings.EMBEDDING_SIZE),
+                              author_id="author", type=ContentDataEnum.POSTS, embedding_model=settings.EMBEDDING_MODEL_ID,
+                              chunking_id=chunking_id, num_entry_chunks=len(contents) if chunking_id else None)
+            for content in contents]
+
+
+def _stored_ids(connection: QdrantDatabaseConnector) -> set:
+    records, _ = connection.scroll(COLLECTION_NAME, limit=100)
+    return {normalize_point_id(record.id) for record in records}
+
+
+def _point_ids(entry_id: str, contents: str) -> set:
+    return {normalize_point_id(chunk_point_id(entry_id, _chunk_id(content))) for content in contents}
+
+
+def test_idempotent_writes_upload_only_new_points(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b", "c"]))])
+    assert connection.num_uploaded == 3
+
+    # re-crawl of the same entry, with one changed chunk
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b", "d"]))])
+    assert connection.num_uploaded == 4
+    assert _stored_ids(connection) == _point_ids("post-1", "abcd")
+
+
+def test_idempotent_writes_upload_points_whose_payload_changed(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"]))])
+
+    # same chunks, the author was corrected
+    corrected_models = _vector_models("post-1", ["a", "b"])
+    corrected_models[1].author_id = "corrected-author"
+    sink.write_batch([("posts", corrected_models)])
+
+    assert connection.num_uploaded == 3
+    records, _ = connection.scroll(COLLECTION_NAME, limit=100)
+    assert sorted(record.payload["author_id"] for record in records) == ["author", "corrected-author"]
+
+
+def test_idempotent_writes_upload_points_of_another_embedding_model(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"]))])
+
+    # same chunks, embedded with another backend
+    onnx_models = _vector_models("post-1", ["a", "b"])
+    for model in onnx_models:
+        model.embedding_model = f"{settings.EMBEDDING_MODEL_ID}@onnx"
+    sink.write_batch([("posts", onnx_models)])
+
+    assert connection.num_uploaded == 4
+    records, _ = connection.scroll(COLLECTION_NAME, limit=100)
+    assert {record.payload["embedding_model"] for record in records} == {f"{settings.EMBEDDING_MODEL_ID}@onnx"}
+
+
+def test_non_idempotent_writes_upload_every_point(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=False)
+
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"]))])
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"]))])
+
+    assert connection.num_uploaded == 4
+
+
+def test_stale_chunks_are_deleted_once_the_entry_is_written(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b", "c"], "v1") + _vector_models("post-2", ["x"], "v1"))])
+
+    # post-1 re-chunked without "c", its chunks split across 2 embedding batches. post-2 not re-crawled
+    new_models = _vector_models("post-1", ["a", "b", "d"], "v2")
+    sink.write_batch([("posts", new_models[:2])])
+    assert _stored_ids(connection) == _point_ids("post-1", "abc") | _point_ids("post-2", "x")
+
+    sink.write_batch([("posts", new_models[2:])])
+    assert _stored_ids(connection) == _point_ids("post-1", "abd") | _point_ids("post-2", "x")
+
+
+def test_pruning_keeps_only_the_latest_chunking(connection):
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+
+    # 2 re-crawls of post-1 in the same call, then a third one still being written as the second completes
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"], "v1") + _vector_models("post-1", ["b", "c"], "v2")
+                      + _vector_models("post-1", ["d", "e"], "v3")[:1])])
+    assert _stored_ids(connection) == _point_ids("post-1", "bcd")
+
+    sink.write_batch([("posts", _vector_models("post-1", ["d", "e"], "v3")[1:])])
+    assert _stored_ids(connection) == _point_ids("post-1", "de")
+
+
+def test_pruning_keeps_chunks_shared_with_other_entries(connection):
+    # post-2 holds the same chunk "a" as post-1
+    sink = QdrantVectorDataSink(connection=connection, idempotent=True)
+    sink.write_batch([("posts", _vector_models("post-1", ["a", "b"], "v1") + _vector_models("post-2", ["a"], "v1"))])
+    assert connection.num_uploaded == 3
+
+    sink.write_batch([("posts", _vector_models("post-1", ["b"], "v2"))])
+
+    assert _stored_ids(connection) == _point_ids("post-1", "b") | _point_ids("post-2", "a")
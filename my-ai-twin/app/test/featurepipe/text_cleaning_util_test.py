@@ -0,0 +1,52 @@
+import random
+import warnings
+
+import pytest
+
+from featurepipe.utils.text_cleaning_util import normalize_text, normalize_text_multipass
+
+# chars hitting every pass of the normalizer: styled letters / digits, emojis, arrows, unicode quotes, mojibake,
+# non-ASCII whitespace and urls
+CHAR_POOL = (
+    list("abcXYZ019 .,'?s\n\t")
+    + ["\U0001D5D4", "\U0001D607", "\U0001D5F0", "\U0001D7CE", "\U0001D7EC", "\U0001D7F5", "\U0001D7FF",
+       "\U0001D608", "\U0001D63B", "\U0001D62A",
+       "\U0001F600", "\U0001F680", "\U0001F1E6", "→", "↓", "↳",
+       "\x91", "\x92", "\x93", "\x94", "\x80", "\x99", "â", "é", "œ", "“", "”", "Ž",
+       "\xa0", " ", "\x85"]
+)
+TOKENS = ["&apos;", "â\x80\x99", "â\x80?", "â\x80s'", "â\x80Ž", "https://example.com/a?b=1", "www.example.org"]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    parts = []
+    while len(parts) < length:
+        parts.append(rng.choice(TOKENS) if rng.random() < 0.1 else rng.choice(CHAR_POOL))
+    return "".join(parts)
+
+
+def _multipass(text: str | None) -> str:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return normalize_text_multipass(text)
+
+
+@pytest.mark.parametrize("text", [
+    None,
+    "",
+    "  plain ascii, with a url https://example.com/x and &apos;quotes&apos;  ",
+    "\U0001D5DB\U0001D5F2\U0001D5F9\U0001D5F9\U0001D5FC \U0001D609\U0001D62A\U0001D630 \U0001D7EC\U0001D7ED\U0001D7CE",
+    "Great news \U0001F600\U0001F680\U0001F1FA\U0001F1F8 → read more ↓ www.example.org/post",
+    "it\x92s a \x93quote\x94 and itâ\x80\x99s mojibake, â\x80?what â\x80Ž",
+    "\xa0 café  ",
+    "â" + "â\x80Ž" + "\x80? joined mojibake",
+])
+def test_normalize_text_matches_multipass(text):
+    assert normalize_text(text) == _multipass(text)
+
+
+def test_normalize_text_matches_multipass_on_random_text():
+    rng = random.Random(42)
+    for _ in range(2000):
+        text = _random_text(rng, rng.randint(0, 80))
+        assert normalize_text(text) == _multipass(text), repr(text)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark of chunking throughput (MB/sec) on repository dumps of several MB: RecursiveCharacterTextSplitter +
+SentenceTransformersTokenTextSplitter vs. token windows cut at the offsets of a single tokenization
+(featurepipe.utils.text_chunking_util.chunk_text_by_token_offsets).
+
+Usage : poetry run python app/test_scripts/benchmark_chunking.py [dump_size_mb]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.config import settings
+from featurepipe.featurepipe_config import fp_settings
+from featurepipe.utils import text_chunking_util
+
+CODE_LINES = ["def encode(texts: list[str]) -> np.ndarray:", "    return model.encode(texts, batch_size=32)",
+              "for index, item in enumerate(items):", "    logger.info(f\"item {index}\")", "import numpy as np",
+              "class EmbeddingDataHandler(ABC):", "    \"\"\"Handles the embedding of chunks\"\"\"", ""]
+
+
+def make_repository_dump(size_mb: float, seed: int = 42) -> str:
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < size_mb * 1e6:
+        line = rng.choice(CODE_LINES)
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def run(dump: str, fast_path: bool) -> tuple[float, int]:
+    fp_settings.CHUNKING_FAST_PATH = fast_path
+    start_time = time.perf_counter()
+    chunks = text_chunking_util.chunk_text(dump)
+    time_elapsed = time.perf_counter() - start_time
+
+    return len(dump) / time_elapsed / 1e6, len(chunks)
+
+
+if __name__ == "__main__":
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    dump = make_repository_dump(size_mb)
+    # load the tokenizers / models before timing
+    run("warm up", fast_path=False)
+    run("warm up", fast_path=True)
+
+    print(f"Model: {settings.EMBEDDING_MODEL_ID}, max tokens: {settings.EMBEDDING_MODEL_MAX_INPUT_LENGTH}, "
+          f"dump size: {len(dump) / 1e6:.1f} MB")
+    splitters_throughput, splitters_chunks = run(dump, fast_path=False)
+    offsets_throughput, offsets_chunks = run(dump, fast_path=True)
+    print(f"langchain splitters: {splitters_throughput:6.2f} MB/sec, {splitters_chunks} chunks")
+    print(f"     token offsets : {offsets_throughput:6.2f} MB/sec, {offsets_chunks} chunks")
+    print(f"speedup {offsets_throughput / splitters_throughput:.2f}x")
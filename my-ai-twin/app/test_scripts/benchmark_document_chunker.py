@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark of the dataset generation DocumentChunker: iter_substrings (precompiled sentence pattern, chunks
+kept as sentence offsets) vs. the legacy _extract_substrings_ (re.split + string concatenation), over corpora of
+10 to 100 MB. Each corpus is a single document, as a repository dump would be, and chunked with the defaults of
+DocumentChunker.chunk_documents. Checks both produce the same chunks. Time per MB should stay flat as the corpus grows.
+
+Usage : poetry run python app/test_scripts/benchmark_document_chunker.py [corpus sizes in MB, eg: 10 25 50 100]
+"""
+import random
+import sys
+import time
+import warnings
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from featurepipe.datasetgen.document_chunker import DocumentChunker
+
+WORDS = ("the model pipeline vector embedding data stream python function class return value query "
+         "retrieval chunk token article post repository feature training inference latency batch e.g. Mr.").split()
+
+
+def make_corpus(size_mb: int, seed: int = 42) -> str:
+    rng = random.Random(seed)
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))) + rng.choice(".?!")
+                 for _ in range(2000)]
+    separators = [" ", " ", " ", "\n", "\n\n"]
+    parts = []
+    size = 0
+    while size < size_mb * 1_000_000:
+        part = rng.choice(sentences) + rng.choice(separators)
+        parts.append(part)
+        size += len(part)
+
+    return "".join(parts)
+
+
+def run(chunker, corpus: str) -> tuple[float, list[str]]:
+    start_time = time.perf_counter()
+    chunks = list(chunker(corpus, min_len=1000, max_len=2000))
+    time_elapsed = time.perf_counter() - start_time
+
+    return time_elapsed, chunks
+
+
+if __name__ == "__main__":
+    sizes_mb = [int(size) for size in sys.argv[1:]] or [10, 25, 50, 100]
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    for size_mb in sizes_mb:
+        corpus = make_corpus(size_mb)
+        legacy_secs, legacy_chunks = run(DocumentChunker._extract_substrings_, corpus)
+        secs, chunks = run(DocumentChunker.iter_substrings, corpus)
+
+        assert chunks == legacy_chunks
+        print(f"{size_mb:>4} MB, {len(chunks):>7} chunks: "
+              f"legacy {legacy_secs:6.2f} secs ({legacy_secs / size_mb * 1000:5.1f} ms/MB) | "
+              f"iter_substrings {secs:6.2f} secs ({secs / size_mb * 1000:5.1f} ms/MB) | "
+              f"speedup {legacy_secs / secs:.2f}x")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark of the embedding model backends (featurepipe.datalogic.embedding_model_manager.load_sentence_transformer):
+torch vs. ONNX Runtime fp32 vs. ONNX Runtime dynamic int8.
+For each backend, reports the parity with torch (cosine similarity of the embeddings of the same chunks), the latency of
+single chunk encodes and the throughput of batched encodes.
+
+Usage : poetry run python app/test_scripts/benchmark_embedding_backends.py [model_id] [num_chunks]
+        eg: BAAI/bge-small-en-v1.5 (default, text model) or BAAI/bge-large-en-v1.5 (code model)
+"""
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+
+from core.config import settings
+from featurepipe.datalogic.embedding_model_manager import (
+    ONNX_BACKEND, ONNX_INT8_BACKEND, TORCH_BACKEND, load_sentence_transformer
+)
+
+WORDS = ("the model pipeline vector embedding data stream python function class return value query "
+         "retrieval chunk token article post repository feature training inference latency batch").split()
+
+# min cosine similarity with torch, per backend
+MIN_PARITY = {ONNX_BACKEND: 0.999, ONNX_INT8_BACKEND: 0.98}
+
+
+def make_chunks(num_chunks: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 300))) for _ in range(num_chunks)]
+
+
+def cosine_similarities(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    return (reference * candidate).sum(axis=1) / (np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+
+def run(model, chunks: list[str]) -> tuple[np.ndarray, float, float]:
+    """Returns the embeddings, p50 latency (ms) of single chunk encodes, and the throughput (chunks/sec) of batches"""
+    latencies = []
+    for chunk in chunks[:50]:
+        start_time = time.perf_counter()
+        model.encode([chunk], show_progress_bar=False)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    start_time = time.perf_counter()
+    embeddings = model.encode(chunks, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+    throughput = len(chunks) / (time.perf_counter() - start_time)
+
+    return embeddings, statistics.median(latencies), throughput
+
+
+if __name__ == "__main__":
+    model_id = sys.argv[1] if len(sys.argv) > 1 else settings.EMBEDDING_MODEL_ID
+    num_chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    chunks = make_chunks(num_chunks)
+
+    print(f"Model: {model_id}, # of chunks: {num_chunks}, int8 config: {settings.EMBEDDING_ONNX_QUANTIZATION_CONFIG}")
+    reference: np.ndarray | None = None
+    for backend in (TORCH_BACKEND, ONNX_BACKEND, ONNX_INT8_BACKEND):
+        model = load_sentence_transformer(model_id, backend=backend, device="cpu")
+        # warm up
+        model.encode(["warm up"] * 8, show_progress_bar=False)
+        embeddings, p50_latency, throughput = run(model, chunks)
+
+        if reference is None:
+            reference = embeddings
+            parity = "reference"
+        else:
+            similarities = cosine_similarities(reference, embeddings)
+            parity = f"cosine min {similarities.min():.5f} mean {similarities.mean():.5f}"
+            assert similarities.min() >= MIN_PARITY[backend], f"{backend} embeddings diverge from torch: {parity}"
+
+        print(f"{backend:>10}: p50 latency {p50_latency:7.2f} ms | {throughput:8.1f} chunks/sec | {parity}")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark of embedding throughput (chunks/sec), fixed batch_size=32 vs. token budget batching
+(featurepipe.utils.embeddings_util.encode_with_token_budget), over chunk length distributions resembling
+LinkedIn posts, articles and repository dumps.
+
+Usage : poetry run python app/test_scripts/benchmark_embedding_batching.py [num_chunks]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+
+from core.config import settings
+from featurepipe.datalogic.embedding_model_manager import EmbeddingModelManager
+from featurepipe.utils.embeddings_util import encode_with_token_budget
+
+WORDS = ("the model pipeline vector embedding data stream python function class return value query "
+         "retrieval chunk token article post repository feature training inference latency batch").split()
+
+
+def make_chunks(num_chunks: int, distribution: str, seed: int = 42) -> list[str]:
+    """Word counts per chunk. ~0.75 words per token, chunks are capped at the chunker's max tokens"""
+    rng = random.Random(seed)
+    max_words = int(settings.EMBEDDING_MODEL_MAX_INPUT_LENGTH * 0.75)
+    chunks = []
+    for _ in range(num_chunks):
+        if distribution == "posts":
+            # mostly short posts, long tail
+            num_words = int(rng.lognormvariate(4.0, 0.8))
+        elif distribution == "articles":
+            # most chunks are cut at the max length, plus the short remainder of each article
+            num_words = max_words if rng.random() < 0.7 else rng.randint(20, max_words)
+        else:
+            # mix of everything
+            num_words = rng.choice([int(rng.lognormvariate(3.5, 1.0)), max_words])
+        num_words = min(max(num_words, 3), max_words)
+        chunks.append(" ".join(rng.choice(WORDS) for _ in range(num_words)))
+
+    return chunks
+
+
+def run(model, chunks: list[str], use_token_budget: bool) -> tuple[float, np.ndarray]:
+    start_time = time.perf_counter()
+    if use_token_budget:
+        embeddings = encode_with_token_budget(model, chunks, max_length=model.max_seq_length,
+                                              token_budget=settings.EMBEDDING_BATCH_TOKEN_BUDGET)
+    else:
+        embeddings = model.encode(sentences=chunks, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+    time_elapsed = time.perf_counter() - start_time
+
+    return len(chunks) / time_elapsed, embeddings
+
+
+if __name__ == "__main__":
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    model = EmbeddingModelManager.get_text_model()
+    # warm up
+    model.encode(["warm up"] * 8)
+
+    print(f"Model: {settings.EMBEDDING_MODEL_ID}, token budget: {settings.EMBEDDING_BATCH_TOKEN_BUDGET}, "
+          f"# of chunks: {num_chunks}")
+    for distribution in ("posts", "articles", "mixed"):
+        chunks = make_chunks(num_chunks, distribution)
+        fixed_throughput, fixed_embeddings = run(model, chunks, use_token_budget=False)
+        budget_throughput, budget_embeddings = run(model, chunks, use_token_budget=True)
+
+        # same embeddings, in the same order
+        assert np.allclose(fixed_embeddings, budget_embeddings, atol=1e-4)
+        print(f"{distribution:>10}: fixed batch_size=32 {fixed_throughput:8.1f} chunks/sec | "
+              f"token budget {budget_throughput:8.1f} chunks/sec | speedup {budget_throughput / fixed_throughput:.2f}x")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Recall / latency / memory benchmark of vector quantization (settings.QDRANT_VECTOR_STORAGE_CONFIG), for a collection
+the size of vector_repositories (1024-dim bge-large-en-v1.5 embeddings): float32 vs. scalar (int8) and binary
+quantization, with rescoring at several oversampling factors. Recall is against the exact float32 search.
+
+Against an in-process Qdrant (default), which searches exhaustively and ignores quantization, the quantized searches
+are replayed with numpy the way Qdrant runs them : limit x oversampling candidates are found with the quantized
+vectors, then rescored with the original ones. Only the float32 search is timed, numpy has no int8 / binary kernels.
+Against a Qdrant server, given its url, one collection is created per quantization and all the searches are timed.
+
+RAM is the one of the vectors (original + quantized), without the HNSW graph. With on_disk, only the quantized
+vectors are in RAM, the original ones are read from disk for rescoring.
+
+Usage : poetry run python app/test_scripts/benchmark_quantization.py [num_points] [num_queries] [location, eg: :memory: or http://localhost:6333]
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from core.config import settings
+
+settings.QDRANT_LOCATION = sys.argv[3] if len(sys.argv) > 3 else ":memory:"
+IN_PROCESS = not settings.QDRANT_LOCATION.startswith("http")
+if not IN_PROCESS:
+    settings.QDRANT_LOCATION, settings.QDRANT_CLOUD_URL, settings.USE_QDRANT_CLOUD = None, sys.argv[3], True
+
+from db.qdrant_connection import BINARY_QUANTIZATION, SCALAR_QUANTIZATION, QdrantDatabaseConnector
+
+COLLECTION_NAME = "vector_repositories"
+# embeddings vary along far fewer directions than their dims
+LATENT_DIM = 64
+LIMIT = 5
+OVERSAMPLINGS = (1.0, 2.0, 4.0, 8.0)
+
+
+def embeddings(num_vectors: int, projection: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((num_vectors, LATENT_DIM)) @ projection
+    vectors += 0.1 * rng.standard_normal(vectors.shape)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def populate(connection: QdrantDatabaseConnector, collection_name: str, vectors: np.ndarray):
+    # left over by a previous run, against a server
+    connection._instance.delete_collection(collection_name)
+    connection.create_vector_collection(collection_name)
+    for start in range(0, len(vectors), 1000):
+        connection.write_batch_data(collection_name, [
+            PointStruct(id=index, vector=vectors[index].tolist(), payload={"content": f"chunk {index}"})
+            for index in range(start, min(start + 1000, len(vectors)))
+        ])
+    # the server indexes (HNSW, quantization) in the background
+    while not IN_PROCESS and connection.get_collection(collection_name).status != "green":
+        time.sleep(1)
+
+
+def scalar_quantize(vectors: np.ndarray, quantile: float = 0.99) -> np.ndarray:
+    """int8 codes of the vectors, over the range holding the quantile of the values, as Qdrant scalar quantization"""
+    low, high = np.quantile(vectors, [(1 - quantile) / 2, (1 + quantile) / 2])
+    return np.round((np.clip(vectors, low, high) - low) / (high - low) * 255).astype(np.uint8)
+
+
+def search_quantized(scores: np.ndarray, vectors: np.ndarray, query: np.ndarray, oversampling: float) -> list[int]:
+    """Ids of the top LIMIT points : LIMIT x oversampling candidates by quantized scores, rescored on the vectors"""
+    num_candidates = int(LIMIT * oversampling)
+    candidates = np.argpartition(-scores, num_candidates)[:num_candidates]
+    return candidates[np.argsort(-(vectors[candidates] @ query))[:LIMIT]].tolist()
+
+
+def quantized_scores(quantization: str, vectors: np.ndarray):
+    if quantization == SCALAR_QUANTIZATION:
+        codes = scalar_quantize(vectors)
+        # dot product on the codes : the dequantization (scale, offset) is the same for all points, so is the ranking
+        return codes.nbytes, lambda query: codes @ query
+
+    bits = np.packbits(vectors > 0, axis=1)
+    # -hamming distance to the query bits
+    return bits.nbytes, lambda query: -np.unpackbits(bits ^ np.packbits(query > 0), axis=1).sum(axis=1, dtype=np.int32)
+
+
+def timed_search(connection: QdrantDatabaseConnector, collection_name: str, queries: np.ndarray,
+                 oversampling: float | None = None) -> tuple[list[set], list[float]]:
+    ids, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        hits = connection.search(collection_name, query.tolist(), limit=LIMIT, oversampling=oversampling)
+        latencies.append(time.perf_counter() - start_time)
+        ids.append({hit.id for hit in hits})
+    return ids, latencies
+
+
+def report(name: str, ram_bytes: int, on_disk_ram_bytes: int, recalls: list[float], latencies: list[float] | None):
+    latency = "latency n/a (in-process)"
+    if latencies:
+        p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+        latency = f"p50 {p50:7.2f} ms | p99 {p99:7.2f} ms"
+    print(f"  {name:<28} RAM {ram_bytes / 2**20:7.2f} MB (on_disk {on_disk_ram_bytes / 2**20:6.2f} MB) | "
+          f"recall@{LIMIT} {np.mean(recalls):.3f} | {latency}")
+
+
+if __name__ == "__main__":
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rng = np.random.default_rng(42)
+
+    connection = QdrantDatabaseConnector()
+    dim = settings.EMBEDDING_MODEL_FOR_CODE_VECTOR_LENGTH
+    projection = rng.standard_normal((LATENT_DIM, dim))
+    vectors, queries = embeddings(num_points, projection, rng), embeddings(num_queries, projection, rng)
+
+    settings.QDRANT_VECTOR_STORAGE_CONFIG[COLLECTION_NAME] = {"quantization": None, "on_disk": False}
+    populate(connection, COLLECTION_NAME, vectors)
+    exact_ids, latencies = timed_search(connection, COLLECTION_NAME, queries)
+
+    print(f"Qdrant: {settings.QDRANT_LOCATION or settings.QDRANT_CLOUD_URL}, {num_points} points of {dim} dims, "
+          f"{num_queries} queries, top {LIMIT}")
+    report("float32", vectors.nbytes, 0, [1.0] * num_queries, latencies)
+
+    for quantization in (SCALAR_QUANTIZATION, BINARY_QUANTIZATION):
+        ram_bytes, scores = quantized_scores(quantization, vectors)
+        collection_name = f"{COLLECTION_NAME}_{quantization}"
+        if not IN_PROCESS:
+            settings.QDRANT_VECTOR_STORAGE_CONFIG[collection_name] = {"quantization": quantization, "on_disk": False}
+            populate(connection, collection_name, vectors)
+
+        for oversampling in OVERSAMPLINGS:
+            latencies = None
+            if IN_PROCESS:
+                ids = [set(search_quantized(scores(query), vectors, query, oversampling)) for query in queries]
+            else:
+                ids, latencies = timed_search(connection, collection_name, queries, oversampling)
+            recalls = [len(expected & found) / LIMIT for expected, found in zip(exact_ids, ids)]
+            report(f"{quantization}, oversampling {oversampling:g}", ram_bytes + vectors.nbytes, ram_bytes,
+                   recalls, latencies)
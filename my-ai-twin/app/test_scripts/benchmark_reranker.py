@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark (p50 / p99) of the reranking stage, for one user request of N retrieved passages: the local
+cross-encoder (settings.CROSS_ENCODER_MODEL_ID) vs. the LLM (ReRanker.generate_response_using_llm). The cross-encoder
+is timed on new passages (cold, every pair goes through the model) and on repeated passages (warm, scores come from
+its cache). The LLM is only timed when OPENAI_API_KEY is set.
+
+Usage : poetry run python app/test_scripts/benchmark_reranker.py [num_passages] [num_requests]
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+
+from core.config import settings
+from core.rag.cross_encoders import CrossEncoderModelSingleton
+from core.rag.reranker import ReRanker
+
+KEEP_TOP_K = 3
+WORDS = ("retrieval augmented generation vector store embedding chunk query expansion reranker latency "
+         "throughput qdrant collection payload filter author post article repository model prompt").split()
+
+
+def passages_for(request: int, num_passages: int, rng: np.random.Generator) -> list[str]:
+    return [f"request {request} passage {index} " + " ".join(rng.choice(WORDS, size=rng.integers(20, 200)))
+            for index in range(num_passages)]
+
+
+def percentiles(latencies: list[float]) -> str:
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return f"p50 {p50:9.2f} ms | p99 {p99:9.2f} ms"
+
+
+def time_requests(rerank, requests: list[tuple[str, list[str]]]) -> list[float]:
+    latencies = []
+    for query, passages in requests:
+        start_time = time.perf_counter()
+        rerank(query, passages)
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+if __name__ == "__main__":
+    num_passages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = np.random.default_rng(42)
+    requests = [(f"what does the author write about {rng.choice(WORDS)} ?", passages_for(request, num_passages, rng))
+                for request in range(num_requests)]
+
+    start_time = time.perf_counter()
+    cross_encoder = CrossEncoderModelSingleton.get_instance()
+    cross_encoder.predict([("warm up", "warm up")])
+    print(f"Cross-encoder {settings.CROSS_ENCODER_MODEL_ID} on {settings.CROSS_ENCODER_MODEL_DEVICE} "
+          f"loaded in {time.perf_counter() - start_time:.2f} secs")
+
+    def rerank_with_cross_encoder(query: str, passages: list[str]) -> list[str]:
+        return ReRanker.generate_response_using_crossencoder(query, passages, keep_top_k=KEEP_TOP_K)
+
+    print(f"{num_passages} passages per request, {num_requests} requests, keep top {KEEP_TOP_K}")
+    print(f"  cross-encoder, new passages      : {percentiles(time_requests(rerank_with_cross_encoder, requests))}")
+    print(f"  cross-encoder, repeated passages : {percentiles(time_requests(rerank_with_cross_encoder, requests))}")
+
+    if settings.OPENAI_API_KEY:
+        reranker = ReRanker()
+
+        def rerank_with_llm(query: str, passages: list[str]) -> list[str]:
+            return reranker.generate_response_using_llm(query, passages, keep_top_k=KEEP_TOP_K)
+
+        print(f"  LLM {settings.OPENAI_MODEL_ID:<28}: {percentiles(time_requests(rerank_with_llm, requests))}")
+    else:
+        print("  LLM : skipped, OPENAI_API_KEY is not set")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark (p50 / p99) of the VectorRetriever search stage, for one user request of N expanded queries:
+one search per query and collection (N x 3 requests, queries in parallel, as VectorRetriever used to) vs.
+search_collections (one query_batch_points request per collection, collections in parallel). Runs against an
+in-process Qdrant by default, with random vectors of the sizes of the posts / articles / repositories collections,
+or against a Qdrant server, given its url. Checks both return the same hits.
+
+The in-process Qdrant has no network hop, so each request pays a simulated round trip (ROUND_TRIP_SECS) on top of
+the search itself. Set it to 0 against a server.
+
+Usage : poetry run python app/test_scripts/benchmark_retriever_search.py [num_points] [num_queries] [location, eg: :memory: or http://localhost:6333]
+"""
+import concurrent.futures
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+from qdrant_client import models
+from qdrant_client.models import PointStruct
+
+from core.config import settings
+
+settings.QDRANT_LOCATION = sys.argv[3] if len(sys.argv) > 3 else ":memory:"
+
+from core.rag.vector_retriever import SEARCH_COLLECTIONS, search_collections
+from db.qdrant_connection import QdrantDatabaseConnector
+
+NUM_AUTHORS = 20
+NUM_REQUESTS = 50
+LIMIT = 2
+# HTTPS round trip to Qdrant Cloud, from the same region
+ROUND_TRIP_SECS = 0.02 if settings.QDRANT_LOCATION == ":memory:" else 0
+
+
+class RoundTripClient:
+    """Wraps the in-process QdrantClient, each search request pays a network round trip"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def query_points(self, *args, **kwargs):
+        time.sleep(ROUND_TRIP_SECS)
+        return self._client.query_points(*args, **kwargs)
+
+    def query_batch_points(self, *args, **kwargs):
+        time.sleep(ROUND_TRIP_SECS)
+        return self._client.query_batch_points(*args, **kwargs)
+
+
+def populate(connection: QdrantDatabaseConnector, num_points: int, rng: np.random.Generator) -> dict[str, int]:
+    vector_sizes = {}
+    for collection_name, tenant_key in SEARCH_COLLECTIONS.items():
+        connection.create_vector_collection(collection_name)
+        vector_sizes[collection_name] = connection.get_collection(collection_name).config.params.vectors.size
+        for start in range(0, num_points, 1000):
+            connection.write_batch_data(collection_name, [
+                PointStruct(id=index, vector=rng.random(vector_sizes[collection_name]).tolist(),
+                            payload={tenant_key: f"author-{index % NUM_AUTHORS}", "content": f"chunk {index}"})
+                for index in range(start, min(start + 1000, num_points))
+            ])
+
+    return vector_sizes
+
+
+def search_per_query(connection: QdrantDatabaseConnector, query_vectors: dict[str, list[list[float]]], author_id: str) -> list:
+    def search_single_query(query_index: int) -> list:
+        return [
+            hit
+            for collection_name, tenant_key in SEARCH_COLLECTIONS.items()
+            for hit in connection.search(collection_name=collection_name,
+                                         query_vector=query_vectors[collection_name][query_index],
+                                         query_filter=models.Filter(must=[models.FieldCondition(
+                                             key=tenant_key, match=models.MatchValue(value=author_id))]),
+                                         limit=LIMIT)
+        ]
+
+    num_queries = len(next(iter(query_vectors.values())))
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return [hit for hits in executor.map(search_single_query, range(num_queries)) for hit in hits]
+
+
+def percentiles(latencies: list[float]) -> str:
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return f"p50 {p50:7.2f} ms | p99 {p99:7.2f} ms"
+
+
+if __name__ == "__main__":
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = np.random.default_rng(42)
+    connection = QdrantDatabaseConnector()
+    vector_sizes = populate(connection, num_points, rng)
+    connection._instance = RoundTripClient(connection._instance)
+
+    per_query_latencies, batched_latencies = [], []
+    for request in range(NUM_REQUESTS):
+        query_vectors = {collection_name: rng.random((num_queries, size)).tolist()
+                         for collection_name, size in vector_sizes.items()}
+        author_id = f"author-{request % NUM_AUTHORS}"
+
+        start_time = time.perf_counter()
+        per_query_hits = search_per_query(connection, query_vectors, author_id)
+        per_query_latencies.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        batched_hits = search_collections(connection, query_vectors, author_id, limit=LIMIT)
+        batched_latencies.append(time.perf_counter() - start_time)
+
+        assert sorted(hit.id for hit in per_query_hits) == sorted(hit.id for hit in batched_hits)
+
+    print(f"Qdrant: {settings.QDRANT_LOCATION}, round trip {ROUND_TRIP_SECS * 1000:.0f} ms, {num_points} points per collection, "
+          f"{num_queries} queries per request, {NUM_REQUESTS} requests")
+    print(f"  one search per query and collection ({num_queries * len(SEARCH_COLLECTIONS):>2} requests): {percentiles(per_query_latencies)}")
+    print(f"  search_collections, batched          ({len(SEARCH_COLLECTIONS):>2} requests): {percentiles(batched_latencies)}")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the RabbitMQ source throughput (msgs/sec) with 1 to N partitions, each drained by its own thread as
+Bytewax workers do. The queue is the in-memory LocalBroker of the stream_input tests, which simulates a network round
+trip per delivery and a transfer cost per message : competing consumers overlap their round trips, hence near linear
+scaling is expected until the broker is drained faster than a round trip.
+
+Usage : poetry run python app/test_scripts/benchmark_stream_input.py [max_partitions] [num_messages]
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add app/src to Python path, and the tests for the broker stand-in
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "test" / "featurepipe"))
+
+from featurepipe.featurepipe_config import fp_settings
+from stream_input_test import _run_workers
+
+
+def run(num_partitions: int, num_messages: int) -> float:
+    start_time = time.perf_counter()
+    received = _run_workers(num_partitions, num_messages)
+    time_elapsed = time.perf_counter() - start_time
+
+    assert sum(len(entry_ids) for entry_ids in received) == num_messages
+    return num_messages / time_elapsed
+
+
+if __name__ == "__main__":
+    max_partitions = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    num_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+
+    print(f"# of messages: {num_messages}, prefetch count: {fp_settings.RABBITMQ_PREFETCH_COUNT}")
+    single_throughput = None
+    num_partitions = 1
+    while num_partitions <= max_partitions:
+        throughput = run(num_partitions, num_messages)
+        single_throughput = single_throughput or throughput
+        print(f"{num_partitions:3} partitions: {throughput:10.1f} msgs/sec | "
+              f"speedup {throughput / single_throughput:.2f}x (linear {num_partitions}x)")
+        num_partitions *= 2
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the cleaning stage text normalizer: normalize_text (translation table, precompiled patterns)
+vs. normalize_text_multipass, on synthetic documents resembling scraped articles (mostly ASCII prose, some
+styled chars, emojis and unicode quotes), LinkedIn posts (bold / italic chars, emojis) and repository dumps
+(pure ASCII code). Checks both produce the same output.
+
+Usage : poetry run python app/test_scripts/benchmark_text_normalizer.py [num_docs]
+"""
+import random
+import sys
+import time
+import warnings
+from pathlib import Path
+
+# Add app/src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from featurepipe.utils.text_cleaning_util import normalize_text, normalize_text_multipass
+
+WORDS = ("the model pipeline vector embedding data stream python function class return value query "
+         "retrieval chunk token article post repository feature training inference latency batch").split()
+CODE_LINES = ["def encode(texts: list[str]) -> np.ndarray:", "    return model.encode(texts, batch_size=32)",
+              "for index, item in enumerate(items):", "    logger.info(f\"item {index}\")", "import numpy as np", ""]
+BOLD = "".join(chr(0x1D5D4 + offset) for offset in range(52))
+ITALIC = "".join(chr(0x1D608 + offset) for offset in range(52))
+EMOJIS = "\U0001F600\U0001F680\U0001F4A1\U0001F525→↓"
+
+
+def make_article(rng: random.Random, num_words: int) -> str:
+    words = []
+    for _ in range(num_words):
+        roll = rng.random()
+        if roll < 0.002:
+            words.append(rng.choice(EMOJIS))
+        elif roll < 0.005:
+            words.append("“quoted”")
+        elif roll < 0.006:
+            words.append("https://example.com/" + rng.choice(WORDS))
+        else:
+            words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def make_post(rng: random.Random, num_words: int) -> str:
+    words = []
+    for _ in range(num_words):
+        roll = rng.random()
+        if roll < 0.1:
+            words.append("".join(rng.choice(BOLD) for _ in range(6)))
+        elif roll < 0.15:
+            words.append("".join(rng.choice(ITALIC) for _ in range(6)))
+        elif roll < 0.2:
+            words.append(rng.choice(EMOJIS))
+        else:
+            words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def make_repository(rng: random.Random, num_lines: int) -> str:
+    return "\n".join(rng.choice(CODE_LINES) for _ in range(num_lines))
+
+
+def run(normalizer, docs: list[str]) -> tuple[float, list[str]]:
+    start_time = time.perf_counter()
+    outputs = [normalizer(doc) for doc in docs]
+    time_elapsed = time.perf_counter() - start_time
+
+    return sum(len(doc) for doc in docs) / time_elapsed / 1e6, outputs
+
+
+if __name__ == "__main__":
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = random.Random(42)
+    corpora = {
+        "articles": [make_article(rng, 5_000) for _ in range(num_docs)],
+        "posts": [make_post(rng, 300) for _ in range(num_docs * 10)],
+        "repositories": [make_repository(rng, 20_000) for _ in range(num_docs)],
+    }
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    for name, docs in corpora.items():
+        multipass_throughput, multipass_outputs = run(normalize_text_multipass, docs)
+        single_pass_throughput, single_pass_outputs = run(normalize_text, docs)
+
+        assert single_pass_outputs == multipass_outputs
+        print(f"{name:>12}: multipass {multipass_throughput:7.2f} MB/sec | "
+              f"single pass {single_pass_throughput:7.2f} MB/sec | speedup {single_pass_throughput / multipass_throughput:.2f}x")